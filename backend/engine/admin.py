@@ -7,6 +7,8 @@ from .models import \
     Boundary, BoundaryAdmin, \
     UserID, UserIDAdmin, \
     Vote, VoteAdmin, \
+    VoteSummary, VoteSummaryAdmin, \
+    OutgoingEmail, OutgoingEmailAdmin, \
     Organisation, OrganisationAdmin, \
     WindSpeed, WindSpeedAdmin, \
     Substation, SubstationAdmin, \
@@ -18,6 +20,8 @@ admin.site.register(Place, PlaceAdmin)
 admin.site.register(Boundary, BoundaryAdmin)
 admin.site.register(UserID, UserIDAdmin)
 admin.site.register(Vote, VoteAdmin)
+admin.site.register(VoteSummary, VoteSummaryAdmin)
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
 admin.site.register(Organisation, OrganisationAdmin)
 admin.site.register(WindSpeed, WindSpeedAdmin)
 admin.site.register(Substation, SubstationAdmin)
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import threading
+import socketserver
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from django.core.mail import EmailMessage, get_connection
+
+# ***********************************************************
+# ******** Benchmark email sending against stub SMTP ********
+# ***********************************************************
+#
+# Usage: python engine/benchmarkemail.py [number_of_emails] [latency_ms] [--outbox]
+#
+# Starts stub SMTP server on localhost that accepts and discards all
+# mail, waiting latency_ms before each reply to stand in for round
+# trips to real server, then sends emails through it with new SMTP
+# connection per email, as votes originally did, and over single
+# reused connection, as engine/sendemails.py does, reporting throughput
+# With --outbox emails are also queued in OutgoingEmail table and
+# drained through engine/emailoutbox.py with no rate limit, measuring
+# whole queue path - queued benchmark emails are deleted afterwards
+
+BENCHMARK_EMAILS                    = 200
+BENCHMARK_LATENCY                   = 5
+BENCHMARK_TO_EMAIL                  = 'benchmark@example.invalid'
+BENCHMARK_FROM_EMAIL                = '"VoteWind.org" <info@votewind.org>'
+BENCHMARK_SUBJECT                   = 'VoteWind.org: Email benchmark'
+BENCHMARK_BODY                      = 'Benchmark email\n' * 40
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Handles single SMTP connection, accepting every command and discarding messages
+    """
+
+    def reply(self, line):
+        if self.server.latency > 0: time.sleep(self.server.latency)
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self.server.count('connections')
+        self.reply('220 stub ESMTP')
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line.rstrip(b'\r\n') != b'.': continue
+                in_data = False
+                self.server.count('messages')
+                self.reply('250 OK')
+                continue
+
+            command = line[:4].upper()
+            if command in (b'EHLO', b'HELO'): self.reply('250 stub')
+            elif command == b'DATA':
+                in_data = True
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else: self.reply('250 OK')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Stub SMTP server counting connections and messages received
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.counters = {'connections': 0, 'messages': 0}
+
+    def count(self, counter):
+        with self.lock: self.counters[counter] += 1
+
+    def reset(self):
+        with self.lock: self.counters = {'connections': 0, 'messages': 0}
+
+
+def getstubconnection(server):
+    """
+    Gets unopened SMTP connection to stub server
+    """
+
+    host, port = server.server_address
+    return get_connection(backend='django.core.mail.backends.smtp.EmailBackend', host=host, port=port, \
+                          username='', password='', use_tls=False, use_ssl=False, timeout=10)
+
+def getmessage():
+    """
+    Gets benchmark email
+    """
+
+    return EmailMessage(BENCHMARK_SUBJECT, BENCHMARK_BODY, from_email=BENCHMARK_FROM_EMAIL, to=[BENCHMARK_TO_EMAIL])
+
+def sendpernew(server, number_of_emails):
+    """
+    Sends emails with new connection for each email
+    """
+
+    for _ in range(number_of_emails):
+        message = getmessage()
+        message.connection = getstubconnection(server)
+        message.send()
+
+def sendreused(server, number_of_emails):
+    """
+    Sends emails over single reused connection
+    """
+
+    from engine.emailoutbox import sendemail
+
+    connection = getstubconnection(server)
+    try:
+        for _ in range(number_of_emails): sendemail(connection, getmessage())
+    finally:
+        connection.close()
+
+def sendoutbox(server, number_of_emails):
+    """
+    Queues emails in outbox then drains outbox over single reused connection
+    """
+
+    from engine.emailoutbox import queueemail, sendqueuedemails, EmailRateLimiter
+    from engine.models import OutgoingEmail
+
+    for _ in range(number_of_emails): queueemail(BENCHMARK_SUBJECT, BENCHMARK_BODY, BENCHMARK_TO_EMAIL, BENCHMARK_FROM_EMAIL)
+
+    connection, ratelimiter = getstubconnection(server), EmailRateLimiter(0)
+    try:
+        while sum(sendqueuedemails(connection, ratelimiter)) != 0: pass
+    finally:
+        connection.close()
+        OutgoingEmail.objects.filter(to_email=BENCHMARK_TO_EMAIL).delete()
+
+def main():
+    """
+    Runs benchmark
+    """
+
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+    number_of_emails = int(arguments[0]) if len(arguments) > 0 else BENCHMARK_EMAILS
+    latency = float(arguments[1]) if len(arguments) > 1 else BENCHMARK_LATENCY
+
+    server = StubSMTPServer(latency / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    senders = {
+        'per-email': sendpernew,
+        'reused':    sendreused,
+    }
+    if '--outbox' in sys.argv[1:]: senders['outbox'] = sendoutbox
+
+    print(str(number_of_emails) + " emails to stub SMTP server with " + str(latency) + "ms reply latency")
+    for name, sender in senders.items():
+        server.reset()
+        time_start = time.perf_counter()
+        sender(server, number_of_emails)
+        elapsed = time.perf_counter() - time_start
+        print(f"{name:<10} {elapsed:8.2f}s  {number_of_emails / elapsed:8.1f} emails/s  connections {server.counters['connections']:>5d}  messages {server.counters['messages']:>5d}")
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
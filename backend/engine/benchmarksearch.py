@@ -0,0 +1,112 @@
+import os
+import sys
+import random
+import time
+import statistics
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from engine.models import Place, Boundary, Organisation
+from engine.views import searchlocationsdatabase, searchlocationsfuzzy, NUMBER_RESULTS_RETURNED
+
+# ***********************************************************
+# ******** Benchmark prefix and fuzzy location search *******
+# ***********************************************************
+#
+# Usage: python engine/benchmarksearch.py [number_of_names]
+#
+# Samples real place, boundary and organisation names from database
+# and runs prefix, exact and misspelt queries for each through both
+# current istartswith/icontains search and pg_trgm fuzzy search
+# Reports p50/p99 latency along with how often intended name is found
+
+BENCHMARK_NAMES                     = 200
+BENCHMARK_PREFIX_LENGTH             = 4
+BENCHMARK_SEED                      = 1
+
+
+def percentile(timings, fraction):
+    """
+    Gets value at fraction (0-1) of sorted timings
+    """
+
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(fraction * len(timings)))]
+
+def misspell(name, random_generator):
+    """
+    Gets name with one letter after first replaced, as in typing error
+    """
+
+    positions = [index for index, character in enumerate(name) if character.isalpha()]
+    if len(positions) == 0: return name
+    index = random_generator.choice(positions[1:] if len(positions) > 1 else positions)
+    replacement = 'e' if name[index].lower() != 'e' else 'a'
+    return name[:index] + replacement + name[index + 1:]
+
+def getbenchmarkqueries(number_of_names):
+    """
+    Gets (kind, query, expected suggestion) for sample of names in database
+    """
+
+    random_generator = random.Random(BENCHMARK_SEED)
+    candidates = []
+    for name, county in Place.objects.exclude(name='').values_list('name', 'county'):
+        candidates.append((name, name + ", " + county))
+    for name in Boundary.objects.exclude(name__iendswith='ED').exclude(name__isnull=True).values_list('name', flat=True):
+        candidates.append((name, name + ' (Area)'))
+    for name in Organisation.objects.filter(type__in=['community-energy-group', 'community-energy-related']).values_list('name', flat=True):
+        candidates.append((name, name + ' (Organisation)'))
+
+    queries = []
+    for name, expected in random_generator.sample(candidates, min(number_of_names, len(candidates))):
+        queries.append(('exact', name, expected))
+        queries.append(('prefix', name[:BENCHMARK_PREFIX_LENGTH], expected))
+        queries.append(('misspelt', misspell(name, random_generator), expected))
+    return queries
+
+def benchmarksearch(search, queries):
+    """
+    Times search function over queries, returning timings and number of queries per kind whose expected suggestion was returned
+    """
+
+    timings, found = [], {}
+    for kind, query, expected in queries:
+        time_start = time.perf_counter()
+        results = search(query)
+        timings.append(time.perf_counter() - time_start)
+        found[kind] = found.get(kind, 0) + (1 if expected in results else 0)
+    return timings, found
+
+def main():
+    """
+    Runs benchmark
+    """
+
+    number_of_names = int(sys.argv[1]) if len(sys.argv) > 1 else BENCHMARK_NAMES
+    queries = getbenchmarkqueries(number_of_names)
+    kinds = sorted(set(kind for kind, _, _ in queries))
+    totals = {kind: sum(1 for query in queries if query[0] == kind) for kind in kinds}
+
+    searches = {
+        'prefix': lambda query: sorted(searchlocationsdatabase(query))[:NUMBER_RESULTS_RETURNED],
+        'fuzzy':  lambda query: searchlocationsfuzzy(query, NUMBER_RESULTS_RETURNED),
+    }
+
+    print(str(len(queries)) + " queries from " + str(number_of_names) + " names")
+    for name, search in searches.items():
+        # Run once untimed so both modes start with warm database cache
+        benchmarksearch(search, queries)
+        timings, found = benchmarksearch(search, queries)
+        line = f"{name:<8} p50 {1000 * statistics.median(timings):8.2f}ms  p99 {1000 * percentile(timings, 0.99):8.2f}ms  max {1000 * max(timings):8.2f}ms"
+        for kind in kinds: line += f"  {kind} found {found.get(kind, 0):>5d}/{totals[kind]}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
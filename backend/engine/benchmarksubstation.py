@@ -0,0 +1,88 @@
+import os
+import sys
+import random
+import time
+import statistics
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from engine.views import getnearestsubstations, getnearestsubstationsdatabase
+
+# ***********************************************************
+# ********* Benchmark nearest substation search paths *******
+# ***********************************************************
+#
+# Usage: python engine/benchmarksubstation.py [number_of_positions]
+#
+# Runs nearest substation queries for random positions across UK
+# through original annotate/order by distance to full geometries and
+# KNN search on substation centroids, reporting p50/p99 latency and
+# how often both return same nearest substation
+# Distances differ where nearest substation is polygon as original
+# measures to polygon edge while KNN measures to centroid
+
+BENCHMARK_POSITIONS                 = 200
+BENCHMARK_BOUNDS                    = (-5.5, 50.2, 1.5, 58.5)   # west, south, east, north
+BENCHMARK_NUMBER                    = 5
+BENCHMARK_SEED                      = 1
+
+
+def percentile(timings, fraction):
+    """
+    Gets value at fraction (0-1) of sorted timings
+    """
+
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(fraction * len(timings)))]
+
+def benchmarksearch(search, positions, number):
+    """
+    Times search function over positions, returning timings and primary keys of nearest substations
+    """
+
+    timings, nearest = [], []
+    for longitude, latitude in positions:
+        time_start = time.perf_counter()
+        substations = search(longitude, latitude, number)
+        timings.append(time.perf_counter() - time_start)
+        nearest.append([substation.pk for substation in substations])
+    return timings, nearest
+
+def main():
+    """
+    Runs benchmark
+    """
+
+    number_of_positions = int(sys.argv[1]) if len(sys.argv) > 1 else BENCHMARK_POSITIONS
+    random_generator = random.Random(BENCHMARK_SEED)
+    west, south, east, north = BENCHMARK_BOUNDS
+    positions = [(random_generator.uniform(west, east), random_generator.uniform(south, north)) for _ in range(number_of_positions)]
+
+    searches = {
+        'annotate': getnearestsubstationsdatabase,
+        'knn':      getnearestsubstations,
+    }
+
+    results = {}
+    for number in [1, BENCHMARK_NUMBER]:
+        print("Nearest " + str(number) + " substations for " + str(len(positions)) + " positions")
+        for name, search in searches.items():
+            # Run once untimed so both paths start with warm database cache
+            benchmarksearch(search, positions, number)
+            timings, nearest = benchmarksearch(search, positions, number)
+            results[name] = nearest
+            print(f"{name:<10} p50 {1000 * statistics.median(timings):8.2f}ms  p99 {1000 * percentile(timings, 0.99):8.2f}ms  max {1000 * max(timings):8.2f}ms")
+
+        same_nearest = sum(1 for annotate, knn in zip(results['annotate'], results['knn']) if annotate[:1] == knn[:1])
+        same_sets = sum(1 for annotate, knn in zip(results['annotate'], results['knn']) if set(annotate) == set(knn))
+        print(f"Same nearest substation {same_nearest}/{len(positions)}  same set of substations {same_sets}/{len(positions)}")
+        print("")
+
+
+if __name__ == '__main__':
+    main()
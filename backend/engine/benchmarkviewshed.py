@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import statistics
+import numpy as np
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from turfpy.misc import line_arc
+from geojson import Feature as GeoJSONFeature, Point as GeoJSONPoint
+
+from engine.terrainsampler import getterrainsampler, TERRAIN_PYRAMID_FILE
+from engine.viewshed import \
+    computeviewshedrasters, computepyramidviewshedrasters, getviewsheduniqueid, getsimplifytolerance, \
+    generatepolygonfeatures, streamfeaturecollection, \
+    returncirclesforpoint, getdistancecircleoffsets, DISTANCE_CIRCLES_KM, \
+    VIEWSHED_ENGINES, VIEWSHED_ENGINE_DEFAULT, VIEWSHED_SIMPLIFY_ZOOM_DEFAULT, \
+    VIEWSHED_POLYGONIZERS, VIEWSHED_POLYGONIZE_VECTOR
+
+# ***********************************************************
+# ************ Benchmark viewshed generation paths **********
+# ***********************************************************
+#
+# Usage: python engine/benchmarkviewshed.py [longitude,latitude ...]
+#
+# Runs each viewshed engine over same set of positions and reports
+# timings along with visible areas so results can be compared
+# Then compares warp-first and vector polygonizers on same rasters
+# for runtime, vertex count and GeoJSON payload size
+# Then compares single terrain raster with terrain pyramid for runtime,
+# number of cells processed and visible area (if pyramid has been built)
+# Finally compares original turfpy distance circles with vectorised
+# distance circles, with latitude cache both cold and warm
+
+BENCHMARK_POSITIONS                 = [
+                                        (-3.18, 55.95),     # Edinburgh
+                                        (-1.55, 53.80),     # Leeds
+                                        (-3.95, 52.60),     # Mid Wales
+                                        (-4.10, 50.55),     # Dartmoor
+                                        (0.12, 52.20),      # Cambridge
+                                    ]
+BENCHMARK_REPEATS                   = 3
+BENCHMARK_HUB_HEIGHT                = 76.4
+BENCHMARK_BLADE_RADIUS              = 47.8
+BENCHMARK_CIRCLES_REPEATS           = 200
+
+
+def getvisiblearea(raster):
+    """
+    Gets visible area of 0/255 viewshed raster in km²
+    """
+
+    geotransform = raster.GetGeoTransform()
+    visible_cells = int(np.count_nonzero(raster.GetRasterBand(1).ReadAsArray()))
+    return visible_cells * abs(geotransform[1] * geotransform[5]) / (1000 * 1000)
+
+def benchmarkengine(engine, positions):
+    """
+    Times viewshed raster generation for engine over all positions
+    """
+
+    timings, areas = [], []
+    for lon, lat in positions:
+        for repeat in range(BENCHMARK_REPEATS):
+            time_start = time.perf_counter()
+            towerheight_raster, turbinetip_raster = computeviewshedrasters(lon, lat, BENCHMARK_HUB_HEIGHT, BENCHMARK_BLADE_RADIUS, engine)
+            timings.append(time.perf_counter() - time_start)
+            if repeat == 0: areas.append((getvisiblearea(towerheight_raster), getvisiblearea(turbinetip_raster)))
+
+    return timings, areas
+
+def countvertices(geojson_content):
+    """
+    Counts vertices in all polygons of GeoJSON FeatureCollection
+    """
+
+    vertices = 0
+    for feature in json.loads(geojson_content)['features']:
+        geometry = feature['geometry']
+        polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+        for polygon in polygons:
+            for ring in polygon: vertices += len(ring)
+    return vertices
+
+def benchmarkpolygonizers(positions, zoom):
+    """
+    Times warp-first and vector polygonizers on same viewshed rasters
+    """
+
+    results = {name: [] for name in VIEWSHED_POLYGONIZERS}
+    for lon, lat in positions:
+        uniqueid = getviewsheduniqueid(lon, lat, BENCHMARK_HUB_HEIGHT, BENCHMARK_BLADE_RADIUS)
+        towerheight_raster, turbinetip_raster = computeviewshedrasters(lon, lat, BENCHMARK_HUB_HEIGHT, BENCHMARK_BLADE_RADIUS, VIEWSHED_ENGINE_DEFAULT)
+        for name in VIEWSHED_POLYGONIZERS:
+            tolerance = getsimplifytolerance(zoom, lat) if name == VIEWSHED_POLYGONIZE_VECTOR else 0
+            timings, vertices, payload = [], 0, 0
+            for repeat in range(BENCHMARK_REPEATS):
+                time_start = time.perf_counter()
+                contents = [b''.join(streamfeaturecollection([generatepolygonfeatures(uniqueid + suffix, raster, 'viewshed', name, tolerance)])) \
+                            for suffix, raster in [('_tower', towerheight_raster), ('_tip', turbinetip_raster)]]
+                timings.append(time.perf_counter() - time_start)
+            for content in contents:
+                vertices += countvertices(content)
+                payload += len(content)
+            results[name].append((statistics.median(timings), vertices, payload))
+
+    return results
+
+def benchmarkterrains(positions):
+    """
+    Times single terrain raster and terrain pyramid with default engine over all positions
+    Returns timings, cells processed and visible areas (tower, tip) for each
+    """
+
+    results = {}
+    for name, computerasters in [('single', computeviewshedrasters), ('pyramid', computepyramidviewshedrasters)]:
+        timings, cells, areas = [], [], []
+        for lon, lat in positions:
+            for repeat in range(BENCHMARK_REPEATS):
+                time_start = time.perf_counter()
+                towerheight_rasters, turbinetip_rasters = computerasters(lon, lat, BENCHMARK_HUB_HEIGHT, BENCHMARK_BLADE_RADIUS, VIEWSHED_ENGINE_DEFAULT)
+                timings.append(time.perf_counter() - time_start)
+                if not isinstance(towerheight_rasters, list): towerheight_rasters, turbinetip_rasters = [towerheight_rasters], [turbinetip_rasters]
+                if repeat == 0:
+                    cells.append(sum(raster.RasterXSize * raster.RasterYSize for raster in towerheight_rasters))
+                    areas.append((sum(getvisiblearea(raster) for raster in towerheight_rasters), sum(getvisiblearea(raster) for raster in turbinetip_rasters)))
+        results[name] = (timings, cells, areas)
+
+    return results
+
+def returncirclesforpointturfpy(lng, lat):
+    """
+    Original turfpy implementation of distance circles, kept as reference for benchmark
+    """
+
+    center = GeoJSONFeature(geometry=GeoJSONPoint((lng, lat)))
+    features = []
+    for radius in DISTANCE_CIRCLES_KM:
+        feature = line_arc(center=center, radius=radius, bearing1=0, bearing2=359.99999)
+        feature['properties'] = {'class': 'Distance_Circle', 'distance': str(radius) + 'km'}
+        features.append(feature)
+        feature_coordinates = feature['geometry']['coordinates']
+        point_label_coordinates = feature_coordinates[int(len(feature_coordinates) / 2)]
+        feature_point = {'type': 'Feature', 'name': str(radius) + 'km', 'properties': {'name': str(radius) + 'km', 'class': 'Distance_Circle_Label'}, 'geometry': {'type': 'Point', 'coordinates': point_label_coordinates}}
+        features.append(feature_point)
+    return features
+
+def benchmarkdistancecircles(positions):
+    """
+    Times turfpy and vectorised distance circles, checking both produce same GeoJSON
+    """
+
+    results = {'turfpy': [], 'vectorised (cold)': [], 'vectorised (warm)': []}
+    for lon, lat in positions:
+        reference = json.dumps(returncirclesforpointturfpy(lon, lat))
+        getdistancecircleoffsets.cache_clear()
+        if json.dumps(returncirclesforpoint(lon, lat)) != reference:
+            print(f"WARNING: distance circles differ at {lon},{lat}")
+
+        time_start = time.perf_counter()
+        for repeat in range(BENCHMARK_CIRCLES_REPEATS): returncirclesforpointturfpy(lon, lat)
+        results['turfpy'].append((time.perf_counter() - time_start) / BENCHMARK_CIRCLES_REPEATS)
+
+        time_start = time.perf_counter()
+        for repeat in range(BENCHMARK_CIRCLES_REPEATS):
+            getdistancecircleoffsets.cache_clear()
+            returncirclesforpoint(lon, lat)
+        results['vectorised (cold)'].append((time.perf_counter() - time_start) / BENCHMARK_CIRCLES_REPEATS)
+
+        time_start = time.perf_counter()
+        for repeat in range(BENCHMARK_CIRCLES_REPEATS): returncirclesforpoint(lon, lat)
+        results['vectorised (warm)'].append((time.perf_counter() - time_start) / BENCHMARK_CIRCLES_REPEATS)
+
+    return results
+
+def main():
+    """
+    Runs benchmark
+    """
+
+    positions = BENCHMARK_POSITIONS
+    if len(sys.argv) > 1: positions = [tuple(float(value) for value in arg.split(',')) for arg in sys.argv[1:]]
+
+    # Open terrain before timing so both engines start with warm sampler
+    getterrainsampler()
+
+    results = {}
+    for engine in VIEWSHED_ENGINES:
+        results[engine] = benchmarkengine(engine, positions)
+        timings = results[engine][0]
+        print(f"{engine:<12} mean {statistics.mean(timings):8.3f}s  median {statistics.median(timings):8.3f}s  min {min(timings):8.3f}s  max {max(timings):8.3f}s")
+
+    print("")
+    print("Visible area km² (tower / tip) per position")
+    for position_index, (lon, lat) in enumerate(positions):
+        line = f"{lon:>9.5f},{lat:>9.5f}"
+        for engine in VIEWSHED_ENGINES:
+            tower_area, tip_area = results[engine][1][position_index]
+            line += f"  {engine}: {tower_area:9.2f} / {tip_area:9.2f}"
+        print(line)
+
+    print("")
+    print("Polygonizers at zoom " + str(VIEWSHED_SIMPLIFY_ZOOM_DEFAULT) + " (median time / vertices / GeoJSON bytes)")
+    results = benchmarkpolygonizers(positions, VIEWSHED_SIMPLIFY_ZOOM_DEFAULT)
+    for position_index, (lon, lat) in enumerate(positions):
+        line = f"{lon:>9.5f},{lat:>9.5f}"
+        for name in results:
+            timing, vertices, payload = results[name][position_index]
+            line += f"  {name}: {timing:7.3f}s {vertices:>9d} {payload:>11d}"
+        print(line)
+
+    if os.path.isfile(TERRAIN_PYRAMID_FILE):
+        print("")
+        print("Terrain with " + VIEWSHED_ENGINE_DEFAULT + " engine (median time / cells per height / visible area km² tower / tip)")
+        getterrainsampler(TERRAIN_PYRAMID_FILE)
+        results = benchmarkterrains(positions)
+        for name, (timings, cells, areas) in results.items():
+            print(f"{name:<12} mean {statistics.mean(timings):8.3f}s  median {statistics.median(timings):8.3f}s  cells {statistics.mean(cells):12.0f}")
+        for position_index, (lon, lat) in enumerate(positions):
+            line = f"{lon:>9.5f},{lat:>9.5f}"
+            for name, (timings, cells, areas) in results.items():
+                tower_area, tip_area = areas[position_index]
+                line += f"  {name}: {cells[position_index]:>10d} {tower_area:9.2f} / {tip_area:9.2f}"
+            print(line)
+    else:
+        print("")
+        print("Terrain pyramid not built - run engine/buildterrainpyramid.py to compare terrains")
+
+    print("")
+    print("Distance circles per request (mean ms)")
+    results = benchmarkdistancecircles(positions)
+    for name, timings in results.items():
+        print(f"{name:<20} {1000 * statistics.mean(timings):8.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
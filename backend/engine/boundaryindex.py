@@ -0,0 +1,157 @@
+import os
+import json
+import gzip
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+import shapely
+from django.conf import settings
+
+# Default location of boundary index snapshot - can be overridden in settings
+BOUNDARY_INDEX_FILE                 = os.path.dirname(os.path.realpath(__file__)) + '/indexes/boundary-index.json.gz'
+
+# Size in degrees of grid cells that containing boundaries are precomputed for (~1 km)
+BOUNDARY_INDEX_CELL_SIZE            = 0.01
+
+# Maximum number of grid cells held in each worker's cell cache
+BOUNDARY_INDEX_CELL_CACHE_SIZE      = 20000
+
+# Process-wide boundary index
+BOUNDARY_INDEX                      = None
+BOUNDARY_INDEX_LOCK                 = threading.Lock()
+
+
+class BoundaryIndex:
+    """
+    Simplified geometries of all boundaries with slugs held in STRtree, ordered by area
+    Boundaries intersecting each grid cell are split, on first request within cell, into those containing
+    whole cell - which contain any point in cell without testing - and those crossing cell, which are tested exactly
+    Cell lists are kept in LRU cache so most requests need few or no polygon tests
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.mtime = os.stat(index_file).st_mtime_ns
+        with gzip.open(index_file, 'rt', encoding='utf-8') as index_fp: snapshot = json.load(index_fp)
+
+        # Snapshot is already ordered by area so boundary position gives result order
+        self.slugs = snapshot['slugs']
+        self.names = snapshot['names']
+        self.geometries = shapely.from_wkb([bytes.fromhex(wkb) for wkb in snapshot['geometries']])
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.cells = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'cell_hits': 0, 'cell_misses': 0, 'exact_tests': 0}
+
+    def getcell(self, longitude, latitude):
+        """
+        Gets (containing, crossing) arrays of boundary positions for grid cell containing position
+        """
+
+        cell = (math.floor(longitude / BOUNDARY_INDEX_CELL_SIZE), math.floor(latitude / BOUNDARY_INDEX_CELL_SIZE))
+
+        with self.lock:
+            cell_boundaries = self.cells.get(cell)
+            if cell_boundaries is not None:
+                self.cells.move_to_end(cell)
+                self.counters['cell_hits'] += 1
+                return cell_boundaries
+            self.counters['cell_misses'] += 1
+
+        cell_box = shapely.box(cell[0] * BOUNDARY_INDEX_CELL_SIZE, cell[1] * BOUNDARY_INDEX_CELL_SIZE, \
+                               (cell[0] + 1) * BOUNDARY_INDEX_CELL_SIZE, (cell[1] + 1) * BOUNDARY_INDEX_CELL_SIZE)
+        candidates = np.sort(self.tree.query(cell_box, predicate='intersects'))
+        containing = shapely.contains_properly(self.geometries[candidates], cell_box)
+        cell_boundaries = (candidates[containing], candidates[~containing])
+
+        with self.lock:
+            self.cells[cell] = cell_boundaries
+            while len(self.cells) > BOUNDARY_INDEX_CELL_CACHE_SIZE: self.cells.popitem(last=False)
+
+        return cell_boundaries
+
+    def search(self, longitude, latitude):
+        """
+        Gets list of {'name', 'slug'} of boundaries containing position, smallest area first, with duplicate slugs removed
+        """
+
+        containing, crossing = self.getcell(longitude, latitude)
+        if len(crossing) != 0:
+            with self.lock: self.counters['exact_tests'] += len(crossing)
+            crossing = crossing[shapely.contains_xy(self.geometries[crossing], longitude, latitude)]
+
+        results, slugs = [], set()
+        for position in np.sort(np.concatenate([containing, crossing])):
+            slug = self.slugs[position]
+            if slug in slugs: continue
+            slugs.add(slug)
+            results.append({'name': self.names[position], 'slug': slug})
+        return results
+
+    def stats(self):
+        """
+        Gets cell cache counters
+        """
+
+        with self.lock:
+            stats = dict(self.counters)
+            stats['cells'] = len(self.cells)
+        return stats
+
+
+def getboundaryindexfile():
+    """
+    Gets location of boundary index snapshot file
+    """
+
+    return getattr(settings, 'BOUNDARY_INDEX_FILE', BOUNDARY_INDEX_FILE)
+
+def buildboundaryindex(index_file=None):
+    """
+    Builds boundary index snapshot from simplified geometries of all boundaries with slugs, returning number of boundaries
+    Boundaries are ordered by area as in ContainingBoundaries, with boundaries without area last
+    """
+
+    from django.db.models import F
+    from .models import Boundary
+
+    if index_file is None: index_file = getboundaryindexfile()
+
+    boundaries = Boundary.objects.exclude(slug__isnull=True).exclude(slug__exact='').exclude(simplified_geometry__isnull=True) \
+                                 .order_by(F('area').asc(nulls_last=True), 'pk')
+    snapshot = {'slugs': [], 'names': [], 'geometries': []}
+    for slug, name, geometry in boundaries.values_list('slug', 'name', 'simplified_geometry').iterator(chunk_size=500):
+        snapshot['slugs'].append(slug)
+        snapshot['names'].append(name)
+        snapshot['geometries'].append(bytes(geometry.wkb).hex())
+
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    temp_file = index_file + '.' + str(os.getpid()) + '.tmp'
+    with gzip.open(temp_file, 'wt', encoding='utf-8') as index_fp: json.dump(snapshot, index_fp)
+    os.replace(temp_file, index_file)
+
+    return len(snapshot['slugs'])
+
+def getboundaryindex():
+    """
+    Gets process-wide boundary index, loading it if necessary
+    Index is reloaded when snapshot file is rebuilt and None is returned if it hasn't been built
+    """
+
+    global BOUNDARY_INDEX
+
+    index_file = getboundaryindexfile()
+    try:
+        mtime = os.stat(index_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    boundary_index = BOUNDARY_INDEX
+    if (boundary_index is not None) and (boundary_index.index_file == index_file) and (boundary_index.mtime == mtime): return boundary_index
+
+    with BOUNDARY_INDEX_LOCK:
+        if (BOUNDARY_INDEX is None) or (BOUNDARY_INDEX.index_file != index_file) or (BOUNDARY_INDEX.mtime != mtime):
+            BOUNDARY_INDEX = BoundaryIndex(index_file)
+        return BOUNDARY_INDEX
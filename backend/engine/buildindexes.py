@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import logging
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from engine.postcodeindex import buildpostcodeindex, getpostcodeindexfile
+from engine.suggestionindex import buildsuggestionindex, getsuggestionindexfile
+from engine.windspeedgrid import buildwindspeedgrid, getwindspeedgridfile
+from engine.boundaryindex import buildboundaryindex, getboundaryindexfile
+
+# ***********************************************************
+# ***************** Build in-memory indexes *****************
+# ***********************************************************
+#
+# Usage: python engine/buildindexes.py
+#
+# Rebuilds snapshot files of in-process search indexes from database
+# Running workers pick up rebuilt snapshots on their next request
+# Run whenever postcodes, places, boundaries, organisations or wind speeds are reimported
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-2s] %(message)s')
+
+
+def LogMessage(logtext):
+    """
+    Logs message to console with timestamp
+    """
+
+    logging.info(logtext)
+
+def buildindexes():
+    """
+    Builds all index snapshots
+    """
+
+    time_start = time.time()
+    count = buildpostcodeindex()
+    LogMessage("Built postcode index of " + str(count) + " postcodes in " + str(round(time.time() - time_start, 1)) + "s: " + getpostcodeindexfile())
+
+    time_start = time.time()
+    count = buildsuggestionindex()
+    LogMessage("Built suggestion index of " + str(count) + " suggestions in " + str(round(time.time() - time_start, 1)) + "s: " + getsuggestionindexfile())
+
+    time_start = time.time()
+    count = buildwindspeedgrid()
+    LogMessage("Built wind speed grid of " + str(count) + " cells in " + str(round(time.time() - time_start, 1)) + "s: " + getwindspeedgridfile())
+
+    time_start = time.time()
+    count = buildboundaryindex()
+    LogMessage("Built boundary index of " + str(count) + " boundaries in " + str(round(time.time() - time_start, 1)) + "s: " + getboundaryindexfile())
+
+def main():
+    """
+    Builds indexes from command line
+    """
+
+    buildindexes()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import logging
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from osgeo import gdal
+
+from engine.terrainsampler import TERRAIN_FILE, TERRAIN_PYRAMID_FILE, TERRAIN_PYRAMID_FACTORS
+
+# ***********************************************************
+# **************** Build terrain pyramid ********************
+# ***********************************************************
+#
+# Usage: python engine/buildterrainpyramid.py [source_terrain_file]
+#
+# Builds multi-resolution terrain pyramid used by 'pyramid' viewshed
+# terrain mode from source terrain raster (defaults to TERRAIN_FILE)
+# Level 0 keeps full resolution of source so higher resolution source
+# improves near-field accuracy, while further levels are averaged
+# overviews used for more distant bands
+#
+# Raster is padded to multiple of largest overview factor so every
+# overview cell covers exact block of full resolution cells
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-2s] %(message)s')
+
+
+def LogMessage(logtext):
+    """
+    Logs message to console with timestamp
+    """
+
+    logging.info(logtext)
+
+def buildterrainpyramid(source_file, pyramid_file):
+    """
+    Builds tiled, compressed copy of source terrain with internal averaged overviews
+    """
+
+    source_ds = gdal.Open(source_file)
+    if source_ds is None: raise FileNotFoundError("Unable to open terrain file: " + source_file)
+
+    max_factor = max(TERRAIN_PYRAMID_FACTORS)
+    xsize = max_factor * ((source_ds.RasterXSize + max_factor - 1) // max_factor)
+    ysize = max_factor * ((source_ds.RasterYSize + max_factor - 1) // max_factor)
+    nodata = source_ds.GetRasterBand(1).GetNoDataValue()
+
+    LogMessage("Source terrain " + source_file + ": " + str(source_ds.RasterXSize) + "x" + str(source_ds.RasterYSize) + " cells")
+
+    # Build into temporary file and move into place so running viewsheds never see partial pyramid
+    temp_file = pyramid_file + '.' + str(os.getpid()) + '.tmp.tif'
+    os.makedirs(os.path.dirname(pyramid_file), exist_ok=True)
+    pyramid_ds = gdal.Translate(temp_file, source_ds, srcWin=[0, 0, xsize, ysize], noData=nodata, \
+                                creationOptions=['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=2', 'BIGTIFF=IF_SAFER'])
+    source_ds = None
+
+    LogMessage("Building overviews with factors " + str(TERRAIN_PYRAMID_FACTORS))
+    gdal.SetConfigOption('COMPRESS_OVERVIEW', 'DEFLATE')
+    pyramid_ds.BuildOverviews('AVERAGE', TERRAIN_PYRAMID_FACTORS)
+
+    band = pyramid_ds.GetRasterBand(1)
+    for overview_index in range(band.GetOverviewCount()):
+        overview = band.GetOverview(overview_index)
+        LogMessage("Level " + str(overview_index + 1) + ": " + str(overview.XSize) + "x" + str(overview.YSize) + " cells")
+    band, pyramid_ds = None, None
+
+    os.replace(temp_file, pyramid_file)
+
+def main():
+    """
+    Builds terrain pyramid from command line
+    """
+
+    source_file = sys.argv[1] if len(sys.argv) > 1 else TERRAIN_FILE
+
+    time_start = time.time()
+    buildterrainpyramid(source_file, TERRAIN_PYRAMID_FILE)
+    LogMessage("Built terrain pyramid " + TERRAIN_PYRAMID_FILE + " in " + str(round(time.time() - time_start, 1)) + "s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+# Default outbox settings - can be overridden in settings
+EMAIL_OUTBOX_BATCH_SIZE             = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS           = 8
+
+# Maximum emails sent per second by each sender, 0 for no limit
+EMAIL_OUTBOX_RATE                   = 10
+
+# Seconds before first retry of failed email, doubling with each further attempt up to maximum
+EMAIL_OUTBOX_RETRY_DELAY            = 60
+EMAIL_OUTBOX_RETRY_MAX_DELAY        = 6 * 60 * 60
+
+# Seconds claimed emails are held by sender before another sender may retry them - must outlast sending whole batch
+EMAIL_OUTBOX_LEASE                  = 10 * 60
+
+
+class EmailRateLimiter:
+    """
+    Spaces sends so no more than rate emails are sent per second, 0 for no limit
+    """
+
+    def __init__(self, rate):
+        self.interval = (1 / rate) if rate > 0 else 0
+        self.next_send = 0
+
+    def wait(self):
+        """
+        Waits until next email may be sent
+        """
+
+        if self.interval == 0: return
+        now = time.monotonic()
+        if self.next_send > now: time.sleep(self.next_send - now)
+        self.next_send = max(now, self.next_send) + self.interval
+
+
+def queueemail(subject, body, to_email, from_email):
+    """
+    Queues email for sending by engine/sendemails.py
+    Should be called inside transaction of change email relates to so email is only sent if change is committed
+    """
+
+    return OutgoingEmail.objects.create(from_email=from_email, to_email=to_email, subject=subject, body=body, next_attempt=timezone.now())
+
+def getemailconnection(**kwargs):
+    """
+    Gets unopened connection to EMAIL_OUTBOX_BACKEND
+    Keyword arguments are passed to backend, eg. host and port of SMTP server
+    """
+
+    return get_connection(backend=getattr(settings, 'EMAIL_OUTBOX_BACKEND', None), **kwargs)
+
+def getemailratelimiter():
+    """
+    Gets rate limiter for EMAIL_OUTBOX_RATE
+    """
+
+    return EmailRateLimiter(getattr(settings, 'EMAIL_OUTBOX_RATE', EMAIL_OUTBOX_RATE))
+
+def getretrydelay(attempts):
+    """
+    Gets seconds to wait before next attempt of email that has failed attempts times
+    """
+
+    retry_delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', EMAIL_OUTBOX_RETRY_DELAY)
+    retry_max_delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_MAX_DELAY', EMAIL_OUTBOX_RETRY_MAX_DELAY)
+    return min(retry_max_delay, retry_delay * (2 ** max(0, attempts - 1)))
+
+def sendemail(connection, message):
+    """
+    Sends message over connection, opening connection if it isn't already open
+    Connection is left open for next message and closed on failure so next message reconnects
+    """
+
+    try:
+        connection.open()
+        message.connection = connection
+        if message.send() != 1: raise Exception("Email not accepted by backend")
+    except Exception:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        raise
+
+def claimqueuedemails(batch_size, max_attempts):
+    """
+    Claims batch of queued emails that are due by pushing their next_attempt EMAIL_OUTBOX_LEASE seconds forward
+    Claim is committed straight away so no locks are held while sending - if sender dies, lease expires and emails are retried
+    Emails are claimed with SKIP LOCKED so several senders can run at once without claiming same email twice
+    """
+
+    lease = getattr(settings, 'EMAIL_OUTBOX_LEASE', EMAIL_OUTBOX_LEASE)
+
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True) \
+                                           .filter(sent__isnull=True, attempts__lt=max_attempts, next_attempt__isnull=False, next_attempt__lte=timezone.now()) \
+                                           .order_by('next_attempt', 'pk')[:batch_size])
+
+        # Attempt is counted when email is claimed so email that keeps killing sender still runs out of attempts
+        next_attempt = timezone.now() + timedelta(seconds=lease)
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt = next_attempt
+        OutgoingEmail.objects.bulk_update(emails, ['attempts', 'next_attempt'])
+
+    return emails
+
+def sendqueuedemails(connection=None, ratelimiter=None):
+    """
+    Sends batch of queued emails that are due, returning (number sent, number failed)
+    All emails are sent over connection, which is left open so caller can reuse it for further batches
+    Emails are claimed in short transaction then sent outside it, with result of each email committed as soon as it's sent
+    Failed emails are retried with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS is reached
+    """
+
+    if connection is None: connection = getemailconnection()
+    if ratelimiter is None: ratelimiter = getemailratelimiter()
+    batch_size = getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', EMAIL_OUTBOX_BATCH_SIZE)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', EMAIL_OUTBOX_MAX_ATTEMPTS)
+    sent, failed = 0, 0
+
+    for email in claimqueuedemails(batch_size, max_attempts):
+        ratelimiter.wait()
+        try:
+            sendemail(connection, EmailMessage(email.subject, email.body, from_email=email.from_email, to=[email.to_email]))
+            email.sent = timezone.now()
+            email.next_attempt = None
+            email.error = ''
+            sent += 1
+        except Exception as exception:
+            # Email is no longer retried once it runs out of attempts - next_attempt is cleared so it drops out of queue
+            email.error = str(exception)
+            email.next_attempt = None if email.attempts >= max_attempts else timezone.now() + timedelta(seconds=getretrydelay(email.attempts))
+            failed += 1
+        email.save(update_fields=['sent', 'next_attempt', 'error'])
+
+    return sent, failed
@@ -43,6 +43,8 @@ from django.contrib.gis.utils import LayerMapping
 from django.contrib.gis.geos import GEOSException, Polygon, MultiPolygon, GEOSGeometry, Point, fromstr
 
 from engine.models import Organisation
+from engine.suggestionindex import buildsuggestionindex
+from engine.responsecache import bumpdataversion
 
 WORKING_FOLDER = str(Path(__file__).absolute().parent) + '/'
 GROUPS_FOLDER                       = WORKING_FOLDER + 'groups/'
@@ -299,5 +301,9 @@ def main():
 
         LogMessage("Number of organisations imported: " + str(count))
 
+    # Organisations appear in location suggestions so suggestion index must be rebuilt
+    LogMessage("Number of suggestions indexed: " + str(buildsuggestionindex()))
+    LogMessage("Data version for cached responses: " + str(bumpdataversion()))
+
 
 main()
\ No newline at end of file
@@ -5,7 +5,7 @@ from django.contrib.gis.geos import Point
 from django.utils.safestring import mark_safe
 from django.contrib.gis.db import models
 from django.contrib import admin
-from django.contrib.postgres.indexes import GistIndex
+from django.contrib.postgres.indexes import GistIndex, GinIndex
 from django.http import HttpResponse
 from django.utils.text import slugify
 from django.contrib.gis.geos import MultiPolygon, Polygon
@@ -150,7 +150,9 @@ class Boundary(models.Model):
             models.Index(fields=['slug',]),
             models.Index(fields=['council_name',]),
             models.Index(fields=['level',]),
+            GinIndex(fields=['name'], name='boundary_name_trgm', opclasses=['gin_trgm_ops']),
             GistIndex(fields=['geometry']),
+            GistIndex(fields=['simplified_geometry']),
         ]
 
     def reset(self, *args, **kwargs):
@@ -287,6 +289,7 @@ class Place(models.Model):
             models.Index(fields=['name',]),
             models.Index(fields=['name_en',]),
             models.Index(fields=['county',]),
+            GinIndex(fields=['name'], name='place_name_trgm', opclasses=['gin_trgm_ops']),
             GistIndex(fields=['geometry']),
         ]
 
@@ -322,6 +325,8 @@ class UserID(models.Model):
             models.Index(fields=['internetip',]),
             models.Index(fields=['useragent',]),
             models.Index(fields=['created',]),
+            # Covers engine/usercache.py bloom filter refresh of user ids created since time so it needs no table reads
+            models.Index(fields=['created', 'userid'], name='userid_created_userid'),
         ]
 
 class UserIDAdmin(admin.ModelAdmin):
@@ -383,6 +388,69 @@ class VoteAdmin(LeafletGeoAdmin, ExportCsvMixin, ExportUniqueEmailCsvMixin):
         'created',
     )
 
+class VoteSummary(models.Model):
+    """
+    Stores live vote counts for each distinct turbine position
+    Kept up to date from Vote whenever votes change so vote endpoints need not aggregate votes
+    """
+
+    geometry = models.PointField(srid=4326, geography=False)
+    votes_total = models.IntegerField(default=0)
+    votes_confirmed = models.IntegerField(default=0)
+    votes_unconfirmed = models.IntegerField(default=0)
+    first_vote = models.DateTimeField(null=True, blank=True)
+    # Name of county-level boundary containing position, resolved once when summary is created - '' if none, null if not yet resolved
+    area = models.CharField(max_length=200, null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('pk', )
+        indexes = [
+            GistIndex(fields=['geometry']),
+            # Matches engine/votesummary.py LEADERBOARD_ORDERING so leaderboard pages are read straight from index
+            models.Index(models.F('votes_total') * -1, models.F('votes_confirmed') * -1, 'first_vote', 'id', name='votesummary_leaderboard'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['geometry'], name='votesummary_geometry_unique'),
+        ]
+
+class VoteSummaryAdmin(LeafletGeoAdmin):
+    list_display = ['geometry', 'votes_total', 'votes_confirmed', 'votes_unconfirmed', 'first_vote', 'area', 'updated']
+
+class OutgoingEmail(models.Model):
+    """
+    Stores emails waiting to be sent
+    Emails are queued in same transaction as change they relate to and sent by engine/sendemails.py so requests never wait on SMTP
+    """
+
+    from_email = models.CharField(max_length=200, default='', blank=True)
+    to_email = models.CharField(max_length=200, default='', blank=True)
+    subject = models.CharField(max_length=1000, default='', blank=True)
+    body = models.TextField(default='', blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(null=True, blank=True)
+    sent = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(default='', blank=True)
+
+    def __str__(self):
+        return self.to_email
+
+    class Meta:
+        ordering = ('created', )
+        indexes = [
+            models.Index(fields=['sent', 'next_attempt']),
+            models.Index(fields=['to_email',]),
+        ]
+
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['to_email', 'subject', 'created', 'attempts', 'next_attempt', 'sent']
+
+    search_fields = (
+        'to_email',
+        'subject',
+    )
+
 class Organisation(models.Model):
     """
     Stores information about organisations, eg. community energy groups
@@ -424,6 +492,7 @@ class Organisation(models.Model):
             models.Index(fields=['source',]),
             models.Index(fields=['email',]),
             models.Index(fields=['url',]),
+            GinIndex(fields=['name'], name='organisation_name_trgm', opclasses=['gin_trgm_ops']),
             GistIndex(fields=['geometry']),
         ]
 
@@ -498,15 +567,24 @@ class Substation(models.Model):
     substation = models.CharField(max_length=100, null=True, blank=True)
     power = models.CharField(max_length=100, null=True, blank=True)
     geometry = models.GeometryField(srid=4326, spatial_index=True)
+    # Point position of substation - same as geometry for points and centroid for polygons/lines
+    # Stored as geography so KNN index orders nearest substations by distance on sphere rather than in degrees
+    centroid = models.PointField(srid=4326, geography=True, null=True, blank=True)
 
     class Meta:
         indexes = [
             models.Index(fields=["voltage"]),
             GistIndex(fields=['geometry']),
+            GistIndex(fields=['centroid']),
         ]
         verbose_name = "Substation"
         verbose_name_plural = "Substations"
 
+    def save(self, *args, **kwargs):
+        if self.geometry:
+            self.centroid = self.geometry if self.geometry.geom_type == 'Point' else self.geometry.centroid
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name or 'Unnamed'} ({self.voltage or 'Unknown voltage'})"
     
@@ -0,0 +1,146 @@
+import os
+import heapq
+import threading
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+# Default location of postcode index snapshot - can be overridden in settings
+POSTCODE_INDEX_FILE                 = os.path.dirname(os.path.realpath(__file__)) + '/indexes/postcode-index.npy'
+
+# Each entry holds postcode name, eg. 'AB12 3CD', and its position
+POSTCODE_INDEX_DTYPE                = np.dtype([('name', 'S8'), ('lon', '<f4'), ('lat', '<f4')])
+POSTCODE_INDEX_NAME_MAXLENGTH       = 8
+
+# Possible lengths of outward code, ie. part of postcode before space
+POSTCODE_OUTWARD_LENGTHS            = [2, 3, 4]
+
+# Number of rows fetched from database at a time when building index
+POSTCODE_INDEX_FETCH_SIZE           = 100000
+
+# Process-wide postcode index
+POSTCODE_INDEX                      = None
+POSTCODE_INDEX_LOCK                 = threading.Lock()
+
+
+class PostcodeIndex:
+    """
+    Sorted array of postcode names and positions, memory-mapped from snapshot file
+    so all worker processes share same pages and prefix queries need no database access
+
+    Search strings have spaces removed but names are sorted with spaces, so prefix query
+    is answered as union of contiguous name ranges - one for each place space could fall
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.mtime = os.stat(index_file).st_mtime_ns
+        self.entries = np.load(index_file, mmap_mode='r')
+        self.names = self.entries['name']
+
+    def getrange(self, prefix):
+        """
+        Gets (start, end) of entries whose names start with prefix bytes
+        """
+
+        if len(prefix) == 0: return 0, len(self.names)
+        if len(prefix) > POSTCODE_INDEX_NAME_MAXLENGTH: return 0, 0
+        # Names are ASCII so incrementing last byte gives first name beyond all names with prefix
+        prefix_end = prefix[:-1] + bytes([prefix[-1] + 1])
+        return int(np.searchsorted(self.names, prefix, side='left')), int(np.searchsorted(self.names, prefix_end, side='left'))
+
+    def search(self, query_postcode, limit):
+        """
+        Gets first limit postcode names, in name order, whose search string (name without spaces) starts with query_postcode
+        """
+
+        try:
+            query = query_postcode.replace(' ', '').upper().encode('ascii')
+        except UnicodeEncodeError:
+            return []
+
+        prefixes = [query] + [query[:length] + b' ' + query[length:] for length in POSTCODE_OUTWARD_LENGTHS if length < len(query)]
+        ranges = []
+        for prefix in prefixes:
+            start, end = self.getrange(prefix)
+            if end > start: ranges.append(self.names[start:min(end, start + limit)])
+
+        results = []
+        for name in heapq.merge(*ranges):
+            name = name.decode('ascii')
+            if (len(results) != 0) and (results[-1] == name): continue
+            results.append(name)
+            if len(results) == limit: break
+        return results
+
+    def get(self, query_postcode):
+        """
+        Gets (name, longitude, latitude) of postcode whose search string matches query_postcode exactly, or None
+        """
+
+        for name in self.search(query_postcode, len(POSTCODE_OUTWARD_LENGTHS) + 1):
+            if name.replace(' ', '') != query_postcode.replace(' ', '').upper(): continue
+            start, _ = self.getrange(name.encode('ascii'))
+            entry = self.entries[start]
+            return name, float(entry['lon']), float(entry['lat'])
+        return None
+
+
+def getpostcodeindexfile():
+    """
+    Gets location of postcode index snapshot file
+    """
+
+    return getattr(settings, 'POSTCODE_INDEX_FILE', POSTCODE_INDEX_FILE)
+
+def buildpostcodeindex(index_file=None):
+    """
+    Builds postcode index snapshot from Postcode table, returning number of postcodes indexed
+    Snapshot is written to temporary file and moved into place so running workers never see partial index
+    """
+
+    from .models import Postcode
+
+    if index_file is None: index_file = getpostcodeindexfile()
+
+    chunks = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name, ST_X(geometry), ST_Y(geometry) FROM " + Postcode._meta.db_table + " WHERE geometry IS NOT NULL")
+        while True:
+            rows = cursor.fetchmany(POSTCODE_INDEX_FETCH_SIZE)
+            if len(rows) == 0: break
+            rows = [(name.encode('ascii'), lon, lat) for name, lon, lat in rows if len(name) <= POSTCODE_INDEX_NAME_MAXLENGTH and name.isascii()]
+            chunks.append(np.array(rows, dtype=POSTCODE_INDEX_DTYPE))
+
+    entries = np.concatenate(chunks) if len(chunks) != 0 else np.zeros(0, dtype=POSTCODE_INDEX_DTYPE)
+    # Sort bytewise in Python rather than relying on database collation
+    entries = entries[np.argsort(entries['name'], kind='stable')]
+
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    temp_file = index_file + '.' + str(os.getpid()) + '.tmp.npy'
+    np.save(temp_file, entries)
+    os.replace(temp_file, index_file)
+
+    return len(entries)
+
+def getpostcodeindex():
+    """
+    Gets process-wide postcode index, loading it if necessary
+    Index is reloaded when snapshot file is rebuilt and None is returned if it hasn't been built
+    """
+
+    global POSTCODE_INDEX
+
+    index_file = getpostcodeindexfile()
+    try:
+        mtime = os.stat(index_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    postcode_index = POSTCODE_INDEX
+    if (postcode_index is not None) and (postcode_index.index_file == index_file) and (postcode_index.mtime == mtime): return postcode_index
+
+    with POSTCODE_INDEX_LOCK:
+        if (POSTCODE_INDEX is None) or (POSTCODE_INDEX.index_file != index_file) or (POSTCODE_INDEX.mtime != mtime):
+            POSTCODE_INDEX = PostcodeIndex(index_file)
+        return POSTCODE_INDEX
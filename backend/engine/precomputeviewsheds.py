@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import logging
+import multiprocessing
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from engine.models import Vote
+from engine.views import getdefaultviewshedkey
+from engine.viewshedcache import getprecomputedviewshedstore
+from engine.viewshedworkers import precomputeviewshed
+
+# ***********************************************************
+# ******** Precompute viewsheds for voted positions *********
+# ***********************************************************
+#
+# Usage: python engine/precomputeviewsheds.py
+#
+# Computes default viewshed for every distinct turbine position
+# with live vote and saves it to precomputed viewshed store so
+# viewshed requests for voted positions never wait for GDAL
+# New votes are precomputed incrementally when they are created
+# so this only needs running after import or terrain change
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-2s] %(message)s')
+
+
+def LogMessage(logtext):
+    """
+    Logs message to console with timestamp
+    """
+
+    logging.info(logtext)
+
+def getpendingpositions():
+    """
+    Gets precompute arguments for all distinct live vote positions not already in precomputed store
+    """
+
+    precomputed_store = getprecomputedviewshedstore()
+    pending, keys = [], set()
+    for geometry in Vote.objects.filter(live=True).values_list('geometry', flat=True).distinct():
+        (longitude, latitude, hubheight, bladeradius), key = getdefaultviewshedkey(geometry.coords[0], geometry.coords[1])
+        if key in keys: continue
+        keys.add(key)
+        if precomputed_store.has(key): continue
+        pending.append((key, longitude, latitude, hubheight, bladeradius))
+    return pending
+
+def main():
+    """
+    Precomputes viewsheds for all voted positions that don't have one
+    """
+
+    pending = getpendingpositions()
+    LogMessage("Precomputing viewsheds for " + str(len(pending)) + " voted positions")
+    if len(pending) == 0: return
+
+    time_start = time.time()
+    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
+        results = pool.starmap(precomputeviewshed, pending)
+
+    LogMessage("Precomputed " + str(sum(1 for result in results if result)) + " viewsheds in " + str(round(time.time() - time_start, 1)) + "s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+import logging
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from engine.votesummary import rebuildvotesummaries
+
+# ***********************************************************
+# **************** Rebuild vote summaries *******************
+# ***********************************************************
+#
+# Usage: python engine/rebuildvotesummaries.py
+#
+# Rebuilds VoteSummary table of live vote counts per turbine
+# position from Vote table. Summaries are kept up to date as votes
+# are created and confirmed so this is only needed after votes
+# are edited or deleted directly, eg. through admin
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-2s] %(message)s')
+
+
+def LogMessage(logtext):
+    """
+    Logs message to console with timestamp
+    """
+
+    logging.info(logtext)
+
+def main():
+    """
+    Rebuilds vote summaries from command line
+    """
+
+    time_start = time.time()
+    count = rebuildvotesummaries()
+    LogMessage("Rebuilt vote summaries for " + str(count) + " turbine positions in " + str(round(time.time() - time_start, 1)) + "s")
+
+
+if __name__ == '__main__':
+    main()
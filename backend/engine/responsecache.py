@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+import threading
+from django.conf import settings
+from django.core.cache import caches
+
+# Default response cache settings - can be overridden in settings
+RESPONSE_CACHE_ALIAS                = 'responses'
+RESPONSE_CACHE_TIMEOUT              = 7 * 24 * 60 * 60
+RESPONSE_CACHE_VERSION_FILE         = os.path.dirname(os.path.realpath(__file__)) + '/indexes/data-version.txt'
+
+# Number of decimal places positions are quantised to before lookup (~10 m) so nearby requests share entries
+RESPONSE_CACHE_COORDINATE_PRECISION = 4
+
+# Process-wide response cache and last data version read
+RESPONSE_CACHE                      = None
+RESPONSE_CACHE_LOCK                 = threading.Lock()
+RESPONSE_CACHE_VERSION              = (None, 0)
+
+
+def getdataversionfile():
+    """
+    Gets location of data version file
+    """
+
+    return getattr(settings, 'RESPONSE_CACHE_VERSION_FILE', RESPONSE_CACHE_VERSION_FILE)
+
+def getdataversion():
+    """
+    Gets current data version, re-reading data version file only when it has changed
+    Version is 0 if data version file hasn't been written
+    """
+
+    global RESPONSE_CACHE_VERSION
+
+    version_file = getdataversionfile()
+    try:
+        mtime = os.stat(version_file).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+    version_mtime, version = RESPONSE_CACHE_VERSION
+    if version_mtime == mtime: return version
+
+    try:
+        with open(version_file, 'r') as version_fp: version = int(version_fp.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        version = 0
+    RESPONSE_CACHE_VERSION = (mtime, version)
+    return version
+
+def bumpdataversion():
+    """
+    Increments data version so all cached responses generated from previous data are ignored
+    Should be called whenever data is reimported - returns new version
+    """
+
+    version_file = getdataversionfile()
+    try:
+        with open(version_file, 'r') as version_fp: version = int(version_fp.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        version = 0
+    version += 1
+
+    os.makedirs(os.path.dirname(version_file), exist_ok=True)
+    temp_file = version_file + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_file, 'w') as version_fp: version_fp.write(str(version))
+    os.replace(temp_file, version_file)
+
+    return version
+
+def quantiseposition(longitude, latitude):
+    """
+    Gets position rounded to RESPONSE_CACHE_COORDINATE_PRECISION
+    Responses should be generated from quantised position so cached entry is same whichever nearby position created it
+    """
+
+    return round(longitude, RESPONSE_CACHE_COORDINATE_PRECISION), round(latitude, RESPONSE_CACHE_COORDINATE_PRECISION)
+
+
+class ResponseCache:
+    """
+    Cache of serialised responses of read-mostly endpoints, stored in configured Django cache backend
+    Entries are keyed on endpoint and normalised inputs, and stored under current data version
+    so bumping data version invalidates all entries at once
+    Backend errors are counted and treated as misses so unavailable backend never breaks endpoints
+    """
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def getkey(self, endpoint, parts):
+        """
+        Gets cache key for endpoint and normalised inputs
+        """
+
+        return 'response:' + endpoint + ':' + hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def count(self, endpoint, counter):
+        """
+        Increments counter for endpoint
+        """
+
+        with self.lock:
+            endpoint_counters = self.counters.setdefault(endpoint, {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0})
+            endpoint_counters[counter] += 1
+
+    def get(self, endpoint, parts):
+        """
+        Gets cached (content_type, content) for endpoint and inputs, or None
+        """
+
+        try:
+            cached = caches[self.alias].get(self.getkey(endpoint, parts), version=getdataversion())
+        except Exception:
+            self.count(endpoint, 'errors')
+            cached = None
+
+        self.count(endpoint, 'misses' if cached is None else 'hits')
+        return cached
+
+    def set(self, endpoint, parts, content_type, content):
+        """
+        Stores (content_type, content) for endpoint and inputs
+        """
+
+        try:
+            caches[self.alias].set(self.getkey(endpoint, parts), (content_type, content), self.timeout, version=getdataversion())
+        except Exception:
+            self.count(endpoint, 'errors')
+            return
+
+        self.count(endpoint, 'stores')
+
+    def stats(self):
+        """
+        Gets counters and hit rate for each endpoint
+        """
+
+        with self.lock:
+            stats = {endpoint: dict(endpoint_counters) for endpoint, endpoint_counters in self.counters.items()}
+        for endpoint_stats in stats.values():
+            requests = endpoint_stats['hits'] + endpoint_stats['misses']
+            endpoint_stats['hit_rate'] = round(endpoint_stats['hits'] / requests, 4) if requests else None
+        return stats
+
+
+def getresponsecache():
+    """
+    Gets process-wide response cache
+    """
+
+    global RESPONSE_CACHE
+
+    if RESPONSE_CACHE is not None: return RESPONSE_CACHE
+
+    with RESPONSE_CACHE_LOCK:
+        if RESPONSE_CACHE is None:
+            RESPONSE_CACHE = ResponseCache( getattr(settings, 'RESPONSE_CACHE_ALIAS', RESPONSE_CACHE_ALIAS), \
+                                            getattr(settings, 'RESPONSE_CACHE_TIMEOUT', RESPONSE_CACHE_TIMEOUT))
+        return RESPONSE_CACHE
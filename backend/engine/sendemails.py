@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import logging
+
+if __name__ == '__main__':
+    import django
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    sys.path.append(parent_dir)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "votewind.settings")
+    django.setup()
+
+from engine.emailoutbox import sendqueuedemails, getemailconnection, getemailratelimiter
+
+# ***********************************************************
+# ****************** Send queued emails *********************
+# ***********************************************************
+#
+# Usage: python engine/sendemails.py [--once]
+#
+# Sends emails queued in OutgoingEmail table, eg. vote confirmation
+# emails, retrying failed emails with increasing delay. Runs until
+# stopped, polling for new emails, unless --once is given in which
+# case it sends all emails currently due and exits (eg. from cron)
+# Emails are sent in batches over single connection, held open while
+# queue has emails and closed once it's empty, no faster than
+# EMAIL_OUTBOX_RATE emails per second. Several senders can be run at
+# once - see engine/benchmarkemail.py to measure throughput
+
+EMAIL_POLL_INTERVAL                 = 2
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-2s] %(message)s')
+
+
+def LogMessage(logtext):
+    """
+    Logs message to console with timestamp
+    """
+
+    logging.info(logtext)
+
+def main():
+    """
+    Sends queued emails from command line
+    """
+
+    once = '--once' in sys.argv[1:]
+
+    LogMessage("Sending queued emails" + (" once" if once else ", polling every " + str(EMAIL_POLL_INTERVAL) + "s"))
+
+    connection, ratelimiter = getemailconnection(), getemailratelimiter()
+
+    try:
+        while True:
+            sent, failed = sendqueuedemails(connection, ratelimiter)
+            if (sent + failed) != 0: LogMessage("Sent " + str(sent) + " emails, " + str(failed) + " failed")
+            # Carry straight on over same connection while there may be more emails due
+            if (sent + failed) != 0: continue
+            # Don't hold idle connection open as server would eventually drop it
+            connection.close()
+            if once: break
+            time.sleep(EMAIL_POLL_INTERVAL)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -29,19 +29,27 @@ if __name__ == '__main__':
     django.setup()
 
 from django.db import connection
-from django.contrib.gis.db.models.functions import Area
+from django.contrib.gis.db.models.functions import Area, Centroid
 from django.contrib.gis.gdal import DataSource
 from django.contrib.gis.utils import LayerMapping
 from django.contrib.gis.geos import GEOSException, Polygon, MultiPolygon, GEOSGeometry, Point, fromstr
 from django.utils.text import slugify
 
+from engine.postcodeindex import buildpostcodeindex, getpostcodeindexfile
+from engine.suggestionindex import buildsuggestionindex
+from engine.boundaryindex import buildboundaryindex
+from engine.votesummary import rebuildvotesummaries
+from engine.windspeedgrid import buildwindspeedgrid, getwindspeedgridfile
+from engine.responsecache import bumpdataversion
 from engine.models import \
     Postcode, \
     Place, \
     Boundary, \
     ClipRegion, \
     WindSpeed, \
-    Substation
+    Substation, \
+    Vote, \
+    VoteSummary
 
 WORKING_FOLDER = str(Path(__file__).absolute().parent) + '/'
 LOG_SINGLE_PASS                     = WORKING_FOLDER + 'log.txt'
@@ -375,6 +383,11 @@ def main():
 
             output_geojson.write(json.dumps(geojson, indent=2, default=decimal_default))
 
+    # Substations imported before centroids were stored need centroids for nearest substation search
+    substations_without_centroid = Substation.objects.filter(centroid__isnull=True)
+    if substations_without_centroid.exists():
+        LogMessage("Number of substation centroids added: " + str(substations_without_centroid.update(centroid=Centroid('geometry'))))
+
     if isfile(temp_gpkg): os.remove(temp_gpkg + '.gpkg')
 
     if not isfile(osm_boundaries):
@@ -654,9 +667,10 @@ def main():
         shutil.move(POSTCODES_DOWNLOAD_FOLDER + POSTCODES_SINGLEFILE, POSTCODES_DOWNLOAD_FOLDER + basename(POSTCODES_SINGLEFILE))
 
     # Only import postcodes if postcode table is empty
-    postcodes_incomplete = []
+    postcodes_incomplete, postcodes_imported = [], False
     postcodes = Postcode.objects.all()
     if postcodes.count() == 0:
+        postcodes_imported = True
 
         LogMessage("Importing postcodes into Django")
 
@@ -681,9 +695,23 @@ def main():
 
         LogMessage("Number of postcodes missing positions: " + str(len(postcodes_incomplete)))
 
-    number_imported = 0
+    # Postcode index snapshot must be rebuilt whenever postcodes are reimported
+    if postcodes_imported or (not isfile(getpostcodeindexfile())):
+        LogMessage("Building postcode index")
+        LogMessage("Number of postcodes indexed: " + str(buildpostcodeindex()))
+
+    # Suggestion index is quick to build so always rebuild in case places or boundaries have changed
+    LogMessage("Building suggestion index")
+    LogMessage("Number of suggestions indexed: " + str(buildsuggestionindex()))
+
+    # Boundary index holds simplified geometries so must also be rebuilt in case boundaries have changed
+    LogMessage("Building boundary index")
+    LogMessage("Number of boundaries indexed: " + str(buildboundaryindex()))
+
+    number_imported, windspeeds_imported = 0, False
     windspeeds = WindSpeed.objects.all()
     if windspeeds.count() == 0:
+        windspeeds_imported = True
 
         windspeeds_path = downloadWindSpeeds()
 
@@ -702,6 +730,18 @@ def main():
 
         LogMessage("Number of windspeed items imported: " + str(count))
 
+    # Wind speed grid snapshot must be rebuilt whenever wind speeds are reimported
+    if windspeeds_imported or (not isfile(getwindspeedgridfile())):
+        LogMessage("Building wind speed grid")
+        LogMessage("Number of wind speed grid cells: " + str(buildwindspeedgrid()))
+
+    # Vote summaries are maintained as votes change but must be built once for votes cast before they existed
+    if (not VoteSummary.objects.exists()) and Vote.objects.filter(live=True).exists():
+        LogMessage("Number of turbine positions in vote summaries: " + str(rebuildvotesummaries()))
+
+    # Cached endpoint responses may be out of date after any import so invalidate them all
+    LogMessage("Data version for cached responses: " + str(bumpdataversion()))
+
 # Only remove log file on main thread
 if __name__ == "__main__":
     if isfile(LOG_SINGLE_PASS): os.remove(LOG_SINGLE_PASS)
@@ -0,0 +1,230 @@
+import os
+import json
+import gzip
+import bisect
+import threading
+import numpy as np
+from django.conf import settings
+
+# Default location of suggestion index snapshot - can be overridden in settings
+SUGGESTION_INDEX_FILE               = os.path.dirname(os.path.realpath(__file__)) + '/indexes/suggestion-index.json.gz'
+
+# Organisation types offered as suggestions
+SUGGESTION_ORGANISATION_TYPES       = ['community-energy-group', 'community-energy-related']
+
+# Suffixes added to display strings to distinguish suggestion types
+SUGGESTION_SUFFIX_AREA              = ' (Area)'
+SUGGESTION_SUFFIX_ORGANISATION      = ' (Organisation)'
+
+# Character sorting after all others, used to find end of prefix range
+SUGGESTION_PREFIX_END               = '\U0010ffff'
+
+# Process-wide suggestion index
+SUGGESTION_INDEX                    = None
+SUGGESTION_INDEX_LOCK               = threading.Lock()
+
+
+class SuggestionCategory:
+    """
+    Suggestions of one type sorted by lowercase search key
+    Ranks give position of each display string in display order so top results of large prefix range
+    can be picked without sorting whole range
+    """
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.keys = [entry[0] for entry in entries]
+        self.displays = [entry[-1] for entry in entries]
+        self.extras = [entry[1:-1] for entry in entries]
+        display_order = sorted(range(len(entries)), key=lambda index: self.displays[index])
+        self.ranks = np.empty(len(entries), dtype=np.int64)
+        self.ranks[display_order] = np.arange(len(entries))
+
+    def getrange(self, key):
+        """
+        Gets (start, end) of entries whose key starts with key
+        """
+
+        return bisect.bisect_left(self.keys, key), bisect.bisect_left(self.keys, key + SUGGESTION_PREFIX_END)
+
+    def getexactrange(self, key):
+        """
+        Gets (start, end) of entries whose key equals key
+        """
+
+        return bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+
+    def gettop(self, start, end, limit):
+        """
+        Gets first limit display strings, in display order, of entries in range
+        """
+
+        if (end - start) <= limit: return self.displays[start:end]
+        top = start + np.argpartition(self.ranks[start:end], limit)[:limit]
+        return [self.displays[index] for index in top]
+
+
+class SuggestionIndex:
+    """
+    Precomputed autocomplete suggestions for places, boundaries and organisations
+    Every suggestion is keyed by its display string, eg. 'Name, County', 'X (Area)', 'Y (Organisation)',
+    and carries location result that LocationGet returns for it so neither search nor lookup need database
+    Postcodes are served separately by postcode index as there are too many to hold as Python objects
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.mtime = os.stat(index_file).st_mtime_ns
+        with gzip.open(index_file, 'rt', encoding='utf-8') as index_fp: snapshot = json.load(index_fp)
+
+        self.places = SuggestionCategory([(name.lower(), county.lower(), name + ", " + county) for name, county in snapshot['places']])
+        self.boundaries = SuggestionCategory([(name.lower(), name + SUGGESTION_SUFFIX_AREA) for name in snapshot['boundaries']])
+        self.organisations = [(name.lower(), name + SUGGESTION_SUFFIX_ORGANISATION) for name in snapshot['organisations']]
+        self.results = snapshot['results']
+
+    def search(self, query, limit):
+        """
+        Gets set of suggestions matching query, containing at least first limit suggestions of each type in display order
+        Matching follows LocationSearch: places and boundaries by case-insensitive prefix
+        ('Name, County' queries match name exactly and county by prefix) and organisations by substring
+        """
+
+        query_lower = query.lower()
+        query_elements = query_lower.split(", ")
+        suggestions = set()
+
+        if len(query_elements) == 2:
+            start, end = self.places.getexactrange(query_elements[0])
+            for index in range(start, end):
+                if self.places.extras[index][0].startswith(query_elements[1]): suggestions.add(self.places.displays[index])
+        else:
+            suggestions.update(self.places.gettop(*self.places.getrange(query_lower), limit))
+
+        suggestions.update(self.boundaries.gettop(*self.boundaries.getrange(query_lower), limit))
+        for name, display in self.organisations:
+            if query_lower in name: suggestions.add(display)
+
+        return suggestions
+
+    def hasname(self, name):
+        """
+        Checks whether any place or boundary has name, ignoring case
+        """
+
+        name_lower = name.lower()
+        for category in [self.places, self.boundaries]:
+            start, end = category.getexactrange(name_lower)
+            if end > start: return True
+        return False
+
+    def get(self, display):
+        """
+        Gets location result for exact display string, or None if it isn't precomputed
+        """
+
+        return self.results.get(display)
+
+
+def getsuggestionindexfile():
+    """
+    Gets location of suggestion index snapshot file
+    """
+
+    return getattr(settings, 'SUGGESTION_INDEX_FILE', SUGGESTION_INDEX_FILE)
+
+def getextentcentre(extent):
+    """
+    Gets centre of (xmin, ymin, xmax, ymax) extent
+    """
+
+    return ((extent[0] + extent[2]) / 2), ((extent[1] + extent[3]) / 2)
+
+def buildsuggestionindex(index_file=None):
+    """
+    Builds suggestion index snapshot from Place, Boundary and Organisation tables, returning number of suggestions
+    Location results reproduce what LocationGet's database queries return for each display string
+    Display strings that LocationGet wouldn't parse back to same record aren't given results so fall back to database
+    """
+
+    from django.contrib.gis.db.models.functions import Envelope
+    from .models import Place, Boundary, Organisation
+
+    if index_file is None: index_file = getsuggestionindexfile()
+
+    places, boundaries, organisations, results, seen = [], [], [], {}, set()
+
+    # Boundaries - LocationGet uses first boundary with name, which takes priority over places and postcodes
+    boundary_queryset = Boundary.objects.exclude(name__iendswith='ED').exclude(name__isnull=True).annotate(envelope=Envelope('geometry'))
+    for name, envelope in boundary_queryset.values_list('name', 'envelope').iterator(chunk_size=2000):
+        display = name + SUGGESTION_SUFFIX_AREA
+        if display in seen: continue
+        seen.add(display)
+        boundaries.append(name)
+        if (envelope is None) or (len(name.split(", ")) == 2): continue
+        boundary_extent = envelope.extent
+        longitude, latitude = getextentcentre(boundary_extent)
+        results[display] = {'boundary': name, 'longitude': longitude, 'latitude': latitude, 'bounds': boundary_extent, 'type': 'boundary:' + name}
+
+    # Places - LocationGet uses first place with name and county, centred within extent of its boundary
+    place_queryset = Place.objects.annotate(boundary_envelope=Envelope('boundary__geometry'))
+    for name, county, geometry, boundary_envelope in place_queryset.values_list('name', 'county', 'geometry', 'boundary_envelope').iterator(chunk_size=2000):
+        display = name + ", " + county
+        if display in seen: continue
+        seen.add(display)
+        places.append((name, county))
+        if (geometry is None) or (len(display.split(", ")) != 2): continue
+        place_x, place_y = geometry.coords[0], geometry.coords[1]
+        result = {'longitude': place_x, 'latitude': place_y, 'type': 'place:' + display}
+        if boundary_envelope is not None:
+            bounds = boundary_envelope.extent
+            bounds_offset_x = (bounds[2] - bounds[0]) / 2
+            bounds_offset_y = (bounds[3] - bounds[1]) / 2
+            result['bounds'] = [place_x - bounds_offset_x, place_y - bounds_offset_y, place_x + bounds_offset_x, place_y + bounds_offset_y, ]
+        results[display] = result
+
+    # Organisations - LocationGet uses first organisation with name
+    for organisation in Organisation.objects.all().iterator(chunk_size=2000):
+        display = organisation.name + SUGGESTION_SUFFIX_ORGANISATION
+        if organisation.type in SUGGESTION_ORGANISATION_TYPES: organisations.append(organisation.name)
+        if display in seen: continue
+        seen.add(display)
+        if organisation.geometry is None: continue
+        results[display] = {    'longitude': organisation.geometry.coords[0],
+                                'latitude': organisation.geometry.coords[1],
+                                'type': 'organisation:' + str(organisation.pk),
+                                'properties': { 'id': organisation.pk,
+                                                'name': organisation.name,
+                                                'url': organisation.url,
+                                                'description': organisation.description,
+                                                'logo_url': organisation.logo_url }}
+
+    snapshot = {'places': places, 'boundaries': boundaries, 'organisations': sorted(set(organisations)), 'results': results}
+
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    temp_file = index_file + '.' + str(os.getpid()) + '.tmp'
+    with gzip.open(temp_file, 'wt', encoding='utf-8') as index_fp: json.dump(snapshot, index_fp)
+    os.replace(temp_file, index_file)
+
+    return len(places) + len(boundaries) + len(snapshot['organisations'])
+
+def getsuggestionindex():
+    """
+    Gets process-wide suggestion index, loading it if necessary
+    Index is reloaded when snapshot file is rebuilt and None is returned if it hasn't been built
+    """
+
+    global SUGGESTION_INDEX
+
+    index_file = getsuggestionindexfile()
+    try:
+        mtime = os.stat(index_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    suggestion_index = SUGGESTION_INDEX
+    if (suggestion_index is not None) and (suggestion_index.index_file == index_file) and (suggestion_index.mtime == mtime): return suggestion_index
+
+    with SUGGESTION_INDEX_LOCK:
+        if (SUGGESTION_INDEX is None) or (SUGGESTION_INDEX.index_file != index_file) or (SUGGESTION_INDEX.mtime != mtime):
+            SUGGESTION_INDEX = SuggestionIndex(index_file)
+        return SUGGESTION_INDEX
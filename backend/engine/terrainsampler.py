@@ -0,0 +1,196 @@
+import os
+import math
+import threading
+import numpy as np
+from osgeo import gdal, osr
+
+# Terrain file to be used for generating viewshed
+TERRAIN_FILE                        = os.path.dirname(os.path.realpath(__file__)) + '/terrain/terrain_lowres_withfeatures.tif'
+
+# Multi-resolution terrain pyramid built by engine/buildterrainpyramid.py
+# Level 0 is full resolution and each further level is internal overview reduced by factor
+TERRAIN_PYRAMID_FILE                = os.path.dirname(os.path.realpath(__file__)) + '/terrain/terrain_pyramid.tif'
+TERRAIN_PYRAMID_FACTORS             = [2, 4]
+
+# Process-wide terrain samplers, one per terrain file - created lazily so each (forked) worker opens its own GDAL handles
+TERRAIN_SAMPLERS                    = {}
+TERRAIN_SAMPLER_LOCK                = threading.Lock()
+
+# Maximum number of cells to read in one window when batch sampling - points spread further apart are read individually
+TERRAIN_BATCH_WINDOW_MAX_CELLS      = 4 * 1024 * 1024
+
+
+class TerrainSampler:
+    """
+    Holds open terrain dataset together with cached CRS84 -> raster transform and inverse geotransform
+    so elevation lookups don't have to reopen file and rebuild transforms on every request
+    GDAL dataset handles are not thread-safe so each thread gets its own handle, opened once
+    Any overviews in terrain file are available as further levels when reading windows
+    """
+
+    def __init__(self, terrain_file):
+        self.terrain_file = terrain_file
+        self.pid = os.getpid()
+        self.mtime = getterrainmtime(terrain_file)
+        self.local = threading.local()
+        dataset = self.getdataset()
+        self.projection = dataset.GetProjection()
+        self.geotransform = dataset.GetGeoTransform()
+        self.geotransform_inv = gdal.InvGeoTransform(self.geotransform)
+        self.xsize = dataset.RasterXSize
+        self.ysize = dataset.RasterYSize
+        self.nodata = dataset.GetRasterBand(1).GetNoDataValue()
+
+        # Size and geotransform of full resolution raster (level 0) and each overview
+        band = dataset.GetRasterBand(1)
+        self.levels = [(self.xsize, self.ysize, self.geotransform)]
+        for overview_index in range(band.GetOverviewCount()):
+            overview = band.GetOverview(overview_index)
+            scale_x, scale_y = self.xsize / overview.XSize, self.ysize / overview.YSize
+            gt = self.geotransform
+            self.levels.append((overview.XSize, overview.YSize, (gt[0], gt[1] * scale_x, gt[2] * scale_y, gt[3], gt[4] * scale_x, gt[5] * scale_y)))
+
+        source_srs = osr.SpatialReference()
+        source_srs.ImportFromWkt(osr.GetUserInputAsWKT("urn:ogc:def:crs:OGC:1.3:CRS84"))
+        source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromWkt(self.projection)
+        target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        self.srs = target_srs
+        self.transform = osr.CoordinateTransformation(source_srs, target_srs)
+
+    def getdataset(self):
+        """
+        Gets terrain dataset handle for current thread
+        """
+
+        dataset = getattr(self.local, 'dataset', None)
+        if dataset is None:
+            dataset = gdal.OpenEx(self.terrain_file, gdal.OF_RASTER | gdal.OF_READONLY)
+            if dataset is None: raise FileNotFoundError("Unable to open terrain file: " + self.terrain_file)
+            self.local.dataset = dataset
+        return dataset
+
+    def getband(self, level=0):
+        """
+        Gets terrain elevation band for current thread at pyramid level
+        """
+
+        band = self.getdataset().GetRasterBand(1)
+        if level == 0: return band
+        return band.GetOverview(level - 1)
+
+    def lnglattomap(self, lon, lat):
+        """
+        Transforms single lng, lat to raster CRS
+        """
+
+        mapx, mapy, *_ = self.transform.TransformPoint(lon, lat)
+        return mapx, mapy
+
+    def maptopixel(self, mapx, mapy):
+        """
+        Converts raster CRS position to integer pixel position
+        """
+
+        px, py = gdal.ApplyGeoTransform(self.geotransform_inv, mapx, mapy)
+        return int(px), int(py)
+
+    def getelevation(self, lon, lat):
+        """
+        Gets elevation for single lng, lat, returning elevation and position in raster CRS
+        """
+
+        mapx, mapy = self.lnglattomap(lon, lat)
+        px, py = self.maptopixel(mapx, mapy)
+        elevation_value = self.getband().ReadAsArray(px, py, 1, 1)
+        return elevation_value[0][0], mapx, mapy
+
+    def getelevations(self, lons, lats):
+        """
+        Gets elevations for arrays of lng, lat
+        Returns arrays of elevation, mapx, mapy - elevation is NaN for points outside raster or on nodata
+        """
+
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        elevations = np.full(lons.shape, np.nan, dtype=np.float64)
+        if lons.size == 0: return elevations, lons.copy(), lats.copy()
+
+        mapped = np.array(self.transform.TransformPoints(np.column_stack((lons, lats)).tolist()), dtype=np.float64)
+        mapx, mapy = mapped[:, 0], mapped[:, 1]
+        gt_inv = self.geotransform_inv
+        px = np.floor(gt_inv[0] + gt_inv[1] * mapx + gt_inv[2] * mapy).astype(np.int64)
+        py = np.floor(gt_inv[3] + gt_inv[4] * mapx + gt_inv[5] * mapy).astype(np.int64)
+        inside = (px >= 0) & (py >= 0) & (px < self.xsize) & (py < self.ysize)
+        if not inside.any(): return elevations, mapx, mapy
+
+        # Read smallest window covering all points in one go, which is far quicker than per-pixel reads
+        xoff, yoff = int(px[inside].min()), int(py[inside].min())
+        xcount, ycount = int(px[inside].max()) - xoff + 1, int(py[inside].max()) - yoff + 1
+        band = self.getband()
+        if (xcount * ycount) <= TERRAIN_BATCH_WINDOW_MAX_CELLS:
+            window = band.ReadAsArray(xoff, yoff, xcount, ycount)
+            values = window[py[inside] - yoff, px[inside] - xoff].astype(np.float64)
+        else:
+            values = np.array([band.ReadAsArray(int(x), int(y), 1, 1)[0][0] for x, y in zip(px[inside], py[inside])], dtype=np.float64)
+        if self.nodata is not None: values[values == self.nodata] = np.nan
+        elevations[inside] = values
+        return elevations, mapx, mapy
+
+    def readwindow(self, mapx, mapy, radius, level=0):
+        """
+        Reads square window of terrain extending radius (in raster CRS units) around position
+        Returns in-memory dataset with window's geotransform so analysis only touches cells it needs
+        """
+
+        if level >= len(self.levels): raise ValueError("Terrain file has no pyramid level " + str(level))
+        xsize, ysize, gt = self.levels[level]
+        px, py = gdal.ApplyGeoTransform(gdal.InvGeoTransform(gt), mapx, mapy)
+        radius_x, radius_y = int(math.ceil(radius / abs(gt[1]))) + 1, int(math.ceil(radius / abs(gt[5]))) + 1
+        xoff, yoff = max(0, int(px) - radius_x), max(0, int(py) - radius_y)
+        xend, yend = min(xsize, int(px) + radius_x + 1), min(ysize, int(py) + radius_y + 1)
+        if (xend <= xoff) or (yend <= yoff): raise ValueError("Position lies outside terrain raster")
+        xcount, ycount = xend - xoff, yend - yoff
+
+        band = self.getband(level)
+        window = band.ReadAsArray(xoff, yoff, xcount, ycount)
+
+        window_ds = gdal.GetDriverByName('MEM').Create('', xcount, ycount, 1, band.DataType)
+        window_ds.SetGeoTransform((gt[0] + xoff * gt[1] + yoff * gt[2], gt[1], gt[2], gt[3] + xoff * gt[4] + yoff * gt[5], gt[4], gt[5]))
+        window_ds.SetProjection(self.projection)
+        window_band = window_ds.GetRasterBand(1)
+        if self.nodata is not None: window_band.SetNoDataValue(self.nodata)
+        window_band.WriteArray(window)
+        return window_ds
+
+
+def getterrainmtime(terrain_file):
+    """
+    Gets modification time of terrain file, or None if it doesn't exist
+    """
+
+    try:
+        return os.stat(terrain_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def getterrainsampler(terrain_file=None):
+    """
+    Gets process-wide terrain sampler for terrain file, creating it if necessary
+    Sampler is recreated after fork as GDAL handles must not be shared between processes
+    and when terrain file is replaced, eg. by rebuilding terrain pyramid
+    """
+
+    if terrain_file is None: terrain_file = TERRAIN_FILE
+
+    mtime = getterrainmtime(terrain_file)
+    sampler = TERRAIN_SAMPLERS.get(terrain_file)
+    if (sampler is not None) and (sampler.pid == os.getpid()) and (sampler.mtime == mtime): return sampler
+
+    with TERRAIN_SAMPLER_LOCK:
+        sampler = TERRAIN_SAMPLERS.get(terrain_file)
+        if (sampler is None) or (sampler.pid != os.getpid()) or (sampler.mtime != mtime):
+            sampler = TerrainSampler(terrain_file)
+            TERRAIN_SAMPLERS[terrain_file] = sampler
+        return sampler
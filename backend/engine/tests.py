@@ -1,3 +1,213 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from smtplib import SMTPException
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from django.core import mail
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .emailoutbox import queueemail, sendqueuedemails, claimqueuedemails, getemailconnection, getretrydelay, EmailRateLimiter
+from .models import OutgoingEmail
+from .postcodeindex import PostcodeIndex, POSTCODE_INDEX_DTYPE
+from .usercache import BloomFilter
+from .viewshedcache import ViewshedCache
+from .votesummary import encodeleaderboardcursor, decodeleaderboardcursor
+
+
+class LeaderboardCursorTests(SimpleTestCase):
+    """
+    Tests encoding and decoding of leaderboard keyset cursors
+    """
+
+    def test_roundtrip(self):
+        first_vote = datetime(2024, 5, 17, 9, 30, 12, 345678, tzinfo=dt_timezone.utc)
+        summary = SimpleNamespace(votes_total=12, votes_confirmed=7, first_vote=first_vote, pk=4321)
+        cursor = encodeleaderboardcursor(summary, 25)
+        self.assertEqual(decodeleaderboardcursor(cursor), (12, 7, first_vote, 4321, 25))
+
+    def test_cursor_is_url_safe(self):
+        summary = SimpleNamespace(votes_total=1, votes_confirmed=0, first_vote=datetime(2024, 1, 1, tzinfo=dt_timezone.utc), pk=1)
+        cursor = encodeleaderboardcursor(summary, 5)
+        self.assertTrue(all(character.isalnum() or character in '-_=' for character in cursor))
+
+    def test_invalid_cursors(self):
+        for cursor in ['', 'not a cursor', 'é', 'WzEsIDJd']:
+            with self.assertRaises(ValueError): decodeleaderboardcursor(cursor)
+
+
+class PostcodeIndexTests(SimpleTestCase):
+    """
+    Tests prefix search of postcode index, where queries ignore spaces
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.index_file = os.path.join(self.folder, 'postcode-index.npy')
+        names = ['AB1 2CD', 'AB12 3CD', 'AB12 3CE', 'AB13 1AA', 'B1 1AA', 'EC1A 1BB']
+        entries = np.array([(name.encode('ascii'), -2.0 + index, 57.0 - index) for index, name in enumerate(names)], dtype=POSTCODE_INDEX_DTYPE)
+        np.save(self.index_file, entries[np.argsort(entries['name'], kind='stable')])
+        self.index = PostcodeIndex(self.index_file)
+
+    def tearDown(self):
+        del self.index
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_prefix_matches_every_space_position(self):
+        self.assertEqual(self.index.search('ab12', 10), ['AB1 2CD', 'AB12 3CD', 'AB12 3CE'])
+
+    def test_query_spaces_ignored(self):
+        self.assertEqual(self.index.search('AB 12 3', 10), ['AB12 3CD', 'AB12 3CE'])
+
+    def test_limit(self):
+        self.assertEqual(self.index.search('AB1', 2), ['AB1 2CD', 'AB12 3CD'])
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search('ZZ', 10), [])
+        self.assertEqual(self.index.search('AB1é', 10), [])
+
+    def test_get_exact_postcode(self):
+        self.assertEqual(self.index.get('ec1a1bb'), ('EC1A 1BB', 3.0, 52.0))
+        self.assertIsNone(self.index.get('EC1A'))
+
+
+class ViewshedCacheTests(SimpleTestCase):
+    """
+    Tests memory and disk tiers of viewshed cache and invalidation when terrain changes
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.terrain_file = os.path.join(self.folder, 'terrain.tif')
+        with open(self.terrain_file, 'wb') as terrain: terrain.write(b'terrain')
+        self.cache_folder = os.path.join(self.folder, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def getcache(self, memory_maxbytes=1024 * 1024):
+        return ViewshedCache(self.cache_folder, memory_maxbytes, None, self.terrain_file)
+
+    def test_memory_then_disk(self):
+        cache = self.getcache()
+        self.assertEqual(cache.get('key'), (None, None))
+        cache.set('key', b'viewshed')
+        self.assertEqual(cache.get('key'), (b'viewshed', 'memory'))
+
+        # New process has empty memory tier so reads disk tier, then promotes entry to memory
+        cache = self.getcache()
+        self.assertEqual(cache.get('key'), (b'viewshed', 'disk'))
+        self.assertEqual(cache.get('key'), (b'viewshed', 'memory'))
+
+    def test_memory_tier_disabled(self):
+        cache = self.getcache(memory_maxbytes=0)
+        cache.set('key', b'viewshed')
+        self.assertEqual(cache.get('key'), (b'viewshed', 'disk'))
+        self.assertEqual(cache.get('key'), (b'viewshed', 'disk'))
+        self.assertTrue(cache.has('key'))
+
+    def test_memory_eviction(self):
+        cache = self.getcache(memory_maxbytes=20)
+        cache.set('first', b'0123456789')
+        cache.set('second', b'0123456789')
+        cache.get('first')
+        cache.set('third', b'0123456789')
+        self.assertEqual(list(cache.memory.keys()), ['first', 'third'])
+        self.assertEqual(cache.get('second'), (b'0123456789', 'disk'))
+
+    def test_terrain_change_invalidates(self):
+        cache = self.getcache()
+        cache.set('key', b'viewshed')
+        with open(self.terrain_file, 'ab') as terrain: terrain.write(b' updated')
+        self.assertEqual(cache.get('key'), (None, None))
+        self.assertFalse(cache.has('key'))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+
+class BloomFilterTests(SimpleTestCase):
+    """
+    Tests user id bloom filter never gives false negatives and rarely gives false positives
+    """
+
+    def test_membership(self):
+        bloom = BloomFilter(1000, 0.01)
+        userids = ['user-' + str(index) for index in range(1000)]
+        for userid in userids: bloom.add(userid)
+        self.assertTrue(all(userid in bloom for userid in userids))
+        false_positives = sum(('other-' + str(index)) in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class FailingEmailBackend:
+    """
+    Email connection whose every send fails, as if SMTP server rejected it
+    """
+
+    def open(self): return False
+    def close(self): pass
+    def send_messages(self, messages): raise SMTPException("Rejected")
+
+
+@override_settings(EMAIL_OUTBOX_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX_RATE=0, \
+                   EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_DELAY=60, EMAIL_OUTBOX_RETRY_MAX_DELAY=300, EMAIL_OUTBOX_LEASE=600)
+class EmailOutboxTests(TestCase):
+    """
+    Tests claiming, sending and retrying of queued emails
+    """
+
+    def queue(self):
+        return queueemail('Subject', 'Body', 'voter@example.com', 'info@votewind.org')
+
+    def test_retry_delay_doubles_up_to_maximum(self):
+        self.assertEqual([getretrydelay(attempts) for attempts in range(1, 6)], [60, 120, 240, 300, 300])
+
+    def test_sends_due_email(self):
+        email = self.queue()
+        self.assertEqual(sendqueuedemails(getemailconnection(), EmailRateLimiter(0)), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['voter@example.com'])
+
+        email.refresh_from_db()
+        self.assertIsNotNone(email.sent)
+        self.assertIsNone(email.next_attempt)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(sendqueuedemails(getemailconnection(), EmailRateLimiter(0)), (0, 0))
+
+    def test_claim_leases_email(self):
+        email = self.queue()
+        claimed = claimqueuedemails(10, 3)
+        self.assertEqual([claimed_email.pk for claimed_email in claimed], [email.pk])
+
+        # Claimed email is skipped by other senders until lease expires
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt, timezone.now() + timedelta(seconds=590))
+        self.assertEqual(claimqueuedemails(10, 3), [])
+
+        # Sender died before recording result so email is reclaimed once lease expires
+        OutgoingEmail.objects.filter(pk=email.pk).update(next_attempt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([claimed_email.attempts for claimed_email in claimqueuedemails(10, 3)], [2])
+
+    def test_failed_email_retried_with_backoff(self):
+        email = self.queue()
+        self.assertEqual(sendqueuedemails(FailingEmailBackend(), EmailRateLimiter(0)), (0, 1))
+
+        email.refresh_from_db()
+        self.assertIsNone(email.sent)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("Rejected", email.error)
+        self.assertGreater(email.next_attempt, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(sendqueuedemails(FailingEmailBackend(), EmailRateLimiter(0)), (0, 0))
+
+    def test_email_dropped_after_max_attempts(self):
+        email = self.queue()
+        OutgoingEmail.objects.filter(pk=email.pk).update(attempts=2)
+        self.assertEqual(sendqueuedemails(FailingEmailBackend(), EmailRateLimiter(0)), (0, 1))
+
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 3)
+        self.assertIsNone(email.next_attempt)
+        self.assertEqual(claimqueuedemails(10, 3), [])
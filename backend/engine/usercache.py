@@ -0,0 +1,220 @@
+import math
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from collections import OrderedDict
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+# Default user cache settings - can be overridden in settings
+# Shared cache is only used if USER_CACHE_ALIAS is configured in CACHES
+USER_CACHE_ALIAS                    = 'users'
+USER_CACHE_TIMEOUT                  = 60 * 60
+USER_CACHE_SIZE                     = 50000
+
+# Bloom filter of all user ids - false positive rate and minimum capacity
+USER_CACHE_BLOOM_ERROR_RATE         = 0.001
+USER_CACHE_BLOOM_MIN_CAPACITY       = 100000
+
+# Seconds allowed between cookie being signed and its user id being committed, including clock differences between workers
+# Unknown user id whose cookie was signed this long before bloom filter was last refreshed is rejected without database lookup
+USER_CACHE_BLOOM_MARGIN             = 60
+
+# Process-wide user cache
+USER_CACHE                          = None
+USER_CACHE_LOCK                     = threading.Lock()
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings - membership test may give false positives but never false negatives
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round((self.size / capacity) * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def getpositions(self, item):
+        """
+        Gets bit positions of item using double hashing of single digest
+        """
+
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        hash_1, hash_2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(hash_1 + index * hash_2) % self.size for index in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.getpositions(item): self.bits[position >> 3] |= (1 << (position & 7))
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.getpositions(item))
+
+
+class UserCache:
+    """
+    Cache of user ids known to be valid, so verified cookies cost no database lookup for USER_CACHE_TIMEOUT
+    Verified user ids are held in per-process LRU and, if configured, shared cache so other workers also skip database
+    Bloom filter of all user ids rejects unknown user ids without database lookup - as other workers create user ids,
+    filter is only trusted for cookies signed comfortably before it was last refreshed and is refreshed for newer cookies
+    User ids deleted from database stay valid until their cache entries expire
+    """
+
+    def __init__(self, alias, timeout, size):
+        self.alias = alias if alias in settings.CACHES else None
+        self.timeout = timeout
+        self.size = size
+        self.verified = OrderedDict()
+        self.lock = threading.Lock()
+        self.bloom, self.bloom_time = None, 0
+        self.bloom_lock = threading.Lock()
+        self.counters = {'hits': 0, 'shared_hits': 0, 'bloom_rejects': 0, 'bloom_refreshes': 0, 'database_lookups': 0, 'errors': 0}
+
+    def count(self, counter):
+        """
+        Increments counter
+        """
+
+        with self.lock: self.counters[counter] += 1
+
+    def refreshbloom(self):
+        """
+        Adds user ids created since bloom filter was last refreshed, rebuilding filter from all user ids when it is full
+        """
+
+        from .models import UserID
+
+        with self.bloom_lock:
+            # Time is taken before query so every user id committed before it is in filter
+            refresh_time = time.time()
+            # Default ordering is cleared so user ids are read straight from created index rather than sorted
+            userids = UserID.objects.order_by()
+            bloom = self.bloom
+            if bloom is not None:
+                userids = userids.filter(created__gte=datetime.fromtimestamp(self.bloom_time - USER_CACHE_BLOOM_MARGIN, tz=timezone.utc))
+                userids = list(userids.values_list('userid', flat=True))
+                if bloom.count + len(userids) > bloom.capacity: bloom, userids = None, UserID.objects.order_by()
+
+            if bloom is None:
+                capacity = max(getattr(settings, 'USER_CACHE_BLOOM_MIN_CAPACITY', USER_CACHE_BLOOM_MIN_CAPACITY), 2 * userids.count())
+                bloom = BloomFilter(capacity, getattr(settings, 'USER_CACHE_BLOOM_ERROR_RATE', USER_CACHE_BLOOM_ERROR_RATE))
+                userids = userids.values_list('userid', flat=True).iterator(chunk_size=5000)
+
+            for userid in userids: bloom.add(userid)
+            self.bloom, self.bloom_time = bloom, refresh_time
+
+        self.count('bloom_refreshes')
+
+    def remember(self, userid):
+        """
+        Adds verified user id to per-process LRU
+        """
+
+        with self.lock:
+            self.verified[userid] = time.monotonic() + self.timeout
+            self.verified.move_to_end(userid)
+            while len(self.verified) > self.size: self.verified.popitem(last=False)
+
+    def add(self, userid):
+        """
+        Adds newly created user id to cache - should be called once user id has been saved
+        """
+
+        self.remember(userid)
+        bloom = self.bloom
+        if bloom is not None:
+            with self.bloom_lock: bloom.add(userid)
+
+        if self.alias is None: return
+        try:
+            caches[self.alias].set('userid:' + userid, True, self.timeout)
+        except Exception:
+            self.count('errors')
+
+    def isvalid(self, userid, signed_time=None):
+        """
+        Checks whether user id from signed cookie belongs to user
+        signed_time is time cookie was signed, as seconds since epoch, or None if not known
+        """
+
+        from .models import UserID
+
+        with self.lock:
+            expiry = self.verified.get(userid)
+            if (expiry is not None) and (expiry > time.monotonic()):
+                self.verified.move_to_end(userid)
+                self.counters['hits'] += 1
+                return True
+
+        if self.alias is not None:
+            try:
+                shared = caches[self.alias].get('userid:' + userid)
+            except Exception:
+                self.count('errors')
+                shared = None
+            if shared is not None:
+                self.count('shared_hits')
+                self.remember(userid)
+                return True
+
+        if self.bloom is None: self.refreshbloom()
+        if userid not in self.bloom:
+            # Newer cookies may belong to user id created since filter was refreshed so refresh before rejecting
+            if (signed_time is None) or (signed_time >= self.bloom_time - USER_CACHE_BLOOM_MARGIN):
+                self.refreshbloom()
+            if userid not in self.bloom:
+                self.count('bloom_rejects')
+                return False
+
+        self.count('database_lookups')
+        if not UserID.objects.filter(userid=userid).exists(): return False
+        self.add(userid)
+        return True
+
+    def stats(self):
+        """
+        Gets counters and number of user ids held in cache and bloom filter
+        """
+
+        with self.lock:
+            stats = dict(self.counters)
+            stats['verified'] = len(self.verified)
+        bloom = self.bloom
+        stats['bloom'] = {'count': bloom.count, 'capacity': bloom.capacity, 'bytes': len(bloom.bits)} if bloom is not None else None
+        return stats
+
+
+def getcookieuserid(request):
+    """
+    Gets (userid, time cookie was signed) from user's signed cookie, with None for time if it can't be read
+    Raises KeyError if user has no cookie and BadSignature if cookie is invalid
+    """
+
+    userid = request.get_signed_cookie(settings.COOKIE_NAME, salt=settings.SECRET_KEY)
+    try:
+        # Signed cookies are 'value:timestamp:signature' with timestamp in base 62
+        signed_time = signing.b62_decode(request.COOKIES[settings.COOKIE_NAME].rsplit(':', 2)[1])
+    except (IndexError, ValueError):
+        signed_time = None
+    return userid, signed_time
+
+def getusercache():
+    """
+    Gets process-wide user cache
+    """
+
+    global USER_CACHE
+
+    if USER_CACHE is not None: return USER_CACHE
+
+    with USER_CACHE_LOCK:
+        if USER_CACHE is None:
+            USER_CACHE = UserCache( getattr(settings, 'USER_CACHE_ALIAS', USER_CACHE_ALIAS), \
+                                    getattr(settings, 'USER_CACHE_TIMEOUT', USER_CACHE_TIMEOUT), \
+                                    getattr(settings, 'USER_CACHE_SIZE', USER_CACHE_SIZE))
+        return USER_CACHE
@@ -1,32 +1,63 @@
 import os
 import json
+import math
 import uuid
+import hashlib
+import time
 import requests
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse
 from time import sleep
-from osgeo import gdal, osr, ogr
-from turfpy.misc import line_arc
-from geojson import Feature as GeoJSONFeature, Point as GeoJSONPoint
 from django.conf import settings
-from django.core.mail import EmailMessage
 from django.core.signing import BadSignature
-from django.contrib.gis.db.models.functions import Distance, Area
+from django.contrib.gis.db.models.functions import Distance, Area, GeometryDistance
 from django.contrib.gis.geos import GEOSGeometry, Point, Polygon, MultiPolygon
+from django.contrib.gis.db.models import PointField
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db.models import Q, Count, Min
-from django.http import JsonResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection, transaction, OperationalError
+from django.db.models import Q, Count, Max, Value
+from django.http import JsonResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.template.loader import render_to_string, get_template
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.views.decorators.csrf import csrf_exempt
-
-from .models import Postcode, Place, Boundary, UserID, Vote, Organisation, WindSpeed, Substation
+from django.views.decorators.http import condition
+
+from .models import Postcode, Place, Boundary, UserID, Vote, VoteSummary, Organisation, WindSpeed, Substation
+from .emailoutbox import queueemail
+from .usercache import getusercache, getcookieuserid
+from .votesummary import refreshvotesummaries, resolvevoteareas, getleaderboardpage, getleaderboardcount
+from .viewshed import \
+    generatecirclefeatures, streamfeaturecollection, GetBatchViewshedContent, \
+    VIEWSHED_ENGINES, VIEWSHED_ENGINE_DEFAULT, \
+    VIEWSHED_POLYGONIZERS, VIEWSHED_POLYGONIZE_DEFAULT, VIEWSHED_POLYGONIZE_VECTOR, VIEWSHED_SIMPLIFY_ZOOM_DEFAULT, \
+    VIEWSHED_TERRAINS, VIEWSHED_TERRAIN_DEFAULT, VIEWSHED_TERRAIN_PYRAMID
+from .terrainsampler import TERRAIN_PYRAMID_FILE
+from .postcodeindex import getpostcodeindex
+from .suggestionindex import getsuggestionindex
+from .windspeedgrid import getwindspeedgrid
+from .boundaryindex import getboundaryindex
+from .responsecache import getresponsecache, quantiseposition, getdataversion
+from .viewshedcache import getviewshedcache, getprecomputedviewshedstore, getviewshedcachekey, getcumulativeviewshedcachekey, getterrainstamp
+from .viewshedworkers import getviewshedexecutor, computeviewshedfeatures, computecumulativeviewshed, ViewshedQueueFull, VIEWSHED_TIMEOUT, VIEWSHED_RETRY_AFTER
 
 # Number of results to return in a text query on postcodes/places
 NUMBER_RESULTS_RETURNED = 26
 
+# Location search modes - 'prefix' matches start of names while 'fuzzy' ranks names by trigram word similarity
+LOCATION_SEARCH_MODE_PREFIX         = 'prefix'
+LOCATION_SEARCH_MODE_FUZZY          = 'fuzzy'
+LOCATION_SEARCH_MODES               = [LOCATION_SEARCH_MODE_PREFIX, LOCATION_SEARCH_MODE_FUZZY]
+
+# Default fuzzy search limits - can be overridden in settings
+LOCATION_SEARCH_FUZZY_THRESHOLD     = 0.5       # Minimum pg_trgm word similarity of query to name
+LOCATION_SEARCH_FUZZY_BUDGET        = 0.25      # Total seconds allowed for fuzzy queries
+LOCATION_SEARCH_FUZZY_MINLENGTH     = 3         # Shorter queries have too few trigrams to match meaningfully
+
 # Coordinate precision to use when defining turbine positions - crucial to allow the 'same' turbine to be voted for, ie. 'same' within a certain tolerance
 COORDINATE_PRECISION = 5
 
@@ -38,12 +69,35 @@ DEFAULT_HEIGHT_TO_TIP               = 124.2     # Based on openwind's own manual
 DEFAULT_BLADE_RADIUS                = 47.8      # Based on openwind's own manual data on all large (>=75 m to tip-height) failed and successful UK onshore wind projects
 DEFAULT_HUB_HEIGHT                  = DEFAULT_HEIGHT_TO_TIP - DEFAULT_BLADE_RADIUS
 
-# Default viewshed parameters
-VIEWSHED_MAX_CIRCULAR_RANGE         = float(45000) # 45km
-VIEWSHED_MAX_DISTANCE               = float((2 * (VIEWSHED_MAX_CIRCULAR_RANGE ** 2)) ** 0.5)
+# Precision to use for hub height / blade radius when caching viewsheds
+VIEWSHED_HEIGHT_PRECISION           = 1
+
+# Maximum number of turbines in batch viewshed and interval between attempts to queue its computations
+VIEWSHED_BATCH_MAX_TURBINES         = 20
+VIEWSHED_BATCH_SUBMIT_INTERVAL      = 0.1
+
+# Maximum number of positions in single wind speed batch request
+WINDSPEED_BATCH_MAX_POSITIONS       = 1000
+
+# Vote vector tiles - positions are clustered on grid of VOTES_TILE_CLUSTER_PIXELS tile pixels below VOTES_TILE_CLUSTER_MAXZOOM
+VOTES_TILE_LAYER                    = 'votes'
+VOTES_TILE_EXTENT                   = 4096
+VOTES_TILE_BUFFER                   = 64
+VOTES_TILE_MAXZOOM                  = 22
+VOTES_TILE_CLUSTER_MAXZOOM          = 10
+VOTES_TILE_CLUSTER_PIXELS           = 256
+VOTES_TILE_WORLD_WIDTH              = 40075016.68557849     # Width of EPSG:3857 world in metres
+
+# Leaderboard default and maximum number of turbine positions per page
+LEADERBOARD_PAGESIZE                = 5
+LEADERBOARD_MAX_PAGESIZE            = 100
 
-# Terrain file to be used for generating viewshed
-TERRAIN_FILE                        = os.path.dirname(os.path.realpath(__file__)) + '/terrain/terrain_lowres_withfeatures.tif'
+# Nearest substation search - KNN candidates initially fetched per substation returned and maximum substations returned
+SUBSTATION_KNN_OVERFETCH            = 2
+SUBSTATION_MAX_NUMBER               = 20
+
+# Maximum relative difference between sphere distance used by geography KNN index and spheroid distance results are ranked by
+SUBSTATION_KNN_SPHERE_ERROR         = 0.005
 
 
 def OutputJson(json_array={'result': 'failure'}):
@@ -53,19 +107,133 @@ def OutputJson(json_array={'result': 'failure'}):
 def OutputError():
     return OutputJson()
 
-@csrf_exempt
-def LocationSearch(request):
+def cachedresponse(endpoint, parts, function, *args):
     """
-    Carries out location search based on input query using Postcode, Place and Boundary tables
+    Gets response of read-mostly endpoint from response cache using normalised inputs parts,
+    generating it with function(*args) if not cached
+    Only successful responses are cached
+    """
+
+    response_cache = getresponsecache()
+    cached = response_cache.get(endpoint, parts)
+    if cached is not None:
+        content_type, content = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Response-Cache'] = 'hit'
+        return response
+
+    response = function(*args)
+    if response.status_code == 200: response_cache.set(endpoint, parts, response['Content-Type'], response.content)
+    response['X-Response-Cache'] = 'miss'
+    return response
+
+def quantiseviewshedparameters(longitude, latitude, hubheight, bladeradius):
+    """
+    Quantises viewshed parameters so requests for 'same' turbine share cached and precomputed viewsheds
+    """
+
+    return  round(longitude, COORDINATE_PRECISION), round(latitude, COORDINATE_PRECISION), \
+            round(hubheight, VIEWSHED_HEIGHT_PRECISION), round(bladeradius, VIEWSHED_HEIGHT_PRECISION)
+
+def getdefaultviewshedkey(longitude, latitude):
+    """
+    Gets quantised parameters and cache key of default viewshed for turbine position
+    """
+
+    parameters = quantiseviewshedparameters(longitude, latitude, DEFAULT_HUB_HEIGHT, DEFAULT_BLADE_RADIUS)
+    return parameters, getviewshedcachekey(*parameters, VIEWSHED_ENGINE_DEFAULT, VIEWSHED_POLYGONIZE_DEFAULT, None)
+
+def getviewshedoptions(engine, polygonizer, zoom, terrain):
+    """
+    Validates viewshed options, returning (engine, polygonizer, zoom, terrain, cache_variant)
+    where cache_variant is list of options that viewshed cache key depends on
+    """
+
+    if engine not in VIEWSHED_ENGINES: engine = VIEWSHED_ENGINE_DEFAULT
+    if polygonizer not in VIEWSHED_POLYGONIZERS: polygonizer = VIEWSHED_POLYGONIZE_DEFAULT
+    # Zoom only affects output of vector polygonizer so don't let it fragment cache otherwise
+    if polygonizer != VIEWSHED_POLYGONIZE_VECTOR: zoom = None
+    if terrain not in VIEWSHED_TERRAINS: terrain = VIEWSHED_TERRAIN_DEFAULT
+    # Fall back to single terrain raster if pyramid hasn't been built
+    if (terrain == VIEWSHED_TERRAIN_PYRAMID) and (not os.path.isfile(TERRAIN_PYRAMID_FILE)): terrain = VIEWSHED_TERRAIN_DEFAULT
+
+    cache_variant = [engine, polygonizer, zoom]
+    # Cache is invalidated when main terrain file changes so pyramid viewsheds also need stamp of pyramid
+    if terrain == VIEWSHED_TERRAIN_PYRAMID: cache_variant += [terrain, getterrainstamp(TERRAIN_PYRAMID_FILE)]
+
+    return engine, polygonizer, zoom, terrain, cache_variant
+
+def getstoredviewshed(viewshed_cache, cache_key):
+    """
+    Gets serialised viewshed from viewshed cache or, failing that, store of precomputed viewsheds
+    Returns (content, tier) with content None if viewshed needs computing
+    """
+
+    geojson_content, cache_tier = viewshed_cache.get(cache_key)
+    if geojson_content is not None: return geojson_content, cache_tier
+
+    # Voted turbine positions have viewsheds precomputed
+    geojson_content, _ = getprecomputedviewshedstore().get(cache_key)
+    if geojson_content is None: return None, None
+
+    viewshed_cache.setmemory(cache_key, geojson_content)
+    return geojson_content, 'precomputed'
+
+def getviewshedstorer(viewshed_store, cache_key, longitude, latitude):
+    """
+    Gets completion callback storing computed viewshed features, with distance circles, in viewshed cache or precomputed store
+    """
+
+    def storeviewshed(viewshed_features):
+        viewshed_store.set(cache_key, b''.join(streamfeaturecollection([generatecirclefeatures(longitude, latitude), viewshed_features])))
+
+    return storeviewshed
+
+def submitviewshed(key, function, *args, deadline=None, oncomplete=None):
+    """
+    Submits computation to viewshed executor, waiting for space in its queue until deadline
+    Returns (future, created) and raises ViewshedQueueFull if there's no space by deadline
+    """
+
+    executor = getviewshedexecutor()
+    while True:
+        try:
+            return executor.submit(key, function, *args, oncomplete=oncomplete)
+        except ViewshedQueueFull:
+            if (deadline is None) or (time.monotonic() >= deadline): raise
+            sleep(VIEWSHED_BATCH_SUBMIT_INTERVAL)
+
+def queueviewshedprecompute(longitude, latitude):
+    """
+    Queues precomputation of default viewshed for turbine position if it hasn't already been precomputed
+    Precomputation runs in background so only uses idle workers and never takes queue space from viewshed requests
+    If viewshed workers are busy precomputation is skipped - engine/precomputeviewsheds.py will catch up
+    Precomputation is submitted under same key and computation as default viewshed request so either shares the other's
+    computation, with each storing result in its own store
+    """
+
+    parameters, key = getdefaultviewshedkey(longitude, latitude)
+    precomputed_store = getprecomputedviewshedstore()
+    if precomputed_store.has(key): return
+    try:
+        getviewshedexecutor().submit(key, computeviewshedfeatures, *parameters, VIEWSHED_ENGINE_DEFAULT, VIEWSHED_POLYGONIZE_DEFAULT, None, VIEWSHED_TERRAIN_DEFAULT, \
+                                     oncomplete=getviewshedstorer(precomputed_store, key, parameters[0], parameters[1]), background=True)
+    except ViewshedQueueFull:
+        pass
+
+def OutputBusy(retry_after):
+    response = JsonResponse({'result': 'failure', 'error': 'Server busy, please retry'}, status=503)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+def searchlocationsdatabase(query):
+    """
+    Gets set of place, boundary and organisation suggestions whose names start with query (or contain query for organisations)
     """
 
-    query = request.GET.get('query','')
-    query_postcode = query.replace(' ', '').upper()
     query_elements = query.split(", ")
-    results_returned = {}
+    results_returned = set()
 
-    results_returned        = set()
-    results_postcode        = Postcode.objects.filter(search__istartswith=query_postcode).distinct()
     results_boundary        = Boundary.objects.exclude(name__iendswith='ED').filter(name__istartswith=query).distinct()
     results_organisations   = Organisation.objects.filter(type__in=['community-energy-group', 'community-energy-related']).filter(name__icontains=query).distinct()
 
@@ -74,11 +242,92 @@ def LocationSearch(request):
     else:
         results_place = Place.objects.filter(name__istartswith=query).order_by('name').distinct()
 
-    for result in results_postcode:         results_returned.add(result.name)
     for result in results_place:            results_returned.add(result.name + ", " + result.county)
     for result in results_boundary:         results_returned.add(result.name + ' (Area)')
     for result in results_organisations:    results_returned.add(result.name + ' (Organisation)')
 
+    return results_returned
+
+def searchlocationsfuzzy(query, limit):
+    """
+    Gets up to limit place, boundary and organisation suggestions whose names are similar to query, most similar first
+    Queries use pg_trgm GIN indexes so misspelt and partial queries still match
+    All queries share latency budget - query still running when budget runs out is cancelled and suggestions found so far are returned
+    """
+
+    query = query.strip()
+    if len(query) < LOCATION_SEARCH_FUZZY_MINLENGTH: return []
+
+    threshold = getattr(settings, 'LOCATION_SEARCH_FUZZY_THRESHOLD', LOCATION_SEARCH_FUZZY_THRESHOLD)
+    deadline = time.monotonic() + getattr(settings, 'LOCATION_SEARCH_FUZZY_BUDGET', LOCATION_SEARCH_FUZZY_BUDGET)
+
+    # 'Name, County' queries match place name fuzzily and county by prefix
+    query_elements = query.split(", ")
+    results_place = Place.objects.annotate(similarity=TrigramWordSimilarity(query_elements[0], 'name')).filter(name__trigram_word_similar=query_elements[0])
+    if len(query_elements) == 2: results_place = results_place.filter(county__istartswith=query_elements[1])
+    results_boundary = Boundary.objects.exclude(name__iendswith='ED').annotate(similarity=TrigramWordSimilarity(query, 'name')).filter(name__trigram_word_similar=query)
+    results_organisations = Organisation.objects.filter(type__in=['community-energy-group', 'community-energy-related']) \
+                                                .annotate(similarity=TrigramWordSimilarity(query, 'name')).filter(name__trigram_word_similar=query)
+
+    searches = [
+        (results_place.values_list('name', 'county', 'similarity'), lambda row: row[0] + ", " + row[1]),
+        (results_boundary.values_list('name', 'similarity'),        lambda row: row[0] + ' (Area)'),
+        (results_organisations.values_list('name', 'similarity'),   lambda row: row[0] + ' (Organisation)'),
+    ]
+
+    results_scored = []
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(threshold)])
+            for queryset, display in searches:
+                remaining = int(1000 * (deadline - time.monotonic()))
+                if remaining <= 0: break
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(remaining)])
+                for row in queryset.order_by('-similarity')[:limit]: results_scored.append((-row[-1], display(row)))
+    except OperationalError:
+        # Statement cancelled by statement_timeout
+        pass
+
+    results_returned = []
+    for _, result in sorted(results_scored):
+        if result not in results_returned: results_returned.append(result)
+    return results_returned[:limit]
+
+@csrf_exempt
+def LocationSearch(request):
+    """
+    Carries out location search based on input query using Postcode, Place and Boundary tables
+    Optional 'mode' parameter selects 'prefix' (default) matching in name order or 'fuzzy' matching in order of similarity
+    """
+
+    query = request.GET.get('query','')
+    query_postcode = query.replace(' ', '').upper()
+    mode = request.GET.get('mode', LOCATION_SEARCH_MODE_PREFIX)
+    if mode not in LOCATION_SEARCH_MODES: return OutputError()
+
+    results_returned        = set()
+    # Only first NUMBER_RESULTS_RETURNED postcodes in name order can appear in results
+    postcode_index          = getpostcodeindex()
+    if postcode_index is not None:
+        results_postcode    = postcode_index.search(query_postcode, NUMBER_RESULTS_RETURNED)
+    else:
+        results_postcode    = [result.name for result in Postcode.objects.filter(search__istartswith=query_postcode).distinct()]
+
+    if mode == LOCATION_SEARCH_MODE_FUZZY:
+        # Postcodes are matched exactly by prefix so come before ranked fuzzy matches
+        results_returned = sorted(set(results_postcode))
+        for result in searchlocationsfuzzy(query, NUMBER_RESULTS_RETURNED):
+            if result not in results_returned: results_returned.append(result)
+        return OutputJson({'query': query, 'mode': mode, 'results': results_returned[:NUMBER_RESULTS_RETURNED]})
+
+    for result in results_postcode:         results_returned.add(result)
+
+    suggestion_index        = getsuggestionindex()
+    if suggestion_index is not None:
+        results_returned.update(suggestion_index.search(query, NUMBER_RESULTS_RETURNED))
+    else:
+        results_returned.update(searchlocationsdatabase(query))
+
     results_returned = sorted(list(results_returned))
     results_returned = results_returned[:NUMBER_RESULTS_RETURNED]
 
@@ -105,11 +354,33 @@ def LocationGet(request):
     Retrieves location information for specific location
     """
 
-    query = request.GET.get('query','').strip().replace(' (Area)', '')
+    query = request.GET.get('query','').strip()
+    return cachedresponse('locationget', [query], getlocation, query)
+
+def getlocation(query):
+    """
+    Gets location information response for specific location
+    """
+
+    # Suggestions returned by LocationSearch are answered from suggestion index without database
+    suggestion_index = getsuggestionindex()
+    if suggestion_index is not None:
+        results_returned = suggestion_index.get(query)
+        if results_returned is not None: return OutputJson({'results': results_returned})
+
+    query = query.replace(' (Area)', '')
     query_postcode = query.replace(' ', '').upper()
     query_elements = query.split(", ")
     results_returned = {}
 
+    # Postcode only applies if no place or boundary has same name as these take priority
+    postcode_index = getpostcodeindex()
+    if (suggestion_index is not None) and (postcode_index is not None) and \
+        ('(Organisation)' not in query) and (len(query_elements) != 2) and (not suggestion_index.hasname(query)):
+        results_postcode = postcode_index.get(query_postcode)
+        if results_postcode is not None:
+            return OutputJson({'results': {'longitude': results_postcode[1], 'latitude': results_postcode[2], 'type': 'postcode:' + query_postcode}})
+
     if '(Organisation)' in query:
         query = query.replace(' (Organisation)', '')
         results_organisation = Organisation.objects.filter(name=query).first()
@@ -159,6 +430,13 @@ def BoundaryGet(request):
 
     if not query:
         raise Http404("Missing slug")
+    return cachedresponse('boundary', [query], getboundary, query)
+
+def getboundary(query):
+    """
+    Gets boundary extent response for boundary slug
+    """
+
     try:
         boundary = Boundary.objects.filter(slug=query).order_by('-type', 'level').first()
         boundary_extent = boundary.geometry.extent
@@ -196,6 +474,17 @@ def ContainingBoundaries(request):
     except (KeyError, ValueError, KeyError):
         return HttpResponseForbidden("POST variables missing")
 
+    longitude, latitude = quantiseposition(longitude, latitude)
+    return cachedresponse('containingboundaries', [longitude, latitude], getcontainingboundaries, longitude, latitude)
+
+def getcontainingboundaries(longitude, latitude):
+    """
+    Gets response listing boundaries with slugs that contain position
+    """
+
+    boundary_index = getboundaryindex()
+    if boundary_index is not None: return JsonResponse({'success': True, 'results': boundary_index.search(longitude, latitude)})
+
     position = Point(longitude, latitude, srid=4326)
     containing_slugs = (
         Boundary.objects
@@ -285,11 +574,24 @@ def SetCookie(request):
         useragent=useragent
     )
 
+    # Add new user id to verified user cache so user's first requests need no database lookup
+    getusercache().add(userid)
+
     return response
 
+def disableuservotes(userid):
+    """
+    Disables all live votes of user in single statement, returning positions of disabled votes
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE " + Vote._meta.db_table + " SET live = false WHERE userid = %s AND live = true RETURNING ST_AsEWKB(geometry)", [userid])
+        return [GEOSGeometry(memoryview(row[0])) for row in cursor.fetchall() if row[0] is not None]
+
 def CreateVote(request, vote_parameters):
     """
     Creates actual vote
+    Disabling user's previous votes, creating vote and queuing any confirmation email happen in single transaction
     """
 
     userid, email, token, defaultlive = '', '', '', False
@@ -302,40 +604,48 @@ def CreateVote(request, vote_parameters):
             token = uuid.uuid4().hex
 
     if 'userid' in vote_parameters:
-        # Disable all existing votes from user if using userid
-        Vote.objects.filter(userid=vote_parameters['userid']).update(live=False)
         userid = vote_parameters['userid']
         defaultlive = True
 
     # Ensure turbine position accuracy is no greater than COORDINATE_PRECISION to more easily enable multiple votes for same position
-    vote_object = Vote.objects.create(  userid=userid,
-                                        email=email,
-                                        internetip=vote_parameters['internetip'],
-                                        useragent=vote_parameters['useragent'],
-                                        geometry=Point(round(vote_parameters['turbineposition']['longitude'], COORDINATE_PRECISION), round(vote_parameters['turbineposition']['latitude'], COORDINATE_PRECISION), srid=4326),
-                                        userposition=Point(vote_parameters['userposition']['longitude'], vote_parameters['userposition']['latitude'], srid=4326),
-                                        userposition_type=vote_parameters['userposition_type'],
-                                        live=defaultlive,
-                                        token=token,
-                                        confirmed=False )
-
-    if email != '':
-        # Attempt to send vote confirmation email
-        from_email = '"VoteWind.org" <info@votewind.org>'
-        subject = "VoteWind.org: Confirm your wind turbine vote"
-        current_site = get_current_site(request)
-        email_parameters = {}
-        email_parameters['email'] = email
-        email_parameters['domain'] = current_site.domain
-        email_parameters['uid'] = urlsafe_base64_encode(force_bytes(vote_object.pk))
-        email_parameters['token'] = token
-        email_parameters['site'] = {    \
-                                        'longitude': round(vote_parameters['turbineposition']['longitude'], COORDINATE_PRECISION), \
-                                        'latitude': round(vote_parameters['turbineposition']['latitude'], COORDINATE_PRECISION) 
-                                    }
-        confirmation_message = render_to_string('engine/confirm_vote.html', email_parameters)
-        confirmation_message = EmailMessage(subject, confirmation_message, from_email=from_email, to=[email_parameters['email']])
-        confirmation_message.send()
+    longitude = round(vote_parameters['turbineposition']['longitude'], COORDINATE_PRECISION)
+    latitude = round(vote_parameters['turbineposition']['latitude'], COORDINATE_PRECISION)
+
+    with transaction.atomic():
+        # Disable all existing votes from user if using userid, or from cookie user if voting with email
+        changed_geometries = []
+        disable_userid = vote_parameters.get('userid', vote_parameters.get('cookieuserid', ''))
+        if disable_userid != '': changed_geometries = disableuservotes(disable_userid)
+
+        vote_object = Vote.objects.create(  userid=userid,
+                                            email=email,
+                                            internetip=vote_parameters['internetip'],
+                                            useragent=vote_parameters['useragent'],
+                                            geometry=Point(longitude, latitude, srid=4326),
+                                            userposition=Point(vote_parameters['userposition']['longitude'], vote_parameters['userposition']['latitude'], srid=4326),
+                                            userposition_type=vote_parameters['userposition_type'],
+                                            live=defaultlive,
+                                            token=token,
+                                            confirmed=False )
+
+        if email != '':
+            # Queue vote confirmation email - it is sent by engine/sendemails.py so vote doesn't wait on SMTP
+            from_email = '"VoteWind.org" <info@votewind.org>'
+            subject = "VoteWind.org: Confirm your wind turbine vote"
+            current_site = get_current_site(request)
+            email_parameters = {}
+            email_parameters['email'] = email
+            email_parameters['domain'] = current_site.domain
+            email_parameters['uid'] = urlsafe_base64_encode(force_bytes(vote_object.pk))
+            email_parameters['token'] = token
+            email_parameters['site'] = {'longitude': longitude, 'latitude': latitude}
+            confirmation_message = render_to_string('engine/confirm_vote.html', email_parameters)
+            queueemail(subject, confirmation_message, email_parameters['email'], from_email)
+
+        # Summaries and precomputed viewsheds are derived from committed votes so are only updated once vote is committed
+        vote_geometry = vote_object.geometry
+        transaction.on_commit(lambda: refreshvotesummaries(changed_geometries + [vote_geometry]))
+        transaction.on_commit(lambda: queueviewshedprecompute(vote_parameters['turbineposition']['longitude'], vote_parameters['turbineposition']['latitude']))
 
 @csrf_exempt
 def HasValidCookie(request):
@@ -344,13 +654,12 @@ def HasValidCookie(request):
     """
 
     try:
-        userid = request.get_signed_cookie(settings.COOKIE_NAME, salt=settings.SECRET_KEY)
-        userid_record = UserID.objects.filter(userid=userid).first()
-        if userid_record is None: return JsonResponse({'valid': False})
-        return JsonResponse({'valid': True})
+        userid, signed_time = getcookieuserid(request)
     except (KeyError, BadSignature):
         return JsonResponse({'valid': False})
 
+    return JsonResponse({'valid': getusercache().isvalid(userid, signed_time)})
+
 @csrf_exempt
 def GetWindSpeed(request):
     """
@@ -364,195 +673,180 @@ def GetWindSpeed(request):
     except (KeyError, ValueError, KeyError):
         return HttpResponseForbidden("POST variables missing")
 
+    longitude, latitude = quantiseposition(longitude, latitude)
+    return cachedresponse('windspeed', [longitude, latitude], getwindspeed, longitude, latitude)
+
+def getwindspeed(longitude, latitude):
+    """
+    Gets wind speed response for position
+    """
+
+    windspeed_grid = getwindspeedgrid()
+    if windspeed_grid is not None: return JsonResponse({'windspeed': windspeed_grid.get(longitude, latitude)})
+
+    return JsonResponse({'windspeed': getwindspeeddatabase(longitude, latitude)})
+
+def getwindspeeddatabase(longitude, latitude):
+    """
+    Gets wind speed for position from WindSpeed table - used if wind speed grid hasn't been built
+    """
+
     position = Point(longitude, latitude, srid=4326)
     windspeed_obj = WindSpeed.objects.filter(geometry__contains=position).first()
     windspeed = None
     if windspeed_obj: windspeed = round(windspeed_obj.windspeed, 2)
+    return windspeed
+
+@csrf_exempt
+def GetWindSpeeds(request):
+    """
+    Gets wind speeds for many positions or for all wind speed grid cells within bounding box
+    - 'positions': [{'longitude': ..., 'latitude': ...}, ...] returns list of wind speeds in same order
+    - 'bounds': [west, south, east, north] returns list of cell centres with wind speeds
+    """
 
-    return JsonResponse({'windspeed': windspeed})
+    try:
+        data = json.loads(request.body)
+        if 'bounds' in data:
+            bounds = [float(value) for value in data['bounds']]
+            if len(bounds) != 4: raise ValueError
+            if not all(math.isfinite(value) for value in bounds): raise ValueError
+            if (bounds[0] >= bounds[2]) or (bounds[1] >= bounds[3]): raise ValueError
+        else:
+            bounds = None
+            positions = [(float(position['longitude']), float(position['latitude'])) for position in data['positions']]
+            if not all(math.isfinite(longitude) and math.isfinite(latitude) for longitude, latitude in positions): raise ValueError
+    except (KeyError, ValueError, TypeError):
+        return HttpResponseForbidden("POST variables missing")
+
+    windspeed_grid = getwindspeedgrid()
+
+    if bounds is not None:
+        if windspeed_grid is None: return HttpResponse("Wind speed grid not available", status=503)
+        cells = windspeed_grid.getbounds(*bounds)
+        if cells is None: return OutputError()
+        return JsonResponse({'cells': [{'longitude': longitude, 'latitude': latitude, 'windspeed': windspeed} for longitude, latitude, windspeed in cells]})
+
+    if len(positions) > WINDSPEED_BATCH_MAX_POSITIONS: return OutputError()
+    if len(positions) == 0: return JsonResponse({'windspeeds': []})
+
+    if windspeed_grid is not None:
+        longitudes, latitudes = zip(*positions)
+        windspeeds = windspeed_grid.getmany(longitudes, latitudes)
+    else:
+        windspeeds = [getwindspeeddatabase(longitude, latitude) for longitude, latitude in positions]
+
+    return JsonResponse({'windspeeds': windspeeds})
 
 @csrf_exempt
 def GetSubstation(request):
     """
     Gets nearest substation for specific longitude/latitude
+    Optional 'number' returns list of that many nearest substations and optional 'minimumvoltage' excludes lower voltage substations
     """
 
     try:
         data = json.loads(request.body)
         longitude = float(data['position']['longitude'])
         latitude = float(data['position']['latitude'])
-    except (KeyError, ValueError, KeyError):
+        number = int(data['number']) if 'number' in data else None
+        minimumvoltage = float(data['minimumvoltage']) if data.get('minimumvoltage') is not None else None
+    except (KeyError, ValueError, TypeError):
         return HttpResponseForbidden("POST variables missing")
 
+    if (number is not None) and ((number < 1) or (number > SUBSTATION_MAX_NUMBER)): return OutputError()
+
+    longitude, latitude = quantiseposition(longitude, latitude)
+    return cachedresponse('substation', [longitude, latitude, number, minimumvoltage], getsubstation, longitude, latitude, number, minimumvoltage)
+
+def getsubstation(longitude, latitude, number, minimumvoltage):
+    """
+    Gets nearest substation response for position
+    """
+
+    nearest_substations = getnearestsubstations(longitude, latitude, number or 1, minimumvoltage)
+    if len(nearest_substations) == 0: nearest_substations = getnearestsubstationsdatabase(longitude, latitude, number or 1, minimumvoltage)
+
+    results = [serialisesubstation(substation) for substation in nearest_substations]
+    if number is None: results = results[0] if len(results) != 0 else None
+
+    return JsonResponse({'success': True, 'results': results})
+
+def getnearestsubstations(longitude, latitude, number, minimumvoltage=None):
+    """
+    Gets number nearest non-traction substations to position using KNN index on geography substation centroids
+    Index orders by distance on sphere so candidates are re-ranked by spheroid distance, fetching more candidates
+    until every substation not fetched is provably further away than those returned
+    """
+
     position = Point(longitude, latitude, srid=4326)
-    nearest_substation = (
-        Substation.objects
-        .exclude(substation='traction')
-        .annotate(distance=Distance('geometry', position))
-        .order_by('distance')
-        .first()
-    )
-    geometry = nearest_substation.geometry
-    if geometry.geom_type != 'Point': geometry = geometry.centroid
-
-    results = {
-        "name": nearest_substation.name,
-        "operator": nearest_substation.operator,
-        "voltage": nearest_substation.voltage,
-        "substation": nearest_substation.substation,
-        "power": nearest_substation.power,
-        "distance_km": round(nearest_substation.distance.km, 2),
+    substations = Substation.objects.exclude(substation='traction').exclude(centroid__isnull=True)
+    if minimumvoltage is not None: substations = substations.filter(voltage__gte=minimumvoltage)
+
+    candidates = substations.annotate( knn_distance=GeometryDistance('centroid', Value(position, output_field=PointField(srid=4326, geography=True))), \
+                                       distance=Distance('centroid', position)).order_by('knn_distance')
+
+    fetch = number * SUBSTATION_KNN_OVERFETCH
+    while True:
+        fetched = list(candidates[:fetch])
+        nearest = sorted(fetched, key=lambda substation: substation.distance.m)[:number]
+        if (len(fetched) < fetch) or (len(nearest) == 0): return nearest
+        # Substations not fetched are at least as far as last candidate on sphere
+        if nearest[-1].distance.m <= fetched[-1].knn_distance * (1 - SUBSTATION_KNN_SPHERE_ERROR): return nearest
+        fetch *= 2
+
+def getnearestsubstationsdatabase(longitude, latitude, number, minimumvoltage=None):
+    """
+    Gets number nearest non-traction substations to position by distance to full geometry of every substation
+    Used if substation centroids haven't been stored
+    """
+
+    position = Point(longitude, latitude, srid=4326)
+    substations = Substation.objects.exclude(substation='traction')
+    if minimumvoltage is not None: substations = substations.filter(voltage__gte=minimumvoltage)
+
+    return list(substations.annotate(distance=Distance('geometry', position)).order_by('distance')[:number])
+
+def serialisesubstation(substation):
+    """
+    Gets dictionary of substation properties, distance and position
+    """
+
+    geometry = substation.centroid
+    if geometry is None:
+        geometry = substation.geometry
+        if geometry.geom_type != 'Point': geometry = geometry.centroid
+
+    return {
+        "name": substation.name,
+        "operator": substation.operator,
+        "voltage": substation.voltage,
+        "substation": substation.substation,
+        "power": substation.power,
+        "distance_km": round(substation.distance.km, 2),
         "position": {
             "latitude": geometry.y,
             "longitude": geometry.x
         }
     }
-    return JsonResponse({'success': True, 'results': results})
 
-def returncirclesforpoint(lng, lat):
-    center = GeoJSONFeature(geometry=GeoJSONPoint((lng, lat)))
-    bearing1 = 0
-    bearing2 = 359.99999
+def CacheStats(request):
+    """
+    Gets hit rates of response, user and viewshed caches - staff only
+    Counters are per worker process so each request reports worker that served it
+    """
 
-    features = []
-    steps = [5, 10, 15, 20, 25, 30, 35, 40]
-    stepdistance = 10
-    for step_index in range(len(steps)):
-        radius = steps[step_index]
-        feature = line_arc(center=center, radius=radius, bearing1=bearing1, bearing2=bearing2)
-        feature['properties'] = {'class': 'Distance_Circle', 'distance': str(radius) + 'km'}
-        features.append(feature)
-        feature_coordinates = feature['geometry']['coordinates']
-        point_label_coordinates = feature_coordinates[int(len(feature_coordinates) / 2)]
-        feature_point = {'type': 'Feature', 'name': str(radius) + 'km', 'properties': {'name': str(radius) + 'km', 'class': 'Distance_Circle_Label'}, 'geometry': {'type': 'Point', 'coordinates': point_label_coordinates}}
-        features.append(feature_point)
-
-    return features
-
-def getelevationforpoint(lon, lat):
-    global TERRAIN_FILE
-    # With thanks to https://stackoverflow.com/questions/74026802/get-elevation-from-lat-long-of-geotiff-data-in-gdal
-    ds = gdal.OpenEx(TERRAIN_FILE)
-    raster_proj = ds.GetProjection()
-    gt = ds.GetGeoTransform()
-    ds = None
-    source_srs = osr.SpatialReference()
-    source_srs.ImportFromWkt(osr.GetUserInputAsWKT("urn:ogc:def:crs:OGC:1.3:CRS84"))
-    target_srs = osr.SpatialReference()
-    target_srs.ImportFromWkt(raster_proj)
-    ct = osr.CoordinateTransformation(source_srs, target_srs)
-    mapx, mapy, *_ = ct.TransformPoint(lon, lat)
-    gt_inv = gdal.InvGeoTransform(gt) 
-    px, py = gdal.ApplyGeoTransform(gt_inv, mapx, mapy)
-    py = int(py)
-    px = int(px)
-    ds = gdal.OpenEx(TERRAIN_FILE)
-    elevation_value = ds.ReadAsArray(px, py, 1, 1)
-    ds = None
-    elevation = elevation_value[0][0]
-    return elevation, mapx, mapy
-
-def GetViewsheds(lon, lat, hubheight, bladeradius):
-    global TERRAIN_FILE
-
-    uniqueid = str(lon) + '_' + str(lat) + '_' + str(hubheight) + '_' + str(bladeradius)
-    groundheight, observerX, observerY = getelevationforpoint(lon, lat)
-    towerheight = hubheight
-    turbinetip = hubheight + bladeradius
-    towerheight_outfile = uniqueid + "_tower.tif"
-    turbinetip_outfile = uniqueid + "_tip.tif"
-    towerheight_outfile = '/vsimem/' + uniqueid + "_tower.tif"
-    turbinetip_outfile = '/vsimem/' + uniqueid + "_tip.tif"
-
-    src_ds = gdal.Open(TERRAIN_FILE)
-
-    gdal.ViewshedGenerate(
-        srcBand = src_ds.GetRasterBand(1),
-        driverName = 'GTiff',
-        targetRasterName = towerheight_outfile,
-        creationOptions = [],
-        observerX = observerX,
-        observerY = observerY,
-        observerHeight = int(towerheight + 0.5),
-        targetHeight = 1.5,
-        visibleVal = 255.0,
-        invisibleVal = 0.0,
-        outOfRangeVal = 0.0,
-        noDataVal = 0.0,
-        dfCurvCoeff = 1.0,
-        mode = 1,
-        maxDistance = VIEWSHED_MAX_DISTANCE) 
-
-    gdal.ViewshedGenerate(
-        srcBand = src_ds.GetRasterBand(1),
-        driverName = 'GTiff',
-        targetRasterName = turbinetip_outfile,
-        creationOptions = [],
-        observerX = observerX,
-        observerY = observerY,
-        observerHeight = int(turbinetip + 0.5),
-        targetHeight = 1.5,
-        visibleVal = 255.0,
-        invisibleVal = 0.0,
-        outOfRangeVal = 0.0,
-        noDataVal = 0.0,
-        dfCurvCoeff = 1.0,
-        mode = 1,
-        maxDistance = VIEWSHED_MAX_DISTANCE) 
-
-    all_features = distancecircles = returncirclesforpoint(lon, lat)    
-    towerheight_geojson = json.loads(polygonizeraster(uniqueid, towerheight_outfile))
-    turbinetip_geojson = json.loads(polygonizeraster(uniqueid, turbinetip_outfile))
-
-    for feature_index in range(len(towerheight_geojson['features'])):
-        towerheight_geojson['features'][feature_index]['properties']['class'] = 'viewshed_towerheight'
-        all_features.append(towerheight_geojson['features'][feature_index])
-    for feature_index in range(len(turbinetip_geojson['features'])):
-        turbinetip_geojson['features'][feature_index]['properties']['class'] = 'viewshed_turbinetip'
-        all_features.append(turbinetip_geojson['features'][feature_index])
-    
-    featurecollection = {'type': 'FeatureCollection', 'features': all_features}
-
-    return featurecollection
-
-def reprojectrasterto4326(input_file, output_file):
-    warp = gdal.Warp(output_file, gdal.Open(input_file), dstSRS='EPSG:4326')
-    warp = None
-
-def polygonizeraster(uniqueid, raster_file):
-    memory_geojson = '/vsimem/' + uniqueid + ".geojson"
-    memory_transformed_raster = '/vsimem/' + uniqueid + '.tif'
-    reprojectrasterto4326(raster_file, memory_transformed_raster)
-
-    driver = ogr.GetDriverByName("GeoJSON")
-    ds = gdal.OpenEx(memory_transformed_raster)
-    raster_proj = ds.GetProjection()
-    ds = None
-    source_srs = osr.SpatialReference()
-    source_srs.ImportFromWkt(raster_proj)
-    src_ds = gdal.Open(memory_transformed_raster)
-    srs = osr.SpatialReference()
-    srs.ImportFromWkt(src_ds.GetProjection())    
-    srcband = src_ds.GetRasterBand(1)
-
-    dst_ds = driver.CreateDataSource(memory_geojson)
-    dst_layer = dst_ds.CreateLayer("viewshed", srs = source_srs)
-    newField = ogr.FieldDefn('Area', ogr.OFTInteger)
-    dst_layer.CreateField(newField)
-    polygonize = gdal.Polygonize(srcband, srcband, dst_layer, 0, [], callback=None )
-    polygonize = None
-    del dst_ds
-
-    geojson_content = read_file(memory_geojson)
-
-    return geojson_content
-
-def read_file(filename):
-    vsifile = gdal.VSIFOpenL(filename,'r')
-    gdal.VSIFSeekL(vsifile, 0, 2)
-    vsileng = gdal.VSIFTellL(vsifile)
-    gdal.VSIFSeekL(vsifile, 0, 0)
-    return gdal.VSIFReadL(1, vsileng, vsifile)
+    if not request.user.is_staff: return HttpResponseForbidden("Staff only")
+
+    boundary_index = getboundaryindex()
+
+    return OutputJson({ 'pid': os.getpid(), \
+                        'data_version': getdataversion(), \
+                        'boundaries': boundary_index.stats() if boundary_index is not None else None, \
+                        'responses': getresponsecache().stats(), \
+                        'users': getusercache().stats(), \
+                        'viewsheds': getviewshedcache().stats(), \
+                        'viewsheds_precomputed': getprecomputedviewshedstore().stats() })
 
 @csrf_exempt
 def Viewshed(request):
@@ -570,7 +864,12 @@ def Viewshed(request):
         latitude = float(parameters.get('latitude', 51))
         hubheight = float(parameters.get('hub', DEFAULT_HUB_HEIGHT))
         bladeradius = float(parameters.get('blade', DEFAULT_BLADE_RADIUS))
-    except ValueError:
+        engine = str(parameters.get('engine', VIEWSHED_ENGINE_DEFAULT))
+        polygonizer = str(parameters.get('polygonize', VIEWSHED_POLYGONIZE_DEFAULT))
+        zoom = int(float(parameters.get('zoom', VIEWSHED_SIMPLIFY_ZOOM_DEFAULT)))
+        stream = parameters.get('stream', False) in [True, 1, '1', 'true']
+        terrain = str(parameters.get('terrain', VIEWSHED_TERRAIN_DEFAULT))
+    except (ValueError, OverflowError, TypeError, AttributeError):
         longitude = request.GET.get('longitude', None)
         latitude = request.GET.get('latitude', None)
         if (latitude is None) or (longitude is None):
@@ -579,10 +878,156 @@ def Viewshed(request):
         latitude = float(latitude)
         hubheight = float(request.GET.get('hub', DEFAULT_HUB_HEIGHT))
         bladeradius = float(request.GET.get('blade', DEFAULT_BLADE_RADIUS))        
+        engine = request.GET.get('engine', VIEWSHED_ENGINE_DEFAULT)
+        polygonizer = request.GET.get('polygonize', VIEWSHED_POLYGONIZE_DEFAULT)
+        try:
+            zoom = int(float(request.GET.get('zoom', VIEWSHED_SIMPLIFY_ZOOM_DEFAULT)))
+        except (ValueError, OverflowError):
+            zoom = VIEWSHED_SIMPLIFY_ZOOM_DEFAULT
+        stream = request.GET.get('stream', '') in ['1', 'true']
+        terrain = request.GET.get('terrain', VIEWSHED_TERRAIN_DEFAULT)
+
+    engine, polygonizer, zoom, terrain, cache_variant = getviewshedoptions(engine, polygonizer, zoom, terrain)
+    longitude, latitude, hubheight, bladeradius = quantiseviewshedparameters(longitude, latitude, hubheight, bladeradius)
+
+    viewshed_cache = getviewshedcache()
+    cache_key = getviewshedcachekey(longitude, latitude, hubheight, bladeradius, *cache_variant)
+    geojson_content, cache_tier = getstoredviewshed(viewshed_cache, cache_key)
+
+    if geojson_content is not None:
+        response = HttpResponse(geojson_content, content_type="text/json")
+        response['X-Viewshed-Cache'] = cache_tier
+        return response
+
+    # Compute on dedicated worker processes so bursts of viewsheds don't tie up request threads
+    # Concurrent requests for same viewshed share single computation, which caches its own result
+    # so viewshed taking longer than request waits is ready for retry
+    try:
+        future, _ = getviewshedexecutor().submit(cache_key, computeviewshedfeatures, longitude, latitude, hubheight, bladeradius, engine, polygonizer, zoom, terrain, \
+                                                 oncomplete=getviewshedstorer(viewshed_cache, cache_key, longitude, latitude))
+    except ViewshedQueueFull:
+        return OutputBusy(getattr(settings, 'VIEWSHED_RETRY_AFTER', VIEWSHED_RETRY_AFTER))
 
-    geojson = GetViewsheds(longitude, latitude, hubheight, bladeradius)
+    timeout = getattr(settings, 'VIEWSHED_TIMEOUT', VIEWSHED_TIMEOUT)
 
-    return OutputJson(geojson)
+    if stream:
+        # Send distance circles straight away then viewshed features once they're ready
+        response = StreamingHttpResponse(streamviewshed(future, timeout, longitude, latitude), content_type="text/json")
+        response['X-Viewshed-Cache'] = 'miss'
+        return response
+
+    # Worker raises ValueError for position it can't compute, eg. outside terrain raster, and pool breaks if worker dies
+    try:
+        viewshed_features = future.result(timeout=timeout)
+    except (FutureTimeoutError, BrokenProcessPool):
+        return OutputBusy(getattr(settings, 'VIEWSHED_RETRY_AFTER', VIEWSHED_RETRY_AFTER))
+    except ValueError:
+        return OutputError()
+
+    geojson_content = b''.join(streamfeaturecollection([generatecirclefeatures(longitude, latitude), viewshed_features]))
+
+    response = HttpResponse(geojson_content, content_type="text/json")
+    response['X-Viewshed-Cache'] = 'miss'
+    return response
+
+def getviewshederrorfeature(error):
+    """
+    Gets serialised feature without geometry marking streamed viewshed as incomplete, with error in 'error' property
+    """
+
+    properties = {'error': error, 'retry_after': getattr(settings, 'VIEWSHED_RETRY_AFTER', VIEWSHED_RETRY_AFTER)}
+    return json.dumps({'type': 'Feature', 'geometry': None, 'properties': properties}).encode('utf-8')
+
+def streamviewshed(future, timeout, longitude, latitude):
+    """
+    Streams viewshed FeatureCollection, sending distance circles before waiting for viewshed features
+    Once response has started it's too late to return busy response so if computation times out or fails
+    collection is closed with distance circles and final feature whose 'error' property is 'timeout' or 'failed'
+    Computation that times out carries on and caches its result so retry gets full viewshed
+    """
+
+    def getviewshedfeatures():
+        try:
+            viewshed_features = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            yield getviewshederrorfeature('timeout')
+            return
+        except Exception:
+            yield getviewshederrorfeature('failed')
+            return
+        yield from viewshed_features
+
+    yield from streamfeaturecollection([generatecirclefeatures(longitude, latitude), getviewshedfeatures()])
+
+@csrf_exempt
+def ViewshedBatch(request):
+    """
+    Return viewsheds of multiple turbines, eg. wind farm layout, as GeoJSON
+    FeatureCollection features are cumulative visibility polygons with number of turbines visible in 'turbines'
+    and 'turbines' member holds each turbine's own viewshed FeatureCollection in same order as request
+    """
+
+    global DEFAULT_HUB_HEIGHT, DEFAULT_BLADE_RADIUS
+
+    try:
+        parameters = json.loads(request.body)
+        turbines = [quantiseviewshedparameters( float(turbine['longitude']), \
+                                                float(turbine['latitude']), \
+                                                float(turbine.get('hub', DEFAULT_HUB_HEIGHT)), \
+                                                float(turbine.get('blade', DEFAULT_BLADE_RADIUS))) for turbine in parameters['turbines']]
+        engine = str(parameters.get('engine', VIEWSHED_ENGINE_DEFAULT))
+        polygonizer = str(parameters.get('polygonize', VIEWSHED_POLYGONIZE_DEFAULT))
+        zoom = int(float(parameters.get('zoom', VIEWSHED_SIMPLIFY_ZOOM_DEFAULT)))
+        terrain = str(parameters.get('terrain', VIEWSHED_TERRAIN_DEFAULT))
+    except (ValueError, OverflowError, KeyError, TypeError, AttributeError):
+        return OutputError()
+
+    if (len(turbines) == 0) or (len(turbines) > VIEWSHED_BATCH_MAX_TURBINES): return OutputError()
+
+    engine, polygonizer, zoom, terrain, cache_variant = getviewshedoptions(engine, polygonizer, zoom, terrain)
+    viewshed_cache = getviewshedcache()
+    retry_after = getattr(settings, 'VIEWSHED_RETRY_AFTER', VIEWSHED_RETRY_AFTER)
+    deadline = time.monotonic() + getattr(settings, 'VIEWSHED_TIMEOUT', VIEWSHED_TIMEOUT)
+
+    # Turbines already cached are used as they are - remaining turbines are computed in parallel on viewshed workers
+    # sharing cache entries and in-flight computations with single viewshed requests
+    cache_keys = [getviewshedcachekey(*turbine, *cache_variant) for turbine in turbines]
+    turbine_contents, submissions = [], {}
+    for turbine_index, turbine in enumerate(turbines):
+        geojson_content, _ = getstoredviewshed(viewshed_cache, cache_keys[turbine_index])
+        turbine_contents.append(geojson_content)
+        if geojson_content is not None: continue
+        try:
+            submissions[turbine_index] = submitviewshed(cache_keys[turbine_index], computeviewshedfeatures, *turbine, engine, polygonizer, zoom, terrain, deadline=deadline, \
+                                                        oncomplete=getviewshedstorer(viewshed_cache, cache_keys[turbine_index], turbine[0], turbine[1]))
+        except ViewshedQueueFull:
+            return OutputBusy(retry_after)
+
+    try:
+        for turbine_index, (future, _) in submissions.items():
+            viewshed_features = future.result(timeout=max(0, deadline - time.monotonic()))
+            longitude, latitude = turbines[turbine_index][0], turbines[turbine_index][1]
+            turbine_contents[turbine_index] = b''.join(streamfeaturecollection([generatecirclefeatures(longitude, latitude), viewshed_features]))
+    except (FutureTimeoutError, BrokenProcessPool):
+        return OutputBusy(retry_after)
+    except ValueError:
+        return OutputError()
+
+    # Aggregate all turbines into cumulative visibility in single pass
+    cumulative_key = getcumulativeviewshedcachekey(cache_keys, *cache_variant)
+    cumulative_content, _ = viewshed_cache.get(cumulative_key)
+    if cumulative_content is None:
+        latitude = sum(turbine[1] for turbine in turbines) / len(turbines)
+        try:
+            future, _ = submitviewshed(cumulative_key, computecumulativeviewshed, turbine_contents, latitude, polygonizer, zoom, deadline=deadline, \
+                                       oncomplete=lambda content: viewshed_cache.set(cumulative_key, content))
+            cumulative_content = future.result(timeout=max(0, deadline - time.monotonic()))
+        except (ViewshedQueueFull, FutureTimeoutError, BrokenProcessPool):
+            return OutputBusy(retry_after)
+        except ValueError:
+            return OutputError()
+
+    return HttpResponse(GetBatchViewshedContent(cumulative_content, turbine_contents), content_type="text/json")
 
 @csrf_exempt
 def SubmitVote(request):
@@ -613,38 +1058,24 @@ def SubmitVote(request):
     vote_parameters['userposition'] = {'longitude': data['initialposition']['longitude'], 'latitude': data['initialposition']['latitude']}
     vote_parameters['userposition_type'] = data['initialposition']['type']
 
-    if email_set is False:
-        try:
-            userid = request.get_signed_cookie(settings.COOKIE_NAME, salt=settings.SECRET_KEY)
-        except KeyError:
-            return HttpResponseForbidden("Missing signed user cookie.")
-        except Exception:
-            return HttpResponseForbidden("Invalid cookie signature.")
+    # Signed cookie is checked once - email voters with valid cookie also have their earlier cookie votes disabled
+    userid, cookie_error = None, None
+    try:
+        userid, signed_time = getcookieuserid(request)
+        if not getusercache().isvalid(userid, signed_time): userid, cookie_error = None, "No valid user id found for cookie."
+    except KeyError:
+        cookie_error = "Missing signed user cookie."
+    except Exception:
+        cookie_error = "Invalid cookie signature."
 
-        userid_record = UserID.objects.filter(userid=userid).first()
-        if userid_record is None:
-            return HttpResponseForbidden("No valid user id found for cookie.")
-        
+    if email_set is False:
+        if userid is None: return HttpResponseForbidden(cookie_error)
         vote_parameters['userid'] = userid
+    elif userid is not None:
+        vote_parameters['cookieuserid'] = userid
 
     CreateVote(request, vote_parameters)
 
-    if email_set is True:
-        # Deactivate any prior votes same user may have made
-        user_has_valid_cookie = True
-        try:
-            userid = request.get_signed_cookie(settings.COOKIE_NAME, salt=settings.SECRET_KEY)
-        except KeyError:
-            user_has_valid_cookie = False
-        except Exception:
-            user_has_valid_cookie = False
-
-        if user_has_valid_cookie:
-            userid_record = UserID.objects.filter(userid=userid).first()
-            if userid_record is None: user_has_valid_cookie = False
-        
-        if user_has_valid_cookie: Vote.objects.filter(userid=userid).update(live=False)
-
     return JsonResponse({"success": True, "message": "Vote registered"})
 
 @csrf_exempt
@@ -662,10 +1093,13 @@ def ConfirmVote(request, uidb64, token):
         provisionalvote = None
 
     if (provisionalvote is not None) and (provisionalvote.token == token) and (provisionalvote.confirmed == False):
-        Vote.objects.filter(email=provisionalvote.email).filter(~Q(pk=id)).filter(live=True).update(live=False)
+        email_votes = Vote.objects.filter(email=provisionalvote.email).filter(~Q(pk=id)).filter(live=True)
+        changed_geometries = list(email_votes.values_list('geometry', flat=True))
+        email_votes.update(live=False)
         provisionalvote.confirmed = True
         provisionalvote.live = True
         provisionalvote.save()
+        refreshvotesummaries(changed_geometries + [provisionalvote.geometry])
         turbineposition = provisionalvote.geometry.coords
         url_path = str(round(turbineposition[0], COORDINATE_PRECISION)) + '/' + str(round(turbineposition[1], COORDINATE_PRECISION)) + '/vote?type=voteconfirmed'
         return redirect(settings.REACT_APPLICATION_BASEURL + url_path)
@@ -678,14 +1112,15 @@ def Votes(request):
     Get data on all votes
     """
 
-    distinctpoints = Vote.objects.filter(live=True).values('geometry').annotate(Count('id')).order_by()
+    # Vote counts per turbine position are maintained in VoteSummary so all positions come from single query
+    distinctpoints = VoteSummary.objects.values('geometry', 'votes_confirmed', 'votes_unconfirmed')
 
     features = []
     index = 0
     for distinctpoint in distinctpoints:
         index += 1
-        allvotes_confirmed = Vote.objects.filter(live=True).filter(confirmed=True).filter(geometry=distinctpoint['geometry']).count()
-        allvotes_unconfirmed = Vote.objects.filter(live=True).filter(confirmed=False).filter(geometry=distinctpoint['geometry']).count()
+        allvotes_confirmed = distinctpoint['votes_confirmed']
+        allvotes_unconfirmed = distinctpoint['votes_unconfirmed']
         feature = {
             "type": "feature",
             "id": str(index),
@@ -707,6 +1142,79 @@ def Votes(request):
     geojson = { "type": "FeatureCollection", "features": features }
     return OutputJson(geojson)
 
+def getvotetileetag(request, z, x, y):
+    """
+    Gets ETag for vote tiles, which changes whenever vote is created or vote counts change
+    """
+
+    latest_vote = Vote.objects.aggregate(Max('id'))['id__max']
+    summaries = VoteSummary.objects.aggregate(Max('updated'), Count('id'))
+    etag_source = str(latest_vote) + '_' + str(summaries['updated__max']) + '_' + str(summaries['id__count'])
+    return hashlib.sha1(etag_source.encode('utf-8')).hexdigest()
+
+@csrf_exempt
+@condition(etag_func=getvotetileetag)
+def VoteTiles(request, z, x, y):
+    """
+    Gets Mapbox Vector Tile of live vote counts per turbine position
+    Below VOTES_TILE_CLUSTER_MAXZOOM nearby positions are clustered with summed vote counts and number of positions in 'point_count'
+    """
+
+    if (z < 0) or (z > VOTES_TILE_MAXZOOM) or (x < 0) or (y < 0) or (x >= (1 << z)) or (y >= (1 << z)): raise Http404("Tile not found")
+
+    table = VoteSummary._meta.db_table
+    parameters = {  'z': z, 'x': x, 'y': y, \
+                    'extent': VOTES_TILE_EXTENT, \
+                    'buffer': VOTES_TILE_BUFFER, \
+                    'margin': VOTES_TILE_BUFFER / VOTES_TILE_EXTENT, \
+                    'layer': VOTES_TILE_LAYER }
+
+    if z < VOTES_TILE_CLUSTER_MAXZOOM:
+        # Grid is aligned to world rather than tile so same positions form same clusters in neighbouring tiles
+        parameters['cellsize'] = (VOTES_TILE_WORLD_WIDTH / (1 << z)) * VOTES_TILE_CLUSTER_PIXELS / VOTES_TILE_EXTENT
+        # Fetch whole of every cell that may have cluster within tile buffer so cluster totals match in neighbouring tiles
+        parameters['margin'] = (VOTES_TILE_CLUSTER_PIXELS + VOTES_TILE_BUFFER) / VOTES_TILE_EXTENT
+        features_sql = """
+            SELECT  ST_Centroid(ST_Collect(position)) AS position,
+                    SUM(votes_total) AS numvotes,
+                    SUM(votes_confirmed) AS votes_confirmed,
+                    SUM(votes_unconfirmed) AS votes_unconfirmed,
+                    COUNT(*) AS point_count
+            FROM (  SELECT  ST_Transform(geometry, 3857) AS position, votes_total, votes_confirmed, votes_unconfirmed,
+                            ST_SnapToGrid(ST_Transform(geometry, 3857), %(cellsize)s) AS cell
+                    FROM """ + table + """
+                    WHERE geometry && ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), 4326)) AS positions
+            GROUP BY cell"""
+        properties_sql = "numvotes, votes_confirmed, votes_unconfirmed, point_count"
+    else:
+        features_sql = """
+            SELECT  ST_Transform(geometry, 3857) AS position,
+                    votes_total AS numvotes,
+                    votes_confirmed,
+                    votes_unconfirmed,
+                    1 AS point_count,
+                    ST_X(geometry) AS lng,
+                    ST_Y(geometry) AS lat
+            FROM """ + table + """
+            WHERE geometry && ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), 4326)"""
+        properties_sql = "numvotes, votes_confirmed, votes_unconfirmed, point_count, lng, lat"
+
+    tile_sql = """
+        SELECT ST_AsMVT(tile, %(layer)s, %(extent)s, 'geom')
+        FROM (  SELECT  ST_AsMVTGeom(position, ST_TileEnvelope(%(z)s, %(x)s, %(y)s), %(extent)s, %(buffer)s, true) AS geom,
+                        """ + properties_sql + """
+                FROM (""" + features_sql + """) AS features) AS tile
+        WHERE geom IS NOT NULL"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(tile_sql, parameters)
+        tile = cursor.fetchone()[0]
+
+    response = HttpResponse(bytes(tile) if tile is not None else b'', content_type='application/vnd.mapbox-vector-tile')
+    # Clients must revalidate using ETag so new votes appear immediately
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 def ordinal(n):
     """
     Gets ordinal version of number, eg. 1st, 2nd, 3rd...
@@ -725,39 +1233,31 @@ def ordinal(n):
 def Leaderboard(request):
     """
     Get voting leaderboard data
+    Pages are selected by 'page' number or, for cheaper deep paging, by 'cursor' returned as 'nextcursor' of previous page
     """
 
-    page = int(request.GET.get('page','1')) - 1
-    pagesize = 5
-    position = page * pagesize
-
-    votes = (
-        Vote.objects
-        .filter(live=True)
-        .values('geometry')
-        .annotate(
-            total_votes=Count('id'),
-            confirmed_true=Count('id', filter=Q(confirmed=True)),
-            confirmed_false=Count('id', filter=Q(confirmed=False)),
-            first_vote_date=Min('created'),  # ← add this line
-        )
-        .order_by('-total_votes', '-confirmed_true', 'first_vote_date', 'geometry')
-    )
-    totalitems = votes.count()
+    try:
+        page = int(request.GET.get('page','1')) - 1
+        pagesize = int(request.GET.get('pagesize', LEADERBOARD_PAGESIZE))
+        cursor = request.GET.get('cursor', None)
+        if (page < 0) or (pagesize < 1) or (pagesize > LEADERBOARD_MAX_PAGESIZE): raise ValueError
+        # Vote counts and area of each turbine position are maintained in VoteSummary so page needs no aggregation or boundary lookups
+        top_votes, position, nextcursor = getleaderboardpage(pagesize, cursor, page)
+    except ValueError:
+        return OutputError()
+
+    totalitems = getleaderboardcount()
     lastpage = int((totalitems - 1) / pagesize) + 1
-    top_votes = votes[position:(position + pagesize)]
+    resolvevoteareas(top_votes)
+    position -= 1
 
     features = []
 
     for v in top_votes:
         position += 1
         positionordinal = ordinal(position)
-        geom = v['geometry']
-        if isinstance(geom, str):
-            geom = GEOSGeometry(geom) 
-        boundary = Boundary.objects.filter(level__in=[5, 6]).filter(geometry__contains=geom).first()
-        boundary_name = ''
-        if boundary is not None: boundary_name = boundary.name
+        geom = v.geometry
+        boundary_name = v.area
         features.append({
             "type": "Feature",
             "geometry": json.loads(geom.geojson),
@@ -770,16 +1270,17 @@ def Leaderboard(request):
                 'lng': geom.coords[0],
                 'lat': geom.coords[1],
                 "lastpage": lastpage,
-                "numvotes": v['total_votes'],
-                "votes_confirmed": v['confirmed_true'],
-                "votes_unconfirmed": v['confirmed_false'],
+                "numvotes": v.votes_total,
+                "votes_confirmed": v.votes_confirmed,
+                "votes_unconfirmed": v.votes_unconfirmed,
                 "area": boundary_name
             }
         })
 
     geojson = {
         "type": "FeatureCollection",
-        "features": features
+        "features": features,
+        "nextcursor": nextcursor
     }
 
     return JsonResponse(geojson)
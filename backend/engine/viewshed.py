@@ -0,0 +1,566 @@
+import json
+import math
+import uuid
+import functools
+import numpy as np
+from osgeo import gdal, osr, ogr
+
+from .terrainsampler import getterrainsampler, TERRAIN_PYRAMID_FILE
+
+# Default viewshed parameters
+VIEWSHED_MAX_CIRCULAR_RANGE         = float(45000) # 45km
+VIEWSHED_MAX_DISTANCE               = float((2 * (VIEWSHED_MAX_CIRCULAR_RANGE ** 2)) ** 0.5)
+VIEWSHED_TARGET_HEIGHT              = 1.5
+VIEWSHED_CURVATURE_COEFFICIENT      = 1.0
+
+# Distance circles drawn around turbine
+# Bearings match turfpy's line_arc(bearing1=0, bearing2=359.99999) which was used to generate them originally:
+# 64 steps from 0° plus closing point at 359.99999°
+DISTANCE_CIRCLES_KM                 = [5, 10, 15, 20, 25, 30, 35, 40]
+DISTANCE_CIRCLES_STEPS              = 64
+DISTANCE_CIRCLES_BEARINGS           = np.radians(np.append(np.arange(DISTANCE_CIRCLES_STEPS) * (360 / DISTANCE_CIRCLES_STEPS), 359.99999))
+DISTANCE_CIRCLES_EARTH_RADIUS_KM    = 0.001 * 6371008.8
+DISTANCE_CIRCLES_PRECISION          = 6
+DISTANCE_CIRCLES_CACHE_SIZE         = 4096
+
+# Viewshed engines
+# - 'gdal':         Two gdal.ViewshedGenerate runs, one for tower height and one for blade-tip height
+# - 'singlepass':   One radial line-of-sight sweep evaluating both observer heights together
+VIEWSHED_ENGINE_GDAL                = 'gdal'
+VIEWSHED_ENGINE_SINGLEPASS          = 'singlepass'
+VIEWSHED_ENGINES                    = [VIEWSHED_ENGINE_GDAL, VIEWSHED_ENGINE_SINGLEPASS]
+VIEWSHED_ENGINE_DEFAULT             = VIEWSHED_ENGINE_GDAL
+
+# Terrain used for viewshed
+# - 'single':       Single terrain raster at one resolution for whole viewshed
+# - 'pyramid':      Terrain pyramid with resolution decreasing with distance from turbine
+VIEWSHED_TERRAIN_SINGLE             = 'single'
+VIEWSHED_TERRAIN_PYRAMID            = 'pyramid'
+VIEWSHED_TERRAINS                   = [VIEWSHED_TERRAIN_SINGLE, VIEWSHED_TERRAIN_PYRAMID]
+VIEWSHED_TERRAIN_DEFAULT            = VIEWSHED_TERRAIN_SINGLE
+
+# Distance bands of pyramid viewshed as (pyramid level, inner distance, outer distance)
+# Each band is computed on its own pyramid level then cropped to its annulus
+VIEWSHED_PYRAMID_BANDS              = [
+                                        (0, 0, 10000),
+                                        (1, 10000, 20000),
+                                        (2, 20000, VIEWSHED_MAX_DISTANCE),
+                                    ]
+
+# Polygonizers
+# - 'warp':         Warp whole viewshed raster to EPSG:4326 then polygonize
+# - 'vector':       Polygonize in raster's native CRS then simplify and reproject resulting polygons
+VIEWSHED_POLYGONIZE_WARP            = 'warp'
+VIEWSHED_POLYGONIZE_VECTOR          = 'vector'
+VIEWSHED_POLYGONIZERS               = [VIEWSHED_POLYGONIZE_WARP, VIEWSHED_POLYGONIZE_VECTOR]
+VIEWSHED_POLYGONIZE_DEFAULT         = VIEWSHED_POLYGONIZE_WARP
+
+# Simplification of vector polygonizer is tied to map zoom - tolerance is this many screen pixels at zoom
+VIEWSHED_SIMPLIFY_ZOOM_DEFAULT      = 11
+VIEWSHED_SIMPLIFY_ZOOM_MIN          = 0
+VIEWSHED_SIMPLIFY_ZOOM_MAX          = 20
+VIEWSHED_SIMPLIFY_PIXELS            = 1.0
+VIEWSHED_GEOJSON_PRECISION          = 6
+
+# Maximum number of cells in cumulative visibility grid of batch viewshed - resolution is reduced beyond this
+VIEWSHED_CUMULATIVE_MAX_CELLS       = 16 * 1024 * 1024
+
+# Serialised FeatureCollection is assembled from these and individually serialised features
+# so collection can be streamed without building it in memory
+VIEWSHED_GEOJSON_HEADER             = b'{"type": "FeatureCollection", "features": [\n'
+VIEWSHED_GEOJSON_SEPARATOR          = b',\n'
+VIEWSHED_GEOJSON_FOOTER             = b'\n]}'
+
+# Values used in single-pass multi-valued viewshed raster
+VIEWSHED_VALUE_INVISIBLE            = 0
+VIEWSHED_VALUE_TIP                  = 1
+VIEWSHED_VALUE_TOWER                = 2
+
+# Number of rays processed at once in single-pass sweep - bounds memory use
+VIEWSHED_SINGLEPASS_RAY_CHUNK       = 256
+
+# Number of rows processed at once when mapping sweep results back onto raster grid
+VIEWSHED_SINGLEPASS_ROW_CHUNK       = 256
+
+
+@functools.lru_cache(maxsize=DISTANCE_CIRCLES_CACHE_SIZE)
+def getdistancecircleoffsets(lat):
+    """
+    Gets latitudes in degrees and longitude offsets in radians of all distance circles around point at latitude
+    Circle shape only depends on latitude - longitude is pure translation - so results are cached per latitude
+    Uses same spherical destination formula and bearings as turfpy's line_arc so output matches it
+    """
+
+    latitude1 = math.radians(lat)
+    distances = np.array(DISTANCE_CIRCLES_KM, dtype=np.float64)[:, np.newaxis] / DISTANCE_CIRCLES_EARTH_RADIUS_KM
+    latitude2 = np.arcsin((math.sin(latitude1) * np.cos(distances)) + (math.cos(latitude1) * np.sin(distances) * np.cos(DISTANCE_CIRCLES_BEARINGS)))
+    longitude_offset = np.arctan2(  np.sin(DISTANCE_CIRCLES_BEARINGS) * np.sin(distances) * math.cos(latitude1), \
+                                    np.cos(distances) - math.sin(latitude1) * np.sin(latitude2))
+
+    # Latitudes are returned as lists as they don't change with longitude
+    longitude_offset.flags.writeable = False
+    return np.degrees(latitude2).tolist(), longitude_offset
+
+def returncirclesforpoint(lng, lat):
+    """
+    Gets distance circle and distance label features around point
+    """
+
+    latitudes, longitude_offsets = getdistancecircleoffsets(lat)
+    longitudes = np.degrees(math.radians(lng) + longitude_offsets).tolist()
+    label_index = int(DISTANCE_CIRCLES_BEARINGS.size / 2)
+
+    features = []
+    for step_index, radius in enumerate(DISTANCE_CIRCLES_KM):
+        feature_coordinates = [[round(longitude, DISTANCE_CIRCLES_PRECISION), round(latitude, DISTANCE_CIRCLES_PRECISION)] \
+                                for longitude, latitude in zip(longitudes[step_index], latitudes[step_index])]
+        feature = {'type': 'Feature', 'geometry': {'type': 'LineString', 'properties': {}, 'coordinates': feature_coordinates}, 'properties': {'class': 'Distance_Circle', 'distance': str(radius) + 'km'}}
+        features.append(feature)
+        point_label_coordinates = feature_coordinates[label_index]
+        feature_point = {'type': 'Feature', 'name': str(radius) + 'km', 'properties': {'name': str(radius) + 'km', 'class': 'Distance_Circle_Label'}, 'geometry': {'type': 'Point', 'coordinates': point_label_coordinates}}
+        features.append(feature_point)
+
+    return features
+
+def getviewsheduniqueid(lon, lat, hubheight, bladeradius):
+    """
+    Gets unique id for viewshed request, used to name in-memory files
+    Random suffix avoids clashes between concurrent requests for same turbine
+    """
+
+    return str(lon) + '_' + str(lat) + '_' + str(hubheight) + '_' + str(bladeradius) + '_' + uuid.uuid4().hex
+
+def generategdalviewshed(src_band, observerX, observerY, observerheight, maxdistance=VIEWSHED_MAX_DISTANCE):
+    """
+    Generates single-height in-memory viewshed raster using gdal.ViewshedGenerate
+    """
+
+    return gdal.ViewshedGenerate(
+        srcBand = src_band,
+        driverName = 'MEM',
+        targetRasterName = '',
+        creationOptions = [],
+        observerX = observerX,
+        observerY = observerY,
+        observerHeight = int(observerheight + 0.5),
+        targetHeight = VIEWSHED_TARGET_HEIGHT,
+        visibleVal = 255.0,
+        invisibleVal = 0.0,
+        outOfRangeVal = 0.0,
+        noDataVal = 0.0,
+        dfCurvCoeff = VIEWSHED_CURVATURE_COEFFICIENT,
+        mode = 1,
+        maxDistance = maxdistance)
+
+def generatesinglepassviewshed(terrain_ds, observerX, observerY, towerheight, turbinetip, maxdistance=VIEWSHED_MAX_DISTANCE):
+    """
+    Generates multi-valued viewshed raster for tower and blade-tip heights in one radial sweep
+    Output values: 0 = invisible, 1 = blade tip only, 2 = tower and blade tip
+
+    Terrain is sampled once along rays cast from observer. Both observer heights are then evaluated
+    against same sampled profile, with running maximum of elevation angle giving horizon for each height
+    """
+
+    geotransform, projection = terrain_ds.GetGeoTransform(), terrain_ds.GetProjection()
+    if (geotransform[2] != 0) or (geotransform[4] != 0): raise ValueError("Single-pass viewshed requires north-up terrain raster")
+
+    pixel_x, pixel_y = geotransform[1], -geotransform[5]
+    step = min(pixel_x, pixel_y)
+    num_steps = int(math.ceil(maxdistance / step))
+
+    src_band = terrain_ds.GetRasterBand(1)
+    xcount, ycount = terrain_ds.RasterXSize, terrain_ds.RasterYSize
+    terrain = src_band.ReadAsArray().astype(np.float64)
+    nodata = src_band.GetNoDataValue()
+    if nodata is not None: terrain[terrain == nodata] = np.nan
+
+    # Observer position in pixels relative to terrain raster
+    observer_wx = (observerX - geotransform[0]) / pixel_x
+    observer_wy = (geotransform[3] - observerY) / pixel_y
+    observer_ground = terrain[int(observer_wy), int(observer_wx)]
+    if np.isnan(observer_ground): observer_ground = 0
+    observer_elevations = observer_ground + np.array([int(towerheight + 0.5), int(turbinetip + 0.5)], dtype=np.float64).reshape(2, 1, 1)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(projection)
+    earth_diameter = 2 * srs.GetSemiMajor()
+
+    # Cast enough rays that neighbouring rays are no more than one cell apart at maximum distance
+    num_rays = int(math.ceil(2 * math.pi * num_steps))
+    distances = step * np.arange(1, num_steps + 1, dtype=np.float64)
+    curvature = VIEWSHED_CURVATURE_COEFFICIENT * (distances ** 2) / earth_diameter
+    sweep = np.zeros((num_rays, num_steps + 1), dtype=np.uint8)
+    sweep[:, 0] = VIEWSHED_VALUE_TOWER
+
+    for ray_start in range(0, num_rays, VIEWSHED_SINGLEPASS_RAY_CHUNK):
+        ray_end = min(num_rays, ray_start + VIEWSHED_SINGLEPASS_RAY_CHUNK)
+        bearings = (2 * np.pi / num_rays) * np.arange(ray_start, ray_end, dtype=np.float64)
+        sample_x = np.floor(observer_wx + np.outer(np.sin(bearings), distances) / pixel_x).astype(np.int64)
+        sample_y = np.floor(observer_wy - np.outer(np.cos(bearings), distances) / pixel_y).astype(np.int64)
+        inside = (sample_x >= 0) & (sample_y >= 0) & (sample_x < xcount) & (sample_y < ycount)
+        elevations = np.full(sample_x.shape, np.nan, dtype=np.float64)
+        elevations[inside] = terrain[sample_y[inside], sample_x[inside]]
+        elevations -= curvature
+
+        # Evaluate both observer heights against same terrain profile
+        terrain_angles = (elevations[np.newaxis] - observer_elevations) / distances
+        horizon = np.fmax.accumulate(terrain_angles, axis=2)
+        horizon = np.concatenate((np.full(horizon.shape[:2] + (1,), -np.inf), horizon[:, :, :-1]), axis=2)
+        horizon[np.isnan(horizon)] = -np.inf
+        target_angles = terrain_angles + (VIEWSHED_TARGET_HEIGHT / distances)
+        visible = target_angles >= horizon
+
+        values = np.where(visible[1], VIEWSHED_VALUE_TIP, VIEWSHED_VALUE_INVISIBLE).astype(np.uint8)
+        values[visible[0]] = VIEWSHED_VALUE_TOWER
+        sweep[ray_start:ray_end, 1:] = values
+
+    # Map each cell of window back onto nearest ray and step
+    output = np.zeros((ycount, xcount), dtype=np.uint8)
+    columns_offset = ((np.arange(xcount, dtype=np.float64) + 0.5) - observer_wx) * pixel_x
+    for row_start in range(0, ycount, VIEWSHED_SINGLEPASS_ROW_CHUNK):
+        row_end = min(ycount, row_start + VIEWSHED_SINGLEPASS_ROW_CHUNK)
+        rows_offset = (observer_wy - (np.arange(row_start, row_end, dtype=np.float64) + 0.5)) * pixel_y
+        dx, dy = np.meshgrid(columns_offset, rows_offset)
+        cell_distances = np.hypot(dx, dy)
+        ray_indices = np.rint((np.arctan2(dx, dy) % (2 * np.pi)) * (num_rays / (2 * np.pi))).astype(np.int64) % num_rays
+        step_indices = np.rint(cell_distances / step).astype(np.int64)
+        in_range = (cell_distances <= maxdistance) & (step_indices <= num_steps)
+        output[row_start:row_end][in_range] = sweep[ray_indices[in_range], step_indices[in_range]]
+
+    driver = gdal.GetDriverByName('MEM')
+    output_ds = driver.Create('', xcount, ycount, 1, gdal.GDT_Byte)
+    output_ds.SetGeoTransform(geotransform)
+    output_ds.SetProjection(projection)
+    output_ds.GetRasterBand(1).WriteArray(output)
+    return output_ds
+
+def extractviewshedmask(viewshed_ds, minimum_value):
+    """
+    Extracts 0/255 mask raster from multi-valued viewshed raster for all cells with value >= minimum_value
+    """
+
+    values = viewshed_ds.GetRasterBand(1).ReadAsArray()
+    driver = gdal.GetDriverByName('MEM')
+    mask_ds = driver.Create('', viewshed_ds.RasterXSize, viewshed_ds.RasterYSize, 1, gdal.GDT_Byte)
+    mask_ds.SetGeoTransform(viewshed_ds.GetGeoTransform())
+    mask_ds.SetProjection(viewshed_ds.GetProjection())
+    mask_ds.GetRasterBand(1).WriteArray(np.where(values >= minimum_value, 255, 0).astype(np.uint8))
+    return mask_ds
+
+def computewindowviewsheds(terrain_ds, observerX, observerY, towerheight, turbinetip, engine=VIEWSHED_ENGINE_DEFAULT, maxdistance=VIEWSHED_MAX_DISTANCE):
+    """
+    Computes tower and blade-tip visibility rasters (0 = invisible, 255 = visible) over terrain window using selected engine
+    """
+
+    if engine == VIEWSHED_ENGINE_SINGLEPASS:
+        viewshed_ds = generatesinglepassviewshed(terrain_ds, observerX, observerY, towerheight, turbinetip, maxdistance)
+        towerheight_ds = extractviewshedmask(viewshed_ds, VIEWSHED_VALUE_TOWER)
+        turbinetip_ds = extractviewshedmask(viewshed_ds, VIEWSHED_VALUE_TIP)
+        return towerheight_ds, turbinetip_ds
+
+    src_band = terrain_ds.GetRasterBand(1)
+    towerheight_ds = generategdalviewshed(src_band, observerX, observerY, towerheight, maxdistance)
+    turbinetip_ds = generategdalviewshed(src_band, observerX, observerY, turbinetip, maxdistance)
+    return towerheight_ds, turbinetip_ds
+
+def computeviewshedrasters(lon, lat, hubheight, bladeradius, engine=VIEWSHED_ENGINE_DEFAULT):
+    """
+    Computes tower and blade-tip visibility rasters (0 = invisible, 255 = visible) using selected engine
+    Returns (towerheight_raster, turbinetip_raster) as in-memory datasets
+    """
+
+    terrain = getterrainsampler()
+    _, observerX, observerY = terrain.getelevation(lon, lat)
+    towerheight = hubheight
+    turbinetip = hubheight + bladeradius
+
+    # Only read terrain within maximum viewshed distance so memory per request stays constant
+    terrain_ds = terrain.readwindow(observerX, observerY, VIEWSHED_MAX_DISTANCE)
+
+    towerheight_ds, turbinetip_ds = computewindowviewsheds(terrain_ds, observerX, observerY, towerheight, turbinetip, engine)
+    return towerheight_ds, turbinetip_ds
+
+def getpyramidbandmask(terrain, band_index, geotransform, xcount, ycount, observerX, observerY):
+    """
+    Gets boolean mask of cells of grid belonging to pyramid distance band
+
+    Cell belongs to band if its centre is beyond band's inner distance and, unless band is last,
+    centre of its parent cell in next pyramid level is within next band's inner distance.
+    Pyramid levels share grid origin so every cell in one band is either in this band or covered
+    by parent in next band, giving bands that meet without gaps or overlaps
+    """
+
+    level, inner, outer = VIEWSHED_PYRAMID_BANDS[band_index]
+    level_geotransform = terrain.levels[level][2]
+
+    def getcentredistances(geotransform, columns, rows):
+        centres_x = geotransform[0] + (columns + 0.5) * geotransform[1]
+        centres_y = geotransform[3] + (rows + 0.5) * geotransform[5]
+        return np.hypot(centres_x[np.newaxis, :] - observerX, centres_y[:, np.newaxis] - observerY)
+
+    # Cell positions relative to origin of pyramid level
+    columns = np.arange(xcount) + int(round((geotransform[0] - level_geotransform[0]) / level_geotransform[1]))
+    rows = np.arange(ycount) + int(round((geotransform[3] - level_geotransform[3]) / level_geotransform[5]))
+
+    distances = getcentredistances(level_geotransform, columns, rows)
+    if band_index == (len(VIEWSHED_PYRAMID_BANDS) - 1): return (distances >= inner) & (distances <= outer)
+
+    next_level, next_inner, _ = VIEWSHED_PYRAMID_BANDS[band_index + 1]
+    next_geotransform = terrain.levels[next_level][2]
+    ratio = int(round(next_geotransform[1] / level_geotransform[1]))
+    return (distances >= inner) & (getcentredistances(next_geotransform, columns // ratio, rows // ratio) < next_inner)
+
+def cropviewshedtoband(terrain, band_index, viewshed_ds, observerX, observerY):
+    """
+    Clears visibility of all cells of 0/255 viewshed raster outside pyramid distance band
+    Mask is built from viewshed raster's own grid as gdal.ViewshedGenerate may crop output to maximum distance
+    """
+
+    mask = getpyramidbandmask(terrain, band_index, viewshed_ds.GetGeoTransform(), viewshed_ds.RasterXSize, viewshed_ds.RasterYSize, observerX, observerY)
+    band = viewshed_ds.GetRasterBand(1)
+    values = band.ReadAsArray()
+    values[~mask] = 0
+    band.WriteArray(values)
+
+def computepyramidviewshedrasters(lon, lat, hubheight, bladeradius, engine=VIEWSHED_ENGINE_DEFAULT):
+    """
+    Computes tower and blade-tip visibility rasters for each distance band of terrain pyramid
+    Near field uses full resolution terrain while further bands use progressively coarser levels
+    so accuracy is highest where it's most noticeable and far fewer cells are processed overall
+    Returns (towerheight_rasters, turbinetip_rasters) with one in-memory dataset per band
+    """
+
+    terrain = getterrainsampler(TERRAIN_PYRAMID_FILE)
+    _, observerX, observerY = terrain.getelevation(lon, lat)
+    towerheight = hubheight
+    turbinetip = hubheight + bladeradius
+
+    towerheight_rasters, turbinetip_rasters = [], []
+    for band_index, (level, inner, outer) in enumerate(VIEWSHED_PYRAMID_BANDS):
+        # Extend window by cell of next level as cells at band's outer edge may belong to this band
+        margin = 2 * abs(terrain.levels[min(level + 1, len(terrain.levels) - 1)][2][1])
+        terrain_ds = terrain.readwindow(observerX, observerY, outer + margin, level)
+        towerheight_ds, turbinetip_ds = computewindowviewsheds(terrain_ds, observerX, observerY, towerheight, turbinetip, engine, outer + margin)
+        cropviewshedtoband(terrain, band_index, towerheight_ds, observerX, observerY)
+        cropviewshedtoband(terrain, band_index, turbinetip_ds, observerX, observerY)
+        towerheight_rasters.append(towerheight_ds)
+        turbinetip_rasters.append(turbinetip_ds)
+
+    return towerheight_rasters, turbinetip_rasters
+
+def generateviewshedfeatures(lon, lat, hubheight, bladeradius, engine=VIEWSHED_ENGINE_DEFAULT, polygonizer=VIEWSHED_POLYGONIZE_DEFAULT, zoom=VIEWSHED_SIMPLIFY_ZOOM_DEFAULT, terrain=VIEWSHED_TERRAIN_DEFAULT):
+    """
+    Generates serialised tower height viewshed features followed by blade-tip height viewshed features
+    """
+
+    uniqueid = getviewsheduniqueid(lon, lat, hubheight, bladeradius)
+    if terrain == VIEWSHED_TERRAIN_PYRAMID:
+        towerheight_rasters, turbinetip_rasters = computepyramidviewshedrasters(lon, lat, hubheight, bladeradius, engine)
+    else:
+        towerheight_raster, turbinetip_raster = computeviewshedrasters(lon, lat, hubheight, bladeradius, engine)
+        towerheight_rasters, turbinetip_rasters = [towerheight_raster], [turbinetip_raster]
+    tolerance = getsimplifytolerance(zoom, lat) if polygonizer == VIEWSHED_POLYGONIZE_VECTOR else 0
+
+    for raster_index, towerheight_raster in enumerate(towerheight_rasters):
+        yield from generatepolygonfeatures(uniqueid + '_tower_' + str(raster_index), towerheight_raster, 'viewshed_towerheight', polygonizer, tolerance)
+    for raster_index, turbinetip_raster in enumerate(turbinetip_rasters):
+        yield from generatepolygonfeatures(uniqueid + '_tip_' + str(raster_index), turbinetip_raster, 'viewshed_turbinetip', polygonizer, tolerance)
+
+def generatecirclefeatures(lon, lat):
+    """
+    Generates serialised distance circle features
+    """
+
+    for feature in returncirclesforpoint(lon, lat): yield serialisefeature(feature)
+
+def streamfeatures(feature_generators):
+    """
+    Streams serialised features from each generator in turn, separated ready for inclusion in features array
+    """
+
+    first_feature = True
+    for feature_generator in feature_generators:
+        for feature in feature_generator:
+            if not first_feature: yield VIEWSHED_GEOJSON_SEPARATOR
+            first_feature = False
+            yield feature
+
+def streamfeaturecollection(feature_generators):
+    """
+    Streams serialised features from each generator in turn as single GeoJSON FeatureCollection
+    """
+
+    yield VIEWSHED_GEOJSON_HEADER
+    yield from streamfeatures(feature_generators)
+    yield VIEWSHED_GEOJSON_FOOTER
+
+def GetBatchViewshedContent(cumulative_content, turbine_contents):
+    """
+    Gets batch viewshed as serialised GeoJSON FeatureCollection of cumulative visibility features
+    with each turbine's own serialised viewshed FeatureCollection in 'turbines' member
+    cumulative_content is serialised features already joined by streamfeatures
+    """
+
+    return  VIEWSHED_GEOJSON_HEADER + \
+            cumulative_content + \
+            b'\n], "turbines": [\n' + \
+            VIEWSHED_GEOJSON_SEPARATOR.join(turbine_contents) + \
+            VIEWSHED_GEOJSON_FOOTER
+
+def GetViewshedContent(lon, lat, hubheight, bladeradius, engine=VIEWSHED_ENGINE_DEFAULT, polygonizer=VIEWSHED_POLYGONIZE_DEFAULT, zoom=VIEWSHED_SIMPLIFY_ZOOM_DEFAULT, terrain=VIEWSHED_TERRAIN_DEFAULT):
+    """
+    Gets distance circles and viewsheds as serialised GeoJSON FeatureCollection
+    """
+
+    return b''.join(streamfeaturecollection([   generatecirclefeatures(lon, lat), \
+                                                generateviewshedfeatures(lon, lat, hubheight, bladeradius, engine, polygonizer, zoom, terrain)]))
+
+def serialisefeature(feature):
+    """
+    Serialises GeoJSON feature dict
+    """
+
+    return json.dumps(feature).encode('utf-8')
+
+def serialiseogrfeature(properties, geometry):
+    """
+    Serialises OGR geometry as GeoJSON feature
+    Geometry is written by OGR directly so it's never decoded into Python objects and re-encoded
+    """
+
+    geometry_json = geometry.ExportToJson(options=['COORDINATE_PRECISION=' + str(VIEWSHED_GEOJSON_PRECISION)])
+    return b'{"type": "Feature", "properties": ' + json.dumps(properties).encode('utf-8') + b', "geometry": ' + geometry_json.encode('utf-8') + b'}'
+
+def reprojectrasterto4326(input_raster, output_file):
+    if isinstance(input_raster, str): input_raster = gdal.Open(input_raster)
+    warp = gdal.Warp(output_file, input_raster, dstSRS='EPSG:4326')
+    warp = None
+
+def getsimplifytolerance(zoom, lat):
+    """
+    Gets simplification tolerance in metres equivalent to VIEWSHED_SIMPLIFY_PIXELS screen pixels at zoom level and latitude
+    """
+
+    zoom = min(VIEWSHED_SIMPLIFY_ZOOM_MAX, max(VIEWSHED_SIMPLIFY_ZOOM_MIN, zoom))
+    metres_per_pixel = 156543.03392 * math.cos(math.radians(lat)) / (2 ** zoom)
+    return VIEWSHED_SIMPLIFY_PIXELS * metres_per_pixel
+
+def polygonizerasterlayer(raster):
+    """
+    Polygonizes visible cells of raster into in-memory OGR layer in raster's own CRS
+    Returns (datasource, layer) as datasource must be kept alive while layer is in use
+    """
+
+    src_ds = gdal.Open(raster) if isinstance(raster, str) else raster
+    source_srs = osr.SpatialReference()
+    source_srs.ImportFromWkt(src_ds.GetProjection())
+    source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    srcband = src_ds.GetRasterBand(1)
+
+    memory_ds = ogr.GetDriverByName('Memory').CreateDataSource('')
+    memory_layer = memory_ds.CreateLayer("viewshed", srs = source_srs, geom_type = ogr.wkbPolygon)
+    memory_layer.CreateField(ogr.FieldDefn('Area', ogr.OFTInteger))
+    polygonize = gdal.Polygonize(srcband, srcband, memory_layer, 0, [], callback=None )
+    polygonize = None
+    srcband, src_ds = None, None
+
+    return memory_ds, memory_layer
+
+def generatepolygonfeatures(uniqueid, raster, featureclass, polygonizer=VIEWSHED_POLYGONIZE_DEFAULT, tolerance=0, valuefield='Area'):
+    """
+    Generates serialised EPSG:4326 GeoJSON features for non-zero areas of raster, eg. visible areas of 0/255 viewshed raster
+    Raster value of each polygon is written to valuefield property
+    - 'warp':   Warps whole raster to EPSG:4326 then polygonizes
+    - 'vector': Polygonizes in raster's native CRS, then simplifies and reprojects resulting polygons
+                Avoids resampling whole raster grid and only transforms vertices that survive simplification
+    """
+
+    transform, memory_transformed_raster = None, None
+    if polygonizer == VIEWSHED_POLYGONIZE_VECTOR:
+        src_ds = gdal.Open(raster) if isinstance(raster, str) else raster
+        source_srs = osr.SpatialReference()
+        source_srs.ImportFromWkt(src_ds.GetProjection())
+        source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromEPSG(4326)
+        target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        transform = osr.CoordinateTransformation(source_srs, target_srs)
+        src_ds = None
+    else:
+        memory_transformed_raster = '/vsimem/' + uniqueid + '.tif'
+        reprojectrasterto4326(raster, memory_transformed_raster)
+        raster, tolerance = memory_transformed_raster, 0
+
+    memory_ds, memory_layer = polygonizerasterlayer(raster)
+
+    try:
+        memory_layer.ResetReading()
+        for memory_feature in memory_layer:
+            geometry = memory_feature.GetGeometryRef()
+            if tolerance > 0: geometry = geometry.SimplifyPreserveTopology(tolerance)
+            if (geometry is None) or geometry.IsEmpty(): continue
+            if transform is not None: geometry.Transform(transform)
+            yield serialiseogrfeature({valuefield: memory_feature.GetField('Area'), 'class': featureclass}, geometry)
+    finally:
+        memory_layer, memory_ds = None, None
+        if memory_transformed_raster is not None: gdal.Unlink(memory_transformed_raster)
+
+def generatecumulativefeatures(turbine_contents, lat, polygonizer=VIEWSHED_POLYGONIZE_DEFAULT, zoom=VIEWSHED_SIMPLIFY_ZOOM_DEFAULT):
+    """
+    Generates serialised cumulative visibility features from serialised viewsheds of several turbines
+    Blade-tip viewshed of every turbine is added onto one terrain-aligned grid so each cell counts
+    number of turbines visible from it, then grid is polygonized once with count in 'turbines' property
+    lat is used to set simplification tolerance of vector polygonizer
+    """
+
+    terrain = getterrainsampler()
+    target_srs = terrain.srs
+    source_srs = osr.SpatialReference()
+    source_srs.ImportFromEPSG(4326)
+    source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(source_srs, target_srs)
+
+    # Collect blade-tip viewshed of each turbine in terrain CRS
+    turbine_geometries = []
+    for turbine_content in turbine_contents:
+        geometries = []
+        for feature in json.loads(turbine_content)['features']:
+            if feature['properties'].get('class') != 'viewshed_turbinetip': continue
+            geometry = ogr.CreateGeometryFromJson(json.dumps(feature['geometry']))
+            if geometry is None: continue
+            geometry.Transform(transform)
+            geometries.append(geometry)
+        turbine_geometries.append(geometries)
+
+    envelopes = [geometry.GetEnvelope() for geometries in turbine_geometries for geometry in geometries]
+    if len(envelopes) == 0: return
+
+    # Grid shares terrain's resolution and alignment unless that would exceed maximum number of cells
+    gt = terrain.geotransform
+    resolution = abs(gt[1])
+    minx, maxx = min(envelope[0] for envelope in envelopes), max(envelope[1] for envelope in envelopes)
+    miny, maxy = min(envelope[2] for envelope in envelopes), max(envelope[3] for envelope in envelopes)
+    while (((maxx - minx) / resolution) * ((maxy - miny) / resolution)) > VIEWSHED_CUMULATIVE_MAX_CELLS: resolution *= 2
+    minx = gt[0] + math.floor((minx - gt[0]) / resolution) * resolution
+    maxy = gt[3] - math.floor((gt[3] - maxy) / resolution) * resolution
+    xcount, ycount = int(math.ceil((maxx - minx) / resolution)) + 1, int(math.ceil((maxy - miny) / resolution)) + 1
+
+    cumulative_ds = gdal.GetDriverByName('MEM').Create('', xcount, ycount, 1, gdal.GDT_Byte)
+    cumulative_ds.SetGeoTransform((minx, resolution, 0, maxy, 0, -resolution))
+    cumulative_ds.SetProjection(terrain.projection)
+
+    # Each turbine's polygons don't overlap so adding one per turbine counts turbines visible from each cell
+    memory_ds = ogr.GetDriverByName('Memory').CreateDataSource('')
+    for turbine_index, geometries in enumerate(turbine_geometries):
+        memory_layer = memory_ds.CreateLayer("turbine_" + str(turbine_index), srs = target_srs, geom_type = ogr.wkbPolygon)
+        memory_defn = memory_layer.GetLayerDefn()
+        for geometry in geometries:
+            memory_feature = ogr.Feature(memory_defn)
+            memory_feature.SetGeometry(geometry)
+            memory_layer.CreateFeature(memory_feature)
+            memory_feature = None
+        gdal.RasterizeLayer(cumulative_ds, [1], memory_layer, burn_values=[1], options=['MERGE_ALG=ADD'])
+    memory_layer, memory_ds = None, None
+
+    tolerance = getsimplifytolerance(zoom, lat) if polygonizer == VIEWSHED_POLYGONIZE_VECTOR else 0
+    yield from generatepolygonfeatures('cumulative_' + uuid.uuid4().hex, cumulative_ds, 'viewshed_cumulative', polygonizer, tolerance, 'turbines')
@@ -0,0 +1,265 @@
+import os
+import gzip
+import hashlib
+import threading
+import shutil
+from collections import OrderedDict
+from os.path import isdir, join
+from django.conf import settings
+
+from .terrainsampler import TERRAIN_FILE
+
+# Default limits - can be overridden in settings
+VIEWSHED_CACHE_MEMORY_MAXBYTES      = 64 * 1024 * 1024
+VIEWSHED_CACHE_DISK_MAXBYTES        = 2 * 1024 * 1024 * 1024
+VIEWSHED_CACHE_DISK_FOLDER          = os.path.dirname(os.path.realpath(__file__)) + '/viewshed-cache/'
+VIEWSHED_PRECOMPUTED_FOLDER         = os.path.dirname(os.path.realpath(__file__)) + '/viewshed-precomputed/'
+
+# Number of disk writes between checks of total disk usage
+VIEWSHED_CACHE_DISK_PRUNE_INTERVAL  = 50
+
+# Process-wide viewshed cache and store of precomputed viewsheds
+VIEWSHED_CACHE                      = None
+VIEWSHED_PRECOMPUTED_STORE          = None
+VIEWSHED_CACHE_LOCK                 = threading.Lock()
+
+
+def getterrainstamp(terrain_file):
+    """
+    Gets short stamp identifying current version of terrain file using its mtime and size
+    """
+
+    try:
+        stat = os.stat(terrain_file)
+    except FileNotFoundError:
+        return 'missing'
+    return hashlib.sha1((str(stat.st_mtime_ns) + ':' + str(stat.st_size)).encode('utf-8')).hexdigest()[:12]
+
+def getviewshedcachekey(lon, lat, hubheight, bladeradius, *variant):
+    """
+    Gets content-addressed key for viewshed parameters
+    Positions and heights should already be quantised so nearby requests for 'same' turbine share entries
+    Any further arguments, eg. engine mode, are added to key so different variants are cached separately
+    """
+
+    elements = [repr(lon), repr(lat), repr(hubheight), repr(bladeradius)] + [str(element) for element in variant]
+    return hashlib.sha256('_'.join(elements).encode('utf-8')).hexdigest()
+
+def getcumulativeviewshedcachekey(turbine_keys, *variant):
+    """
+    Gets content-addressed key for cumulative visibility of set of turbines
+    Turbine keys are sorted so same layout in different order shares entry
+    """
+
+    elements = ['cumulative'] + sorted(turbine_keys) + [str(element) for element in variant]
+    return hashlib.sha256('_'.join(elements).encode('utf-8')).hexdigest()
+
+
+class ViewshedCache:
+    """
+    Two-tier viewshed cache
+    - In-memory LRU of serialised GeoJSON per worker process
+    - On-disk store of gzip-compressed GeoJSON shared between all workers
+    Entries are stored under stamp of terrain file so cache is invalidated whenever terrain changes
+    Setting memory_maxbytes to 0 disables memory tier and disk_maxbytes to None disables disk pruning
+    """
+
+    def __init__(self, folder, memory_maxbytes, disk_maxbytes, terrain_file):
+        self.folder = folder
+        self.memory_maxbytes = memory_maxbytes
+        self.disk_maxbytes = disk_maxbytes
+        self.terrain_file = terrain_file
+        self.terrain_stamp = None
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_writes = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits_memory': 0, 'hits_disk': 0, 'misses': 0, 'stores': 0, 'evictions_memory': 0, 'evictions_disk': 0, 'invalidations': 0}
+
+    def checkterrain(self):
+        """
+        Clears cache if terrain file has changed since last check
+        """
+
+        terrain_stamp = getterrainstamp(self.terrain_file)
+        if terrain_stamp == self.terrain_stamp: return terrain_stamp
+
+        with self.lock:
+            if self.terrain_stamp is not None: self.counters['invalidations'] += 1
+            self.terrain_stamp = terrain_stamp
+            self.memory.clear()
+            self.memory_bytes = 0
+
+        # Remove disk entries belonging to any other terrain version
+        if isdir(self.folder):
+            for subfolder in os.listdir(self.folder):
+                if subfolder == terrain_stamp: continue
+                shutil.rmtree(join(self.folder, subfolder), ignore_errors=True)
+
+        return terrain_stamp
+
+    def getdiskpath(self, terrain_stamp, key):
+        """
+        Gets path of disk entry for key
+        """
+
+        return join(self.folder, terrain_stamp, key[:2], key + '.geojson.gz')
+
+    def get(self, key):
+        """
+        Gets serialised GeoJSON for key, returning (content, tier) where tier is 'memory', 'disk' or None
+        """
+
+        terrain_stamp = self.checkterrain()
+
+        with self.lock:
+            content = self.memory.get(key)
+            if content is not None:
+                self.memory.move_to_end(key)
+                self.counters['hits_memory'] += 1
+                return content, 'memory'
+
+        disk_path = self.getdiskpath(terrain_stamp, key)
+        try:
+            with gzip.open(disk_path, 'rb') as disk_file: content = disk_file.read()
+        except (FileNotFoundError, OSError, EOFError):
+            content = None
+
+        if content is None:
+            with self.lock: self.counters['misses'] += 1
+            return None, None
+
+        # Touch entry so disk pruning removes least recently used entries first
+        try:
+            os.utime(disk_path)
+        except OSError:
+            pass
+
+        with self.lock: self.counters['hits_disk'] += 1
+        self.setmemory(key, content)
+        return content, 'disk'
+
+    def has(self, key):
+        """
+        Checks whether key is stored on disk
+        """
+
+        return os.path.isfile(self.getdiskpath(self.checkterrain(), key))
+
+    def set(self, key, content):
+        """
+        Stores serialised GeoJSON for key in both tiers
+        """
+
+        terrain_stamp = self.checkterrain()
+        self.setmemory(key, content)
+
+        disk_path = self.getdiskpath(terrain_stamp, key)
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        temp_path = disk_path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        with gzip.open(temp_path, 'wb', compresslevel=6) as disk_file: disk_file.write(content)
+        os.replace(temp_path, disk_path)
+
+        with self.lock:
+            self.counters['stores'] += 1
+            self.disk_writes += 1
+            prune = (self.disk_writes % VIEWSHED_CACHE_DISK_PRUNE_INTERVAL) == 0
+
+        if prune: self.prunedisk(terrain_stamp)
+
+    def setmemory(self, key, content):
+        """
+        Stores content in memory tier, evicting least recently used entries beyond size limit
+        """
+
+        if len(content) > self.memory_maxbytes: return
+
+        with self.lock:
+            existing = self.memory.pop(key, None)
+            if existing is not None: self.memory_bytes -= len(existing)
+            self.memory[key] = content
+            self.memory_bytes += len(content)
+            while self.memory_bytes > self.memory_maxbytes:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+                self.counters['evictions_memory'] += 1
+
+    def prunedisk(self, terrain_stamp):
+        """
+        Removes least recently used disk entries until disk tier is within size limit
+        """
+
+        if self.disk_maxbytes is None: return
+
+        entries, total_bytes = [], 0
+        for root, _, files in os.walk(join(self.folder, terrain_stamp)):
+            for file in files:
+                if not file.endswith('.geojson.gz'): continue
+                path = join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_bytes += stat.st_size
+
+        if total_bytes <= self.disk_maxbytes: return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_bytes <= self.disk_maxbytes: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            with self.lock: self.counters['evictions_disk'] += 1
+
+    def stats(self):
+        """
+        Gets cache counters along with current memory usage
+        """
+
+        with self.lock:
+            stats = dict(self.counters)
+            stats['memory_items'] = len(self.memory)
+            stats['memory_bytes'] = self.memory_bytes
+        requests = stats['hits_memory'] + stats['hits_disk'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits_memory'] + stats['hits_disk']) / requests, 4) if requests else None
+        return stats
+
+
+def getviewshedcache():
+    """
+    Gets process-wide viewshed cache, creating it using limits from settings if necessary
+    """
+
+    global VIEWSHED_CACHE
+
+    if VIEWSHED_CACHE is not None: return VIEWSHED_CACHE
+
+    with VIEWSHED_CACHE_LOCK:
+        if VIEWSHED_CACHE is None:
+            VIEWSHED_CACHE = ViewshedCache( getattr(settings, 'VIEWSHED_CACHE_DISK_FOLDER', VIEWSHED_CACHE_DISK_FOLDER), \
+                                            getattr(settings, 'VIEWSHED_CACHE_MEMORY_MAXBYTES', VIEWSHED_CACHE_MEMORY_MAXBYTES), \
+                                            getattr(settings, 'VIEWSHED_CACHE_DISK_MAXBYTES', VIEWSHED_CACHE_DISK_MAXBYTES), \
+                                            TERRAIN_FILE)
+        return VIEWSHED_CACHE
+
+def getprecomputedviewshedstore():
+    """
+    Gets process-wide store of precomputed viewsheds
+    Store is disk-only and never pruned - entries are only removed when terrain changes
+    """
+
+    global VIEWSHED_PRECOMPUTED_STORE
+
+    if VIEWSHED_PRECOMPUTED_STORE is not None: return VIEWSHED_PRECOMPUTED_STORE
+
+    with VIEWSHED_CACHE_LOCK:
+        if VIEWSHED_PRECOMPUTED_STORE is None:
+            VIEWSHED_PRECOMPUTED_STORE = ViewshedCache( getattr(settings, 'VIEWSHED_PRECOMPUTED_FOLDER', VIEWSHED_PRECOMPUTED_FOLDER), \
+                                                        0, \
+                                                        None, \
+                                                        TERRAIN_FILE)
+        return VIEWSHED_PRECOMPUTED_STORE
@@ -0,0 +1,210 @@
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+from .terrainsampler import getterrainsampler
+from .viewshed import GetViewshedContent, generateviewshedfeatures, generatecumulativefeatures, streamfeatures, VIEWSHED_ENGINE_DEFAULT, VIEWSHED_POLYGONIZE_DEFAULT, VIEWSHED_TERRAIN_DEFAULT
+from .viewshedcache import getprecomputedviewshedstore
+
+# Default executor limits - can be overridden in settings
+VIEWSHED_WORKERS                    = 2
+VIEWSHED_QUEUE_SIZE                 = 8
+# Seconds request waits for computation before returning busy response - computation carries on and is cached for retry
+VIEWSHED_TIMEOUT                    = 10
+VIEWSHED_RETRY_AFTER                = 5
+
+# Maximum number of background computations, eg. precomputing voted viewsheds, running at once
+# Background computations are only started while some worker is idle and never count against queue size
+VIEWSHED_BACKGROUND_SIZE            = 1
+
+# Process-wide viewshed executor
+VIEWSHED_EXECUTOR                   = None
+VIEWSHED_EXECUTOR_LOCK              = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class ViewshedQueueFull(Exception):
+    """
+    Raised when viewshed executor already has maximum number of computations queued or running
+    """
+
+    pass
+
+
+def initialiseviewshedworker():
+    """
+    Preloads terrain dataset when worker process starts so first request doesn't pay for opening it
+    """
+
+    getterrainsampler()
+
+def computeviewshedcontent(lon, lat, hubheight, bladeradius, engine, polygonizer, zoom, terrain=VIEWSHED_TERRAIN_DEFAULT):
+    """
+    Computes viewshed in worker process and returns it as serialised GeoJSON FeatureCollection
+    """
+
+    return GetViewshedContent(lon, lat, hubheight, bladeradius, engine, polygonizer, zoom, terrain)
+
+def computeviewshedfeatures(lon, lat, hubheight, bladeradius, engine, polygonizer, zoom, terrain=VIEWSHED_TERRAIN_DEFAULT):
+    """
+    Computes viewshed in worker process and returns list of serialised viewshed features without distance circles
+    Distance circles are cheap so request thread adds them itself, letting it send them before viewshed is ready
+    """
+
+    return list(generateviewshedfeatures(lon, lat, hubheight, bladeradius, engine, polygonizer, zoom, terrain))
+
+def computecumulativeviewshed(turbine_contents, lat, polygonizer, zoom):
+    """
+    Computes cumulative visibility of several turbines in worker process from their serialised viewsheds
+    Returns serialised cumulative features joined ready for inclusion in features array
+    """
+
+    return b''.join(streamfeatures([generatecumulativefeatures(turbine_contents, lat, polygonizer, zoom)]))
+
+def precomputeviewshed(key, lon, lat, hubheight, bladeradius):
+    """
+    Computes default viewshed for turbine position and saves it in precomputed viewshed store under key
+    """
+
+    precomputed_store = getprecomputedviewshedstore()
+    if precomputed_store.has(key): return False
+    content = computeviewshedcontent(lon, lat, hubheight, bladeradius, VIEWSHED_ENGINE_DEFAULT, VIEWSHED_POLYGONIZE_DEFAULT, None)
+    precomputed_store.set(key, content)
+    return True
+
+
+class ViewshedExecutor:
+    """
+    Runs viewshed computations on pool of worker processes, keeping them off request threads
+    - Number of queued or running computations is bounded and submit raises ViewshedQueueFull beyond that
+    - Background computations have their own smaller limit so they never take queue space from requests
+    - Identical in-flight requests share single computation
+    - Result is passed to completion callback of computation, eg. to cache it, whether or not any request is still waiting
+      Callbacks run on their own thread so slow callback, eg. writing to disk, doesn't hold up results of other computations
+    """
+
+    def __init__(self, workers, queue_size, background_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.background_size = background_size
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.oncomplete = {}
+        self.background = set()
+        self.pool = None
+        self.callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix='viewshed-callback')
+
+    def getpool(self):
+        """
+        Gets process pool, creating it if necessary
+        forkserver avoids forking request threads and open GDAL handles into workers
+        """
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, \
+                                            mp_context=multiprocessing.get_context('forkserver'), \
+                                            initializer=initialiseviewshedworker)
+        return self.pool
+
+    def submit(self, key, function, *args, oncomplete=None, background=False):
+        """
+        Submits computation for key, returning (future, created)
+        If computation for same key is already in flight its future is returned with created = False
+        oncomplete is called with result of successful computation before it is removed from in-flight computations,
+        including when computation is shared with earlier submission, so submissions can store same result differently
+        Background computations are only submitted while fewer computations than workers are in flight
+        """
+
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                if oncomplete is not None: self.oncomplete[key].append(oncomplete)
+                return future, False
+            if background:
+                if (len(self.inflight) >= self.workers) or (len(self.background) >= self.background_size): raise ViewshedQueueFull()
+            elif (len(self.inflight) - len(self.background)) >= self.queue_size: raise ViewshedQueueFull()
+
+            try:
+                future = self.getpool().submit(function, *args)
+            except BrokenProcessPool:
+                # Worker died, eg. killed for using too much memory, so start fresh pool
+                self.pool = None
+                future = self.getpool().submit(function, *args)
+
+            self.inflight[key] = future
+            self.oncomplete[key] = [] if oncomplete is None else [oncomplete]
+            if background: self.background.add(key)
+
+        future.add_done_callback(lambda completed_future: self.complete(key, completed_future))
+        return future, True
+
+    def complete(self, key, future):
+        """
+        Hands result of completed computation to completion callback thread or, if computation failed, releases it
+        Runs on pool's result handling thread so must not block
+        """
+
+        if (not future.cancelled()) and (future.exception() is None):
+            self.callbacks.submit(self.callback, key, future)
+        else:
+            with self.lock: self.release(key, future)
+
+    def callback(self, key, future):
+        """
+        Passes result of completed computation to its completion callbacks then releases it
+        Result is handled first so identical request arriving meanwhile finds either computation or its result
+        Callbacks added by submissions that arrive while callbacks run are called before computation is released
+        """
+
+        while True:
+            with self.lock:
+                oncompletes = self.oncomplete.get(key)
+                if not oncompletes:
+                    self.release(key, future)
+                    return
+                self.oncomplete[key] = []
+
+            for oncomplete in oncompletes:
+                try:
+                    oncomplete(future.result())
+                except Exception:
+                    logger.exception("Viewshed completion callback failed for " + str(key))
+
+    def release(self, key, future):
+        """
+        Removes completed computation from in-flight computations - must be called holding lock
+        """
+
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+            del self.oncomplete[key]
+            self.background.discard(key)
+
+    def stats(self):
+        """
+        Gets current load of executor
+        """
+
+        with self.lock:
+            return {'workers': self.workers, 'queue_size': self.queue_size, 'inflight': len(self.inflight), 'background': len(self.background)}
+
+
+def getviewshedexecutor():
+    """
+    Gets process-wide viewshed executor, creating it using limits from settings if necessary
+    """
+
+    global VIEWSHED_EXECUTOR
+
+    if VIEWSHED_EXECUTOR is not None: return VIEWSHED_EXECUTOR
+
+    with VIEWSHED_EXECUTOR_LOCK:
+        if VIEWSHED_EXECUTOR is None:
+            VIEWSHED_EXECUTOR = ViewshedExecutor(   getattr(settings, 'VIEWSHED_WORKERS', VIEWSHED_WORKERS), \
+                                                    getattr(settings, 'VIEWSHED_QUEUE_SIZE', VIEWSHED_QUEUE_SIZE), \
+                                                    getattr(settings, 'VIEWSHED_BACKGROUND_SIZE', VIEWSHED_BACKGROUND_SIZE))
+        return VIEWSHED_EXECUTOR
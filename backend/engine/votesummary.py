@@ -0,0 +1,196 @@
+import zlib
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q, F, BooleanField, OuterRef, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .models import Vote, VoteSummary, Boundary
+
+# Leaderboard order of turbine positions - primary key breaks ties so every position has unique place for keyset pagination
+# Vote counts are negated so whole key is ascending, letting cursor be single row comparison on votesummary_leaderboard
+# index - ordering and comparison must match index expressions exactly for index to be used
+LEADERBOARD_ORDERING                = (F('votes_total') * -1, F('votes_confirmed') * -1, F('first_vote'), F('id'))
+LEADERBOARD_KEY_SQL                 = "(votes_total * -1, votes_confirmed * -1, first_vote, id)"
+
+# Maximum number of vote summaries resolved by each area update, eg. when rebuilding all summaries
+VOTE_AREA_BATCH_SIZE                = 1000
+
+# Seconds number of leaderboard positions is cached for in each worker process
+LEADERBOARD_COUNT_TTL               = 10
+
+# Process-wide cached number of leaderboard positions as (expiry time, count)
+LEADERBOARD_COUNT                   = (0, None)
+LEADERBOARD_COUNT_LOCK              = threading.Lock()
+
+
+def getvotesummarylockkey(geometry):
+    """
+    Gets advisory lock key for turbine position so concurrent refreshes of same position run one at a time
+    """
+
+    return zlib.crc32(geometry.wkb)
+
+def resolvevoteareas(summaries):
+    """
+    Resolves and stores area of any vote summaries whose area hasn't been resolved
+    Area is name of county-level boundary containing turbine position, or '' if there isn't one
+    All unresolved summaries are resolved together in single update joining simplified boundaries
+    """
+
+    unresolved = {summary.pk: summary for summary in summaries if summary.area is None}
+    boundaries = Boundary.objects.filter(level__in=[5, 6]).filter(simplified_geometry__contains=OuterRef('geometry')).values('name')[:1]
+
+    pks = list(unresolved.keys())
+    for start in range(0, len(pks), VOTE_AREA_BATCH_SIZE):
+        batch = pks[start:(start + VOTE_AREA_BATCH_SIZE)]
+        VoteSummary.objects.filter(pk__in=batch, area__isnull=True).update(area=Coalesce(Subquery(boundaries), Value('')))
+        for pk, area in VoteSummary.objects.filter(pk__in=batch).values_list('pk', 'area'): unresolved[pk].area = area
+
+def refreshvotesummaries(geometries):
+    """
+    Recalculates vote summaries of turbine positions from their live votes, removing summaries of positions without live votes
+    Should be called with positions of all votes whose live or confirmed state has changed, once changes have been saved
+    Each position is recounted under advisory lock so last refresh of position always sees all committed votes
+    """
+
+    keys, created_summaries = set(), []
+    for geometry in geometries:
+        if geometry is None: continue
+        key = (geometry.coords[0], geometry.coords[1])
+        if key in keys: continue
+        keys.add(key)
+
+        with transaction.atomic():
+            with connection.cursor() as cursor: cursor.execute("SELECT pg_advisory_xact_lock(%s)", [getvotesummarylockkey(geometry)])
+
+            counts = Vote.objects.filter(live=True).filter(geometry=geometry).aggregate( \
+                        votes_total=Count('id'), \
+                        votes_confirmed=Count('id', filter=Q(confirmed=True)), \
+                        votes_unconfirmed=Count('id', filter=Q(confirmed=False)), \
+                        first_vote=Min('created'))
+
+            if counts['votes_total'] == 0:
+                VoteSummary.objects.filter(geometry=geometry).delete()
+            else:
+                summary, created = VoteSummary.objects.update_or_create(geometry=geometry, defaults=counts)
+                if created: created_summaries.append(summary)
+
+    # Area of position never changes so is only resolved, outside lock, when position gets its first live vote
+    resolvevoteareas(created_summaries)
+    clearleaderboardcount()
+
+def rebuildvotesummaries():
+    """
+    Rebuilds all vote summaries from live votes in single aggregate query, returning number of turbine positions
+    """
+
+    counts = (
+        Vote.objects
+        .filter(live=True)
+        .exclude(geometry__isnull=True)
+        .values('geometry')
+        .annotate(
+            votes_total=Count('id'),
+            votes_confirmed=Count('id', filter=Q(confirmed=True)),
+            votes_unconfirmed=Count('id', filter=Q(confirmed=False)),
+            first_vote=Min('created'),
+        )
+        .order_by('first_vote')
+    )
+
+    with transaction.atomic():
+        # Block refreshes from writing summaries until rebuild commits so they can't leave duplicate or stale summaries
+        # Refreshes waiting on lock then write counts of votes committed since rebuild counted them
+        with connection.cursor() as cursor: cursor.execute("LOCK TABLE " + VoteSummary._meta.db_table + " IN EXCLUSIVE MODE")
+
+        # Keep areas already resolved so only new positions need boundary lookups
+        areas = {(geometry.coords[0], geometry.coords[1]): area for geometry, area in VoteSummary.objects.exclude(area__isnull=True).values_list('geometry', 'area')}
+        summaries = []
+        for count in counts:
+            summary = VoteSummary(**count)
+            summary.area = areas.get((summary.geometry.coords[0], summary.geometry.coords[1]))
+            summaries.append(summary)
+
+        VoteSummary.objects.all().delete()
+        VoteSummary.objects.bulk_create(summaries, batch_size=1000)
+
+    # Areas of new positions are resolved once lock is released
+    resolvevoteareas(summaries)
+    clearleaderboardcount()
+
+    return VoteSummary.objects.count()
+
+def clearleaderboardcount():
+    """
+    Clears this process's cached number of leaderboard positions
+    """
+
+    global LEADERBOARD_COUNT
+
+    with LEADERBOARD_COUNT_LOCK: LEADERBOARD_COUNT = (0, None)
+
+def getleaderboardcount():
+    """
+    Gets number of turbine positions on leaderboard, cached for LEADERBOARD_COUNT_TTL seconds
+    Cache is cleared when this process changes summaries so other processes lag by at most LEADERBOARD_COUNT_TTL
+    """
+
+    global LEADERBOARD_COUNT
+
+    expiry, count = LEADERBOARD_COUNT
+    if (count is not None) and (time.monotonic() < expiry): return count
+
+    count = VoteSummary.objects.count()
+    with LEADERBOARD_COUNT_LOCK: LEADERBOARD_COUNT = (time.monotonic() + LEADERBOARD_COUNT_TTL, count)
+    return count
+
+def encodeleaderboardcursor(summary, position):
+    """
+    Gets opaque cursor for leaderboard page following summary, which is at 1-based position
+    """
+
+    cursor = [summary.votes_total, summary.votes_confirmed, summary.first_vote.isoformat(), summary.pk, position]
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+def decodeleaderboardcursor(cursor):
+    """
+    Gets (votes_total, votes_confirmed, first_vote, pk, position) from cursor, raising ValueError if cursor is invalid
+    """
+
+    try:
+        votes_total, votes_confirmed, first_vote, pk, position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return int(votes_total), int(votes_confirmed), datetime.fromisoformat(first_vote), int(pk), int(position)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise ValueError("Invalid leaderboard cursor")
+
+def getleaderboardpage(pagesize, cursor=None, page=0):
+    """
+    Gets (summaries, position of first summary, cursor of next page or None) for leaderboard page
+    With cursor, page starts directly after cursor's summary using leaderboard index rather than skipping earlier rows
+    Without cursor, 0-based page number is used
+    """
+
+    summaries = VoteSummary.objects.order_by(*LEADERBOARD_ORDERING)
+
+    if cursor is not None:
+        votes_total, votes_confirmed, first_vote, pk, position = decodeleaderboardcursor(cursor)
+        summaries = summaries.filter(RawSQL(LEADERBOARD_KEY_SQL + " > (%s, %s, %s, %s)", \
+                                            [-votes_total, -votes_confirmed, first_vote, pk], output_field=BooleanField()))
+        position += 1
+    else:
+        summaries = summaries[(page * pagesize):]
+        position = (page * pagesize) + 1
+
+    # Fetch one extra row to find whether there is next page
+    summaries = list(summaries[:(pagesize + 1)])
+    nextcursor = None
+    if len(summaries) > pagesize:
+        summaries = summaries[:pagesize]
+        nextcursor = encodeleaderboardcursor(summaries[-1], position + pagesize - 1)
+
+    return summaries, position, nextcursor
@@ -0,0 +1,207 @@
+import os
+import json
+import threading
+import numpy as np
+import pyproj
+from django.conf import settings
+
+# Default location of wind speed grid snapshot - can be overridden in settings
+# Grid is stored as NumPy array with metadata in JSON file alongside it
+WINDSPEED_GRID_FILE                 = os.path.dirname(os.path.realpath(__file__)) + '/indexes/windspeed-grid.npy'
+
+# NOABL wind speeds are modelled on 1 km British National Grid squares
+WINDSPEED_GRID_SRID                 = 27700
+WINDSPEED_GRID_SRS                  = 'EPSG:' + str(WINDSPEED_GRID_SRID)
+WINDSPEED_GRID_RESOLUTION           = 1000
+
+# Precision of returned wind speeds, matching WindSpeed database lookup
+WINDSPEED_PRECISION                 = 2
+
+# Maximum number of grid cells returned for bounding box
+WINDSPEED_GRID_BOUNDS_MAXCELLS      = 10000
+
+# Number of points along each side of bounding box transformed to grid to find its extent
+WINDSPEED_GRID_BOUNDS_DENSIFY       = 21
+
+# Process-wide wind speed grid
+WINDSPEED_GRID                      = None
+WINDSPEED_GRID_LOCK                 = threading.Lock()
+
+
+def getwindspeedgridmetadatafile(grid_file):
+    """
+    Gets location of metadata file of wind speed grid
+    """
+
+    return grid_file.replace('.npy', '.json')
+
+
+class WindSpeedGrid:
+    """
+    Wind speeds on regular grid, memory-mapped from snapshot file so all worker processes share same pages
+    Row 0 is northernmost row and cells without wind speed are NaN
+    Point lookups transform position to grid and index array directly without database
+    """
+
+    def __init__(self, grid_file):
+        self.grid_file = grid_file
+        self.mtime = os.stat(grid_file).st_mtime_ns
+        self.values = np.load(grid_file, mmap_mode='r')
+        with open(getwindspeedgridmetadatafile(grid_file), 'r') as metadata_fp: metadata = json.load(metadata_fp)
+        self.left, self.top, self.resolution = metadata['left'], metadata['top'], metadata['resolution']
+        self.rows, self.columns = self.values.shape
+        self.to_grid = pyproj.Transformer.from_crs('EPSG:4326', metadata['srs'], always_xy=True)
+        self.from_grid = pyproj.Transformer.from_crs(metadata['srs'], 'EPSG:4326', always_xy=True)
+
+    def getcells(self, longitudes, latitudes):
+        """
+        Gets (rows, columns) of cells containing positions, with -1 for positions outside grid
+        """
+
+        x, y = self.to_grid.transform(np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64))
+        columns = np.floor((np.asarray(x) - self.left) / self.resolution)
+        rows = np.floor((self.top - np.asarray(y)) / self.resolution)
+        outside = ~np.isfinite(rows) | ~np.isfinite(columns) | (rows < 0) | (rows >= self.rows) | (columns < 0) | (columns >= self.columns)
+        rows[outside], columns[outside] = -1, -1
+        return rows.astype(np.int64), columns.astype(np.int64)
+
+    def getvalues(self, rows, columns):
+        """
+        Gets list of rounded wind speeds for cells, with None for cells outside grid or without wind speed
+        """
+
+        values = np.full(len(rows), np.nan, dtype=np.float64)
+        inside = rows >= 0
+        values[inside] = self.values[rows[inside], columns[inside]]
+        return [None if np.isnan(value) else round(float(value), WINDSPEED_PRECISION) for value in values]
+
+    def get(self, longitude, latitude):
+        """
+        Gets wind speed at position, or None
+        """
+
+        return self.getmany([longitude], [latitude])[0]
+
+    def getmany(self, longitudes, latitudes):
+        """
+        Gets list of wind speeds at positions, with None for positions without wind speed
+        """
+
+        return self.getvalues(*self.getcells(longitudes, latitudes))
+
+    def getbounds(self, west, south, east, north):
+        """
+        Gets list of (longitude, latitude, windspeed) for centres of all cells with wind speed within bounding box
+        Returns None if bounding box covers more than WINDSPEED_GRID_BOUNDS_MAXCELLS cells
+        """
+
+        # Bounding box edges aren't straight lines on grid so transform points along all sides
+        steps = np.linspace(0, 1, WINDSPEED_GRID_BOUNDS_DENSIFY)
+        edge_longitudes = np.concatenate([west + steps * (east - west), west + steps * (east - west), np.full(len(steps), west), np.full(len(steps), east)])
+        edge_latitudes = np.concatenate([np.full(len(steps), south), np.full(len(steps), north), south + steps * (north - south), south + steps * (north - south)])
+        edge_x, edge_y = self.to_grid.transform(edge_longitudes, edge_latitudes)
+
+        column_start = max(0, int(np.floor((np.min(edge_x) - self.left) / self.resolution)))
+        column_end = min(self.columns, int(np.floor((np.max(edge_x) - self.left) / self.resolution)) + 1)
+        row_start = max(0, int(np.floor((self.top - np.max(edge_y)) / self.resolution)))
+        row_end = min(self.rows, int(np.floor((self.top - np.min(edge_y)) / self.resolution)) + 1)
+        if (column_end <= column_start) or (row_end <= row_start): return []
+        if (column_end - column_start) * (row_end - row_start) > WINDSPEED_GRID_BOUNDS_MAXCELLS: return None
+
+        values = np.asarray(self.values[row_start:row_end, column_start:column_end])
+        rows, columns = np.nonzero(~np.isnan(values))
+        centre_x = self.left + (column_start + columns + 0.5) * self.resolution
+        centre_y = self.top - (row_start + rows + 0.5) * self.resolution
+        longitudes, latitudes = self.from_grid.transform(centre_x, centre_y)
+        longitudes, latitudes = np.asarray(longitudes), np.asarray(latitudes)
+        inside = (longitudes >= west) & (longitudes <= east) & (latitudes >= south) & (latitudes <= north)
+
+        return [(float(longitude), float(latitude), round(float(value), WINDSPEED_PRECISION)) \
+                for longitude, latitude, value in zip(longitudes[inside], latitudes[inside], values[rows[inside], columns[inside]])]
+
+
+def getwindspeedgridfile():
+    """
+    Gets location of wind speed grid snapshot file
+    """
+
+    return getattr(settings, 'WINDSPEED_GRID_FILE', WINDSPEED_GRID_FILE)
+
+def buildwindspeedgrid(grid_file=None):
+    """
+    Builds wind speed grid snapshot by rasterising WindSpeed table, returning number of cells with wind speed
+    Each cell takes wind speed of polygon containing its centre
+    Grid and metadata are written to temporary files and moved into place so running workers never see partial grid
+    """
+
+    from osgeo import gdal, ogr, osr
+    from .models import WindSpeed
+
+    if grid_file is None: grid_file = getwindspeedgridfile()
+
+    srs = osr.SpatialReference()
+    srs.SetFromUserInput(WINDSPEED_GRID_SRS)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    source_ds = ogr.GetDriverByName('Memory').CreateDataSource('windspeeds')
+    source_layer = source_ds.CreateLayer('windspeeds', srs, ogr.wkbMultiPolygon)
+    source_layer.CreateField(ogr.FieldDefn('windspeed', ogr.OFTReal))
+    for windspeed in WindSpeed.objects.all().iterator(chunk_size=2000):
+        feature = ogr.Feature(source_layer.GetLayerDefn())
+        feature.SetField('windspeed', windspeed.windspeed)
+        feature.SetGeometry(ogr.CreateGeometryFromWkb(bytes(windspeed.geometry.transform(WINDSPEED_GRID_SRID, clone=True).wkb)))
+        source_layer.CreateFeature(feature)
+        feature = None
+
+    if source_layer.GetFeatureCount() == 0: return 0
+
+    # Snap grid to multiples of resolution so cells line up with source squares
+    xmin, xmax, ymin, ymax = source_layer.GetExtent()
+    resolution = WINDSPEED_GRID_RESOLUTION
+    left, top = resolution * np.floor(xmin / resolution), resolution * np.ceil(ymax / resolution)
+    columns, rows = int(np.ceil((xmax - left) / resolution)), int(np.ceil((top - ymin) / resolution))
+
+    grid_ds = gdal.GetDriverByName('MEM').Create('', columns, rows, 1, gdal.GDT_Float32)
+    grid_ds.SetGeoTransform((left, resolution, 0, top, 0, -resolution))
+    grid_ds.SetProjection(srs.ExportToWkt())
+    grid_ds.GetRasterBand(1).Fill(np.nan)
+    gdal.RasterizeLayer(grid_ds, [1], source_layer, options=['ATTRIBUTE=windspeed'])
+    values = grid_ds.GetRasterBand(1).ReadAsArray().astype(np.float32)
+    grid_ds, source_ds = None, None
+
+    metadata = {'srs': WINDSPEED_GRID_SRS, 'left': float(left), 'top': float(top), 'resolution': resolution}
+
+    # Write metadata first so any worker reloading new grid file finds matching metadata
+    os.makedirs(os.path.dirname(grid_file), exist_ok=True)
+    metadata_file = getwindspeedgridmetadatafile(grid_file)
+    temp_metadata_file = metadata_file + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_metadata_file, 'w') as metadata_fp: json.dump(metadata, metadata_fp)
+    os.replace(temp_metadata_file, metadata_file)
+
+    temp_file = grid_file + '.' + str(os.getpid()) + '.tmp.npy'
+    np.save(temp_file, values)
+    os.replace(temp_file, grid_file)
+
+    return int(np.count_nonzero(~np.isnan(values)))
+
+def getwindspeedgrid():
+    """
+    Gets process-wide wind speed grid, loading it if necessary
+    Grid is reloaded when snapshot file is rebuilt and None is returned if it hasn't been built
+    """
+
+    global WINDSPEED_GRID
+
+    grid_file = getwindspeedgridfile()
+    try:
+        mtime = os.stat(grid_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    windspeed_grid = WINDSPEED_GRID
+    if (windspeed_grid is not None) and (windspeed_grid.grid_file == grid_file) and (windspeed_grid.mtime == mtime): return windspeed_grid
+
+    with WINDSPEED_GRID_LOCK:
+        if (WINDSPEED_GRID is None) or (WINDSPEED_GRID.grid_file != grid_file) or (WINDSPEED_GRID.mtime != mtime):
+            WINDSPEED_GRID = WindSpeedGrid(grid_file)
+        return WINDSPEED_GRID
@@ -64,6 +64,65 @@ CORS_ALLOW_CREDENTIALS = True
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50 MB, adjust as needed
 
+# Snapshot of in-process postcode prefix index - rebuild with engine/buildindexes.py
+POSTCODE_INDEX_FILE = os.environ.get("POSTCODE_INDEX_FILE", os.path.join(BASE_DIR, 'engine', 'indexes', 'postcode-index.npy'))
+
+# Snapshot of in-process place, boundary and organisation suggestion index - rebuild with engine/buildindexes.py
+SUGGESTION_INDEX_FILE = os.environ.get("SUGGESTION_INDEX_FILE", os.path.join(BASE_DIR, 'engine', 'indexes', 'suggestion-index.json.gz'))
+
+# Snapshot of in-process boundary index used by ContainingBoundaries - rebuild with engine/buildindexes.py
+BOUNDARY_INDEX_FILE = os.environ.get("BOUNDARY_INDEX_FILE", os.path.join(BASE_DIR, 'engine', 'indexes', 'boundary-index.json.gz'))
+
+# Snapshot of in-process wind speed grid - rebuild with engine/buildindexes.py
+WINDSPEED_GRID_FILE = os.environ.get("WINDSPEED_GRID_FILE", os.path.join(BASE_DIR, 'engine', 'indexes', 'windspeed-grid.npy'))
+
+# Fuzzy location search - minimum pg_trgm word similarity and total time budget in seconds
+LOCATION_SEARCH_FUZZY_THRESHOLD = float(os.environ.get("LOCATION_SEARCH_FUZZY_THRESHOLD", 0.5))
+LOCATION_SEARCH_FUZZY_BUDGET = float(os.environ.get("LOCATION_SEARCH_FUZZY_BUDGET", 0.25))
+
+# Response cache for read-mostly endpoints - RESPONSE_CACHE_BACKEND selects 'locmem' (per worker process),
+# 'file' (shared between workers on same host) or 'redis' (shared between hosts, requires redis package)
+# Cached responses are invalidated by data version bumped whenever setup.py reimports data
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "locmem")
+RESPONSE_CACHE_BACKENDS = {
+    'locmem': { 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', \
+                'LOCATION': 'votewind-responses', \
+                'OPTIONS': {'MAX_ENTRIES': 20000}},
+    'file':   { 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', \
+                'LOCATION': os.environ.get("RESPONSE_CACHE_FOLDER", os.path.join(BASE_DIR, 'engine', 'response-cache')), \
+                'OPTIONS': {'MAX_ENTRIES': 200000}},
+    'redis':  { 'BACKEND': 'django.core.cache.backends.redis.RedisCache', \
+                'LOCATION': os.environ.get("RESPONSE_CACHE_REDIS_URL", "redis://127.0.0.1:6379/1")},
+}
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': RESPONSE_CACHE_BACKENDS[RESPONSE_CACHE_BACKEND],
+}
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", 7 * 24 * 60 * 60))
+RESPONSE_CACHE_VERSION_FILE = os.environ.get("RESPONSE_CACHE_VERSION_FILE", os.path.join(BASE_DIR, 'engine', 'indexes', 'data-version.txt'))
+
+# Cache of verified cookie user ids - always held per worker process for USER_CACHE_TIMEOUT seconds
+# USER_CACHE_BACKEND can also select 'file' or 'redis' from RESPONSE_CACHE_BACKENDS so workers share verified user ids
+USER_CACHE_BACKEND = os.environ.get("USER_CACHE_BACKEND", "")
+if USER_CACHE_BACKEND != "": CACHES['users'] = RESPONSE_CACHE_BACKENDS[USER_CACHE_BACKEND]
+USER_CACHE_TIMEOUT = int(os.environ.get("USER_CACHE_TIMEOUT", 60 * 60))
+
+# Viewshed cache - in-memory LRU per worker plus shared on-disk store of compressed GeoJSON
+VIEWSHED_CACHE_MEMORY_MAXBYTES = int(os.environ.get("VIEWSHED_CACHE_MEMORY_MAXBYTES", 64 * 1024 * 1024))
+VIEWSHED_CACHE_DISK_MAXBYTES = int(os.environ.get("VIEWSHED_CACHE_DISK_MAXBYTES", 2 * 1024 * 1024 * 1024))
+VIEWSHED_CACHE_DISK_FOLDER = os.environ.get("VIEWSHED_CACHE_DISK_FOLDER", os.path.join(BASE_DIR, 'engine', 'viewshed-cache'))
+
+# Viewsheds precomputed for voted turbine positions - see engine/precomputeviewsheds.py
+VIEWSHED_PRECOMPUTED_FOLDER = os.environ.get("VIEWSHED_PRECOMPUTED_FOLDER", os.path.join(BASE_DIR, 'engine', 'viewshed-precomputed'))
+
+# Viewshed worker processes - requests beyond queue size, or waiting longer than timeout, get 503 with Retry-After
+# Computations carry on after request times out and are cached so retry gets result
+VIEWSHED_WORKERS = int(os.environ.get("VIEWSHED_WORKERS", 2))
+VIEWSHED_QUEUE_SIZE = int(os.environ.get("VIEWSHED_QUEUE_SIZE", 8))
+VIEWSHED_BACKGROUND_SIZE = int(os.environ.get("VIEWSHED_BACKGROUND_SIZE", 1))
+VIEWSHED_TIMEOUT = int(os.environ.get("VIEWSHED_TIMEOUT", 10))
+VIEWSHED_RETRY_AFTER = int(os.environ.get("VIEWSHED_RETRY_AFTER", 5))
+
 LEAFLET_CONFIG = {
     'DEFAULT_CENTER': (-0.0850, 50.8222),
     'DEFAULT_ZOOM': 16,
@@ -79,6 +138,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'engine',
     'leaflet',
@@ -181,3 +241,13 @@ EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL")
+
+# Queued email sending - see engine/sendemails.py
+# EMAIL_OUTBOX_BACKEND can be set to eg. 'django.core.mail.backends.locmem.EmailBackend' to test without sending
+# EMAIL_OUTBOX_RATE is maximum emails sent per second, 0 for no limit
+# EMAIL_OUTBOX_LEASE is seconds claimed emails are held by one sender before they can be retried by another
+EMAIL_OUTBOX_BACKEND = os.environ.get("EMAIL_OUTBOX_BACKEND", EMAIL_BACKEND)
+EMAIL_OUTBOX_RATE = float(os.environ.get("EMAIL_OUTBOX_RATE", 10))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 8))
+EMAIL_OUTBOX_LEASE = int(os.environ.get("EMAIL_OUTBOX_LEASE", 10 * 60))
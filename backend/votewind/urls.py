@@ -97,11 +97,15 @@ urlpatterns = [
     path('api/vote', views.SubmitVote, name='vote'),
     path('api/leaderboard', views.Leaderboard, name='leaderboard'),
     path('api/windspeed', views.GetWindSpeed, name='windspeed'),
+    path('api/windspeeds', views.GetWindSpeeds, name='windspeeds'),
     path('api/substation', views.GetSubstation, name='substation'),
     path('api/viewshed', views.Viewshed, name='viewshed'),
+    path('api/viewshedbatch', views.ViewshedBatch, name='viewshedbatch'),
     path('api/containingboundaries', views.ContainingBoundaries, name='containingboundaries'),
+    path('api/cachestats', views.CacheStats, name='cachestats'),
     path('api/cesium-jit', views.CesiumJIT, name='cesiumjit'),
     path('votes', views.Votes, name='votes'),
+    path('votes/<int:z>/<int:x>/<int:y>.pbf', views.VoteTiles, name='votetiles'),
     path('organisations', views.Organisations, name='organisations'),
     path('communityenergygroups', views.CommunityEnergyGroups, name='communityenergygroups'),
     re_path(r'^api/confirmvote/(?P<uidb64>[0-9A-Za-z_\-]+)/(?P<token>[0-9a-f]{1,32})/$', views.ConfirmVote, name='confirmvote'),
@@ -278,6 +278,7 @@ sudo service postgresql restart | tee -a /usr/src/votewind/log.txt
 #sudo -u postgres createdb -O votewind votewind | tee -a /usr/src/votewind/log.txt
 #sudo -u postgres psql -d votewind -c 'CREATE EXTENSION postgis;' | tee -a /usr/src/votewind/log.txt
 #sudo -u postgres psql -d votewind -c 'CREATE EXTENSION postgis_raster;' | tee -a /usr/src/votewind/log.txt
+#sudo -u postgres psql -d votewind -c 'CREATE EXTENSION pg_trgm;' | tee -a /usr/src/votewind/log.txt
 #sudo -u postgres psql -d votewind -c 'GRANT ALL PRIVILEGES ON DATABASE votewind TO votewind;' | tee -a /usr/src/votewind/log.txt
 
 